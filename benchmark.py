@@ -0,0 +1,454 @@
+import argparse
+import json
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from multiprocessing import Pool
+from Queue import Queue
+from timeit import default_timer as timer
+
+from driver.examples import genome, gettysburg, rosalind, tubthumping
+from driver.solvers import bwt_solver, rosalind_solver
+from driver.solvers.base import assemble
+from driver.solvers.base import layout
+from driver.util.fm_index import find_intervals
+from driver.util.fm_index import FMIndex
+from driver.util.fm_index import ReadLibrary
+from driver.util.graph import StringGraph
+from driver.util.stats import Stats
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+'''
+A benchmark suite that times each phase of an assembly separately.
+
+Every case samples a seeded read set from one of the driver.examples
+generators, so repeated runs assemble exactly the same reads. The phases
+timed are the suffix array, the BWT and rank structures, overlap detection,
+layout and consensus, using a wall clock, along with the counters recorded
+by driver.util.stats. Every other phase recorded, such as removing
+contained reads or building the graph, is added up as other, and the total
+is the wall time of the whole assembly. Each case runs in a fresh worker
+process, whose peak resident memory is recorded as well.
+
+Results are written as JSON, along with the version of the code and the
+environment they were measured in, so that runs of different versions can
+be compared. Run with `python benchmark.py --help` for the options.
+
+With --compare, a set of seeded comparisons is run instead, each timing a
+structure against the simpler one it replaced: less-than rank queries
+summed per symbol against cumulative checkpoints, the queue-based layout
+walk against base.layout, and single against batched backward searches.
+'''
+
+
+EXAMPLES = {
+    'genome': genome.get_reads,
+    'gettysburg': gettysburg.get_reads,
+    'rosalind': rosalind.get_reads,
+    'tubthumping': tubthumping.get_reads,
+}
+
+PHASES = [
+    'suffix_array', 'bwt_rank', 'overlap', 'layout', 'consensus', 'other']
+
+# The phases recorded by Stats that make up each of PHASES
+PHASE_PARTS = {
+    'suffix_array': ['suffix_array'],
+    'bwt_rank': ['bwt', 'lex_rank', 'occurrences'],
+    'overlap': ['overlap'],
+    'layout': ['layout'],
+    'consensus': ['consensus'],
+}
+
+# The examples run by main.py, and a DNA genome
+DEFAULT_CASES = [
+    {'example': 'rosalind', 'solver': 'rosalind'},
+    {'example': 'rosalind', 'solver': 'bwt', 'tau': 100, 'dna': True},
+    {'example': 'gettysburg', 'reads': 1000, 'min_length': 85,
+     'max_length': 100, 'tau': 10},
+    {'example': 'tubthumping', 'reads': 500, 'min_length': 25,
+     'max_length': 50, 'tau': 25},
+    {'example': 'genome', 'reads': 1000, 'min_length': 85,
+     'max_length': 100, 'tau': 30, 'dna': True},
+]
+
+CASE_DEFAULTS = {
+    'solver': 'bwt',
+    'reads': 1000,
+    'min_length': 85,
+    'max_length': 100,
+    'alphabet': 'ACGT',
+    'genome_length': 10000,
+    'tau': 10,
+    'dna': False,
+    'irreducible': False,
+    'both_strands': False,
+    'seed': 0,
+}
+
+# Options that only the genome example takes
+GENOME_OPTIONS = ['alphabet', 'genome_length']
+
+
+def make_case(**options):
+    """Return a complete case, filling in defaults for missing options."""
+    case = dict(CASE_DEFAULTS)
+    case.update(options)
+    if case['example'] not in EXAMPLES:
+        raise ValueError('Unknown example: %s' % case['example'])
+    if case['solver'] not in ('bwt', 'rosalind'):
+        raise ValueError('Unknown solver: %s' % case['solver'])
+    ignored = [name for name in GENOME_OPTIONS if name in options]
+    if ignored and case['example'] != 'genome':
+        raise ValueError('Only the genome example takes %s' % (
+            ', '.join(sorted(ignored))))
+    return case
+
+
+def get_reads(case):
+    """Sample the reads of a case from its example generator."""
+    example = case['example']
+    if example == 'rosalind':
+        return rosalind.get_reads()
+    if example == 'genome':
+        return genome.get_reads(
+            case['reads'], case['min_length'], case['max_length'],
+            alphabet=case['alphabet'], genome_length=case['genome_length'],
+            seed=case['seed'], both_strands=case['both_strands'])
+    return EXAMPLES[example](
+        case['reads'], case['min_length'], case['max_length'],
+        seed=case['seed'])
+
+
+def _phase_times(stats):
+    """
+    Group the phases recorded in stats into PHASES.
+
+    Phases a solver does not have are None, and other is the sum of every
+    recorded phase that is not part of another.
+    """
+    seconds = dict([
+        (name, phase['seconds']) for name, phase in stats.phases.iteritems()])
+    times = {}
+    for phase, parts in PHASE_PARTS.iteritems():
+        if parts[0] in seconds:
+            times[phase] = sum([seconds.pop(part) for part in parts])
+        else:
+            times[phase] = None
+    times['other'] = sum(seconds.itervalues())
+    return times
+
+
+def run_case(case):
+    """
+    Assemble the reads of a case, and return its result.
+
+    The result holds the time of each phase in seconds, with None for the
+    phases a solver does not have, the wall time of the whole assembly, the
+    hot path counters, and the peak resident memory of the process in
+    kilobytes.
+    """
+    reads = get_reads(case)
+    stats = Stats()
+    start = timer()
+    if case['solver'] == 'rosalind':
+        graph = rosalind_solver.build_overlap_graph(reads, stats=stats)
+    else:
+        graph = bwt_solver.build_overlap_graph(
+            reads, tau=case['tau'], dna=case['dna'],
+            irreducible=case['irreducible'], stats=stats,
+            both_strands=case['both_strands'])
+    contig = assemble(graph, stats=stats)
+    total = timer() - start
+    times = _phase_times(stats)
+    # Each phase resets the process high-water mark, so take the highest
+    # of the phase peaks as well
+    peak_rss_kb = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        stats.peak_rss_kb)
+
+    return {
+        'case': case,
+        'reads': len(reads),
+        'bases': sum([len(read) for read in reads]),
+        'contig_length': len(contig),
+        'phases': times,
+        'total': total,
+        'counters': dict(stats.counters),
+        'peak_rss_kb': peak_rss_kb,
+    }
+
+
+def _best(results):
+    """Merge repeated results of a case, keeping the fastest of each phase."""
+    best = dict(results[0])
+    best['phases'] = dict([
+        (phase, None if results[0]['phases'][phase] is None else min([
+            result['phases'][phase] for result in results]))
+        for phase in PHASES])
+    best['total'] = min([result['total'] for result in results])
+    best['peak_rss_kb'] = max([result['peak_rss_kb'] for result in results])
+    best['repeat'] = len(results)
+    return best
+
+
+def run_suite(cases, repeat=1):
+    """
+    Run every case repeat times, each in a fresh worker process.
+
+    A fresh process per run keeps the peak memory of one case from hiding
+    that of the next. Returns a result per case, with the fastest time of
+    each phase over its runs.
+    """
+    runs = [case for case in cases for _ in xrange(repeat)]
+    pool = Pool(1, maxtasksperchild=1)
+    try:
+        results = pool.map(run_case, runs, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+    return [
+        _best(results[x:x + repeat]) for x in xrange(0, len(results), repeat)]
+
+
+def environment():
+    """Describe the code and the machine that results were measured on."""
+    try:
+        version = subprocess.check_output(
+            ['git', 'describe', '--always', '--dirty'],
+            stderr=open('/dev/null', 'w')).strip()
+    except (OSError, subprocess.CalledProcessError):
+        version = None
+    return {
+        'version': version,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': np.__version__ if np is not None else None,
+    }
+
+
+def print_results(results):
+    print '%-12s %-8s %7s' % ('example', 'solver', 'reads'),
+    print ' '.join(['%12s' % phase for phase in PHASES]),
+    print '%10s %10s' % ('total', 'peak MB')
+    for result in results:
+        case = result['case']
+        print '%-12s %-8s %7i' % (
+            case['example'], case['solver'], result['reads']),
+        print ' '.join([
+            '%12s' % ('-' if t is None else '%.3fs' % t)
+            for t in [result['phases'][phase] for phase in PHASES]]),
+        print '%9.3fs %10.1f' % (
+            result['total'], result['peak_rss_kb'] / 1024.0)
+
+
+class SummingFMIndex(FMIndex):
+    """
+    An FM-index that sums the counts of every smaller symbol for each
+    less-than query, rather than using cumulative checkpoints.
+    """
+
+    def get_occurrences_lt(self, a, i):
+        rank = self.occurrences.rank
+        return sum([rank(c, i) for c in self.alphabet if c < a])
+
+    def _update_forward_backward(self, l, u, ll, uu, a):
+        ll += self.get_occurrences_lt(a, u) - self.get_occurrences_lt(a, l - 1)
+        occ = self.occurrences.rank
+        uu = ll + occ(a, u) - occ(a, l - 1) - 1
+        l, u = self._update_backward(l, u, a)
+        return (l, u, ll, uu)
+
+
+def _overlap_time(index, reads, tau):
+    """Time find_intervals over every read against a prebuilt index."""
+    index.build()
+    start = timer()
+    for read in reads:
+        find_intervals(index, read, tau=tau)
+    return timer() - start
+
+
+def compare_lt(name, reads, tau):
+    """Time overlap detection with summed and cumulative rank_lt."""
+    lib = ReadLibrary(reads)
+    summing = _overlap_time(SummingFMIndex(lib.concat_reads), lib.reads, tau)
+    cumulative = _overlap_time(FMIndex(lib.concat_reads), lib.reads, tau)
+    return name, len(lib.concat_reads), summing, cumulative
+
+
+def queue_bfs(root, reverse=False):
+    """
+    The layout walk as it was before base.layout, with a lock-guarded queue
+    for the frontier that is scanned on every membership test.
+    """
+    frontier = Queue()
+    frontier.put(root)
+    path = []
+    explored = set()
+
+    while not frontier.empty():
+        node = frontier.get()
+        if node in explored:
+            break
+        edge = node.longest_edge(reverse=reverse)
+        if edge is None:
+            break
+        with frontier.mutex:
+            queued = edge.node in frontier.queue
+        if queued or edge.node in explored:
+            new_edge = None
+            for e in node.edges(reverse=reverse) or []:
+                with frontier.mutex:
+                    queued = e.node in frontier.queue
+                if queued or e.node in explored:
+                    continue
+                if new_edge is None or len(e.label) > len(new_edge.label):
+                    new_edge = e
+            edge = new_edge
+        if edge is None:
+            break
+        explored.add(node)
+        frontier.put(edge.node)
+        path.append(edge)
+
+    return path
+
+
+def chain_graph(rng, n, degree, length=100):
+    """
+    A graph of n reads, each overlapping the next degree reads, like the
+    overlap graph of a genome sequenced at high coverage.
+    """
+    values = [
+        ''.join([rng.choice('ACGT') for _ in xrange(length)])
+        for _ in xrange(n)]
+    edges = [
+        (i, j, length - 10 * (j - i))
+        for i in xrange(n) for j in xrange(i + 1, min(n, i + degree + 1))]
+    return StringGraph.from_edges(values, edges)
+
+
+def compare_layout(rng, n, degree):
+    """Time the queue-based walk and base.layout over a chain graph."""
+    graph = chain_graph(rng, n, degree)
+    start = timer()
+    queued = len(queue_bfs(graph[0]))
+    queue_time = timer() - start
+    start = timer()
+    walked = len(layout(graph))
+    layout_time = timer() - start
+    assert queued == walked
+    return 'chain', n, queue_time, layout_time
+
+
+def compare_search(rng, n, length):
+    """Time n backward searches one at a time and as a single batch."""
+    sequence = ''.join([rng.choice('ACGT') for _ in xrange(200000)])
+    lib = ReadLibrary(
+        [sequence[i:i + 100] for i in xrange(0, len(sequence) - 100, 20)],
+        dna=True)
+    index = FMIndex(lib.concat_reads).build()
+    patterns = [
+        sequence[i:i + length]
+        for i in rng.sample(xrange(len(sequence) - length), n)]
+    index.backward_search_many(patterns[:1])
+    start = timer()
+    for pattern in patterns:
+        index.backward_search(pattern)
+    single = timer() - start
+    start = timer()
+    index.backward_search_many(patterns)
+    batched = timer() - start
+    return 'dna', n, single, batched
+
+
+def run_comparisons(seed=0):
+    """Print the time of each structure against the one it replaced."""
+    rng = random.Random(seed)
+    tables = [
+        (('example', 'bases', 'summing', 'cumulative'), [
+            compare_lt('gettysburg', gettysburg.get_reads(
+                1000, 85, 100, seed=seed), tau=10),
+            compare_lt('tubthumping', tubthumping.get_reads(
+                500, 25, 50, seed=seed), tau=25)]),
+        (('layout', 'reads', 'queue', 'layout'), [
+            compare_layout(rng, n, degree=8) for n in [10000, 100000]]),
+        (('search', 'patterns', 'single', 'batched'), [
+            compare_search(rng, n, length=30) for n in [1000, 10000]]),
+    ]
+    for x, (columns, rows) in enumerate(tables):
+        if x:
+            print
+        print '%-12s %8s %11s %11s %9s' % (columns + ('speedup',))
+        for name, size, before, after in rows:
+            print '%-12s %8i %10.3fs %10.3fs %8.2fx' % (
+                name, size, before, after, before / after)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=(
+        'Time each phase of an assembly. Without --example, the examples '
+        'from main.py are run.'))
+    parser.add_argument('--example', choices=sorted(EXAMPLES))
+    parser.add_argument('--solver', choices=['bwt', 'rosalind'])
+    parser.add_argument('--reads', type=int, help='number of reads')
+    parser.add_argument('--min-length', type=int)
+    parser.add_argument('--max-length', type=int)
+    parser.add_argument(
+        '--alphabet', help='symbols of the genome example')
+    parser.add_argument(
+        '--genome-length', type=int, help='length of the genome example')
+    parser.add_argument('--tau', type=int, help='minimum overlap length')
+    parser.add_argument('--dna', action='store_true', default=None)
+    parser.add_argument('--irreducible', action='store_true', default=None)
+    parser.add_argument(
+        '--both-strands', action='store_true', default=None,
+        help='sample genome reads from both strands, and index both')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument(
+        '--repeat', type=int, default=1,
+        help='runs of each case, keeping the fastest time of each phase')
+    parser.add_argument('--output', help='file to write JSON results to')
+    parser.add_argument(
+        '--compare', action='store_true',
+        help='compare structures against the ones they replaced instead')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.compare:
+        run_comparisons(0 if args.seed is None else args.seed)
+        return
+    if args.example is None:
+        cases = [make_case(**case) for case in DEFAULT_CASES]
+    else:
+        options = dict([
+            (name, value) for name, value in vars(args).iteritems()
+            if name in CASE_DEFAULTS and value is not None])
+        try:
+            cases = [make_case(example=args.example, **options)]
+        except ValueError as e:
+            sys.exit('benchmark.py: error: %s' % e)
+
+    results = run_suite(cases, repeat=args.repeat)
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(
+                {'environment': environment(), 'results': results}, f,
+                indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,40 @@
+import random
+
+from driver.util.dna import reverse_complement
+
+
+'''
+Reads sampled from a random genome, to see how the solver scales with the
+size of the genome and the alphabet.
+'''
+
+
+def get_genome(length=10000, alphabet='ACGT', seed=None):
+    """Return a random genome, reproducibly if seed is given."""
+    rng = random if seed is None else random.Random(seed)
+    return ''.join([rng.choice(alphabet) for _ in xrange(length)])
+
+
+def get_reads(number_reads=1000, min_length=85, max_length=100,
+              alphabet='ACGT', genome_length=10000, seed=None,
+              both_strands=False):
+    """
+    Sample reads from a random genome.
+
+    The genome and the reads are both drawn from seed, so a seed always
+    gives the same reads. If both_strands is True, each read is taken from
+    either strand of the genome at random, as a sequencer would, so half of
+    the reads are reverse complements.
+    """
+    rng = random if seed is None else random.Random(seed)
+    genome = get_genome(genome_length, alphabet, seed=rng.random())
+    randrange = rng.randrange
+    reads = []
+    for x in xrange(number_reads):
+        l = randrange(len(genome))
+        u = l + randrange(min_length, max_length)
+        read = genome[l:u]
+        if both_strands and rng.random() < 0.5:
+            read = reverse_complement(read)
+        reads.append(read)
+    return reads
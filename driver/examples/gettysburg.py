@@ -1,4 +1,4 @@
-from random import randrange
+import random
 
 
 '''
@@ -10,7 +10,10 @@ gettysburg = 'Four score and seven years ago our fathers brought forth on this c
 gettysburg = gettysburg.replace(' ', '_')
 
 
-def get_reads(number_reads=1000, min_length=85, max_length=100):
+def get_reads(number_reads=1000, min_length=85, max_length=100, seed=None):
+    """Sample reads at random, reproducibly if seed is given."""
+    rng = random if seed is None else random.Random(seed)
+    randrange = rng.randrange
     reads = []
     for x in xrange(number_reads):
         l = randrange(len(gettysburg))
@@ -1,4 +1,4 @@
-from random import randrange
+import random
 
 
 '''
@@ -14,7 +14,10 @@ min_length = 25
 max_length = 75
 
 
-def get_reads(number_reads=1000, min_length=25, max_length=75):
+def get_reads(number_reads=1000, min_length=25, max_length=75, seed=None):
+    """Sample reads at random, reproducibly if seed is given."""
+    rng = random if seed is None else random.Random(seed)
+    randrange = rng.randrange
     reads = []
     for x in xrange(number_reads):
         l = randrange(len(tubthumping))
@@ -1,79 +1,236 @@
-from Queue import Queue
+from array import array
 
+from driver.util.graph import StringGraph
+from driver.util.stats import phase
 
-class CheckableQueue(Queue):
-    def __contains__(self, item):
-        """Allow for testing of queue membership."""
-        with self.mutex:
-            return item in self.queue
 
+def _walk(root, edges, explored):
+    """
+    Greedily follow the longest edge to an unexplored node.
 
-def bfs(root, explored=None, reverse=False):
-    frontier = CheckableQueue()
-    frontier.put(root)
+    edges(node) returns the (next node, overlap length, step) triples of a
+    node, and the steps taken are returned in order. Ties are broken by the
+    first edge with the longest overlap. explored is a set of the nodes
+    already visited, so each membership test is O(1).
+    """
     path = []
-    explored = explored or set()
-
-    while not frontier.empty():
-        node = frontier.get()
-
-        # We are revisiting a node that's already been explored
-        if node in explored:
-            break
+    node = root
+    while node not in explored:
+        explored.add(node)
 
         # Get the valid edge with the longest overlap
-        edges = node.edges(reverse=reverse) or []
-        edge = node.longest_edge(reverse=reverse)
-
-        # This node is a leaf
-        if edge is None:
+        best, longest = None, -1
+        for target, overlap, step in edges(node):
+            if overlap > longest and target not in explored:
+                best, longest = step, overlap
+                node = target
+
+        # This node is a leaf, or its neighbors have all been explored
+        if best is None:
             break
+        path.append(best)
 
-        # Node has already been explored. Find another eligible node.
-        if edge.node in frontier or edge.node in explored:
-            new_edge = None
-            for e in edges:
-                if e is edge:
-                    continue
-                if e.node in frontier or e.node in explored:
-                    continue
-                if new_edge is None or len(e.label) > len(edge).label:
-                    new_edge = e
-            edge = new_edge
-
-        # Node's neighbors have all been explored
-        if edge is None:
-            break
+    return path
 
-        # Queue the next best edge for exploration
-        explored.add(node)
-        frontier.put(edge.node)
-        path.append(edge)
 
+def bfs(root, explored=None, reverse=False):
+    def edges(node):
+        return [
+            (edge.node, len(edge.label), edge)
+            for edge in node.edges(reverse=reverse) or []]
+
+    explored = explored if explored is not None else set()
+    path = _walk(root, edges, explored)
     return path if reverse is False else reversed(path)
 
 
-def assemble(overlaps):
-    # Pick a node at random
-    root = overlaps[0]
+def layout(graph, root=0, explored=None, reverse=False):
+    """
+    Walk a StringGraph from root, like bfs, using node ids throughout.
+
+    Returns a list of (node id, overlap length) steps.
+    """
+    adjacency = graph.in_edges if reverse is True else graph.out_edges
+
+    def edges(node_id):
+        return [
+            (x, overlap, (x, overlap)) for x, overlap in adjacency(node_id)]
+
+    explored = explored if explored is not None else set()
+    path = _walk(root, edges, explored)
+    return path if reverse is False else path[::-1]
 
-    # Walk backwards until a node with no in-edges is found
-    # (or until we reach a visited node)
-    reverse_path = list(bfs(root, reverse=True))
-    forward_path = bfs(root)
 
-    # Initialize sequence
-    sequence = ''
+class _BothStrands(set):
+    """
+    A set of explored nodes, in a graph where nodes 2i and 2i + 1 are the
+    two strands of a read, that marks both strands when either is explored.
+    """
 
-    # Walk through path upstream to root
-    for edge in reverse_path:
-        sequence += edge.node.value[:-len(edge.label)]
+    def add(self, node_id):
+        set.add(self, node_id)
+        set.add(self, node_id ^ 1)
 
-    # Append root value
-    sequence += root.value
 
-    # Walk through path downstream from root
-    for edge in forward_path:
-        sequence += edge.node.value[len(edge.label):]
+def _paths(overlaps, both_strands=False):
+    """Return the root value, and the (value, overlap) steps either side."""
+    if isinstance(overlaps, StringGraph):
+        values = overlaps.values
+        explored = _BothStrands if both_strands else set
+        reverse_path = layout(overlaps, reverse=True, explored=explored())
+        forward_path = layout(overlaps, explored=explored())
+        return (
+            values[0],
+            [(values[x], overlap) for x, overlap in reverse_path],
+            [(values[x], overlap) for x, overlap in forward_path])
 
-    return sequence
+    # Pick a node at random
+    root = overlaps[0]
+
+    # Walk backwards until a node with no in-edges is found
+    # (or until we reach a visited node)
+    reverse_path = bfs(root, reverse=True)
+    forward_path = bfs(root)
+    return (
+        root.value,
+        [(edge.node.value, len(edge.label)) for edge in reverse_path],
+        [(edge.node.value, len(edge.label)) for edge in forward_path])
+
+
+def _segments(root, reverse_path, forward_path):
+    """
+    Return the (value, start, end) slices of each read that spell the contig.
+
+    Each read upstream of the root contributes the part before its overlap
+    with the next read, and each read downstream the part after its overlap
+    with the previous read.
+    """
+    segments = [
+        (value, 0, len(value) - overlap) for value, overlap in reverse_path]
+    segments.append((root, 0, len(root)))
+    segments.extend([
+        (value, overlap, len(value)) for value, overlap in forward_path])
+    return segments
+
+
+def assemble(overlaps, out=None, stats=None, both_strands=False):
+    """
+    Lay out the reads and return the contig they spell.
+
+    The contig is built with a single join, in time linear in its length.
+    If out, a file-like object, is given, the contig is written to it
+    piece by piece instead, so it is never held in memory as a whole.
+
+    If both_strands is True, overlaps is a StringGraph in which nodes 2i
+    and 2i + 1 are the two strands of a read, and the layout never uses
+    both strands of the same read.
+
+    If stats is given, the layout and consensus are timed, and the nodes
+    walked are counted.
+    """
+    with phase(stats, 'layout'):
+        segments = _segments(*_paths(overlaps, both_strands))
+    if stats is not None:
+        stats.count('nodes_walked', len(segments))
+    with phase(stats, 'consensus'):
+        if out is None:
+            return ''.join([
+                value[start:end] for value, start, end in segments])
+        for value, start, end in segments:
+            out.write(buffer(value, start, end - start))
+
+
+def _edge_list(overlaps):
+    """Return the node values, and every (overlap, source, target) edge."""
+    if isinstance(overlaps, StringGraph):
+        offsets = overlaps.out_offsets
+        edges = [
+            (overlap, i, j)
+            for i in xrange(len(overlaps))
+            for j, overlap in zip(
+                overlaps.out_targets[offsets[i]:offsets[i + 1]],
+                overlaps.out_overlaps[offsets[i]:offsets[i + 1]])]
+        return overlaps.values, edges
+
+    ids = dict([(node, i) for i, node in enumerate(overlaps)])
+    edges = [
+        (len(edge.label), ids[node], ids[edge.node])
+        for node in overlaps for edge in node.out_edges]
+    return [node.value for node in overlaps], edges
+
+
+def assemble_contigs(overlaps, both_strands=False):
+    """
+    Assemble every read in the graph, yielding contigs longest first.
+
+    Edges are taken greedily in order of decreasing overlap, skipping any
+    edge whose source already has a successor, whose target already has a
+    predecessor, or which would close a cycle. The chosen edges form
+    disjoint paths that cover every node, and each path spells a contig.
+
+    If both_strands is True, nodes 2i and 2i + 1 are the two strands of a
+    read, as in a graph built by bwt_solver with both_strands. Every edge is
+    then taken along with its mirror, from the reverse complement of its
+    target to that of its source, so every path has a mirror on the other
+    strand, and only one of the two is yielded. Edges that would join a path
+    to its own mirror are skipped.
+
+    The layout is computed up front, but each contig is only joined when
+    it is yielded, so consumers that stop early do not pay for the rest.
+    """
+    values, edges = _edge_list(overlaps)
+    edges.sort(key=lambda edge: -edge[0])
+    n = len(values)
+    successors = array('l', [-1] * n)
+    predecessors = array('l', [-1] * n)
+    overlap_in = array('l', [0] * n)
+
+    # Union-find over the paths built so far, to detect cycles
+    parents = range(n)
+
+    def find(i):
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    def free(i, j):
+        return successors[i] < 0 and predecessors[j] < 0
+
+    for overlap, i, j in edges:
+        if not free(i, j):
+            continue
+        root_i, root_j = find(i), find(j)
+        if root_i == root_j:
+            continue
+        if both_strands:
+            if not free(j ^ 1, i ^ 1) or root_i == find(j ^ 1):
+                continue
+            parents[find(j ^ 1)] = find(i ^ 1)
+            successors[j ^ 1], predecessors[i ^ 1] = i ^ 1, j ^ 1
+            overlap_in[i ^ 1] = overlap
+        parents[root_i] = root_j
+        successors[i], predecessors[j], overlap_in[j] = j, i, overlap
+
+    paths = []
+    for i in xrange(n):
+        if predecessors[i] >= 0:
+            continue
+        segments = [(values[i], 0, len(values[i]))]
+        j, last = successors[i], i
+        while j >= 0:
+            segments.append((values[j], overlap_in[j], len(values[j])))
+            j, last = successors[j], j
+        paths.append((
+            sum([end - start for _, start, end in segments]), i, last,
+            segments))
+
+    paths.sort(key=lambda path: path[0], reverse=True)
+    mirrored = set()
+    for _, first, last, segments in paths:
+        if first in mirrored:
+            continue
+        if both_strands:
+            # The mirror of this path starts with the mate of its last node
+            mirrored.add(last ^ 1)
+        yield ''.join([value[start:end] for value, start, end in segments])
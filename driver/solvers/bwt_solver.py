@@ -1,56 +1,217 @@
+import logging
+from array import array
+from multiprocessing import Pool
+
 from driver.solvers.base import assemble
+from driver.solvers.base import assemble_contigs
 
+from driver.util.fm_index import extract_irreducible
+from driver.util.fm_index import find_contained
 from driver.util.fm_index import find_intervals
 from driver.util.fm_index import FMIndex
+from driver.util.fm_index import iter_overlaps
 from driver.util.fm_index import ReadLibrary
+from driver.util.fmd_index import FMDIndex
+
+from driver.util.graph import StringGraph
+
+from driver.util.stats import phase
+from driver.util.stats import Stats
+
+
+log = logging.getLogger(__name__)
 
-from driver.util.graph import Edge
+# The library and index being searched by worker processes. This is set before
+# the workers are forked, so that they share its memory with the parent
+# process, rather than having it pickled and sent with every task.
+_shared = {}
 
 
-def _expand_right(index, position):
+def _self_overlap(read, overlap):
+    """Return whether the suffix of read of length overlap is its prefix."""
+    return buffer(read, 0, overlap) == buffer(read, len(read) - overlap)
+
+
+def _find_overlaps(lib, index, read_ids, tau, reverse_index=None,
+                   stats=None, max_overlaps=None):
     """
-    Get the full text of the string that was matched.
+    Find the overlaps of each read in read_ids with every other read.
+
+    If reverse_index, the index of the reversed text, is given, only the
+    irreducible overlaps are found. If max_overlaps is given, only that
+    many of the longest overlaps of each read are kept.
 
-    Start at the beginning of the entry in the suffix array
-    corresponding to the matched prefix, and look rightwards
-    until we reach a $, indicating the end of the matched
-    substring.
+    If index is an FMDIndex, each read is followed by its reverse complement
+    in lib, and overlaps between the two strands of a read are skipped.
+
+    Returns a list of (read id, matched read id, overlap length) tuples.
     """
-    match = ''
-    j = 1
-    while True:
-        c = index.input_str[index.suffix_array[position] + j]
-        if c == '$':
-            break
-        match += c
-        j += 1
-    return match
-
-
-def build_overlap_graph(reads, tau=3):
-    lib = ReadLibrary(reads)
-    index = FMIndex(lib.concat_reads)
-
-    for read in lib.reads.values():
-        edges = find_intervals(index, read.value, tau=tau)
-
-        for l, u, label in edges:
-            if read.value.startswith(label):
+    overlaps = []
+    positions = 0
+    stranded = isinstance(index, FMDIndex)
+    for read_id in read_ids:
+        read = lib.reads[read_id]
+        mate = read_id ^ 1 if stranded else read_id
+        if reverse_index is None:
+            intervals = iter_overlaps(index, read, tau=tau, stats=stats)
+        else:
+            intervals = extract_irreducible(
+                index, reverse_index,
+                find_intervals(
+                    index, read, tau=tau, bidirectional=True, stats=stats),
+                contained=False, stats=stats)
+            intervals = [(l, u, len(label)) for l, u, label in intervals]
+            if max_overlaps is not None:
+                intervals.sort(key=lambda interval: -interval[2])
+
+        found = 0
+        for l, u, overlap in intervals:
+            if _self_overlap(read, overlap):
                 continue
 
-            for i in range(l, u + 1):
-                match = _expand_right(index, i)
-                if match == read.value:
+            for i in xrange(l, u + 1):
+                # Each match starts at the $ preceding the matched read
+                positions += 1
+                match_id = lib.read_at(index.suffix_array[i] + 1)
+                if match_id == read_id or match_id == mate:
                     continue
-                edge_node = lib.reads[match]
-                read.add_out_edge(Edge(edge_node, label))
-                edge_node.add_in_edge(Edge(read, label))
-    return lib.reads
+                overlaps.append((read_id, match_id, overlap))
+                found += 1
+                if found == max_overlaps:
+                    break
+            if found == max_overlaps:
+                break
+
+    if stats is not None:
+        stats.count('sa_positions', positions)
+        stats.count('edges', len(overlaps))
+    return overlaps
+
+
+def _find_overlaps_shard(shard):
+    start, stop, tau, max_overlaps = shard
+    stats = Stats() if _shared['stats'] else None
+    overlaps = _find_overlaps(
+        _shared['lib'], _shared['index'], xrange(start, stop), tau,
+        reverse_index=_shared['reverse_index'], stats=stats,
+        max_overlaps=max_overlaps)
+    return overlaps, stats.counters if stats is not None else None
+
+
+def _find_overlaps_parallel(lib, index, tau, workers, reverse_index=None,
+                            stats=None, max_overlaps=None):
+    """
+    Find overlaps with a pool of worker processes.
+
+    Reads are split into contiguous shards, and the overlaps of each shard
+    are returned in read order, so the result is identical to a serial run.
+    The counters of each shard are added to stats, if it is given.
+    Requires a platform that forks worker processes.
+    """
+    n = len(lib.reads)
+    size = max(1, -(-n // (workers * 4)))
+    shards = [
+        (start, min(start + size, n), tau, max_overlaps)
+        for start in xrange(0, n, size)]
+
+    index.build()
+    if reverse_index is not None:
+        reverse_index.build()
+    _shared['lib'], _shared['index'] = lib, index
+    _shared['reverse_index'] = reverse_index
+    _shared['stats'] = stats is not None
+    try:
+        pool = Pool(workers)
+        try:
+            results = pool.map(_find_overlaps_shard, shards)
+        finally:
+            pool.close()
+            pool.join()
+    finally:
+        _shared.clear()
+    if stats is not None:
+        for _, counters in results:
+            stats.update(counters)
+    return [overlap for result, _ in results for overlap in result]
+
+
+def _prepare_index(reads, dna, index, both_strands=False):
+    """
+    Return the read library and FM-index to search.
+
+    If index is given, it may be an FMIndex or the path of a saved index,
+    and the library is recovered from the text of the index. Otherwise both
+    are built from reads, which may be a list or the path of a FASTA or
+    FASTQ file. With both_strands, the library holds the reverse complement
+    of every read too, and the index is an FMDIndex.
+    """
+    if index is None:
+        if isinstance(reads, basestring):
+            lib = ReadLibrary.from_fastx(reads, dna=dna)
+        else:
+            lib = ReadLibrary(reads, dna=dna)
+        if both_strands:
+            lib = lib.with_reverse_complements()
+            return lib, FMDIndex(lib.concat_reads)
+        return lib, FMIndex(lib.concat_reads)
+    if isinstance(index, basestring):
+        index = (FMDIndex if both_strands else FMIndex).load(index)
+    elif both_strands and not isinstance(index, FMDIndex):
+        raise ValueError('both_strands needs an FMDIndex')
+    return ReadLibrary.from_text(index.input_str), index
+
+
+def build_overlap_graph(reads=None, tau=3, dna=False, workers=1, index=None,
+                        irreducible=False, remove_contained=False, stats=None,
+                        max_overlaps=None, both_strands=False):
+    with phase(stats, 'read_library'):
+        lib, index = _prepare_index(reads, dna, index, both_strands)
+    if stats is not None:
+        index.build(stats)
+
+    # Transitive reduction assumes no read is contained in another
+    if remove_contained or irreducible:
+        with phase(stats, 'remove_contained'):
+            contained = find_contained(
+                lib, index, both_strands=isinstance(index, FMDIndex))
+        # Both strands of a contained read are contained
+        removed = len(contained)
+        if isinstance(index, FMDIndex):
+            removed //= 2
+        log.info(
+            'Removed %i duplicate and %i contained reads',
+            lib.duplicates, removed)
+        if contained:
+            lib = lib.without(contained)
+            index = index.like(lib.concat_reads)
+            if stats is not None:
+                index.build(stats)
+    reverse_index = None
+    if irreducible and isinstance(index, FMDIndex):
+        reverse_index = index
+    elif irreducible:
+        reverse_index = index.reverse()
+        if stats is not None:
+            reverse_index.build(stats)
+
+    with phase(stats, 'overlap'):
+        if workers > 1:
+            overlaps = _find_overlaps_parallel(
+                lib, index, tau, workers, reverse_index=reverse_index,
+                stats=stats, max_overlaps=max_overlaps)
+        else:
+            overlaps = _find_overlaps(
+                lib, index, xrange(len(lib.reads)), tau,
+                reverse_index=reverse_index, stats=stats,
+                max_overlaps=max_overlaps)
+
+    with phase(stats, 'graph'):
+        return StringGraph.from_edges(lib.reads, overlaps)
 
 """
 This solver uses an FM-index to achieve fast suffix testing.
 
-We precompute the index in O(C * log C), where C is the number of total base
+We precompute the index in O(C), where C is the number of total base
 pairs sequenced. The advantage of building this index is that reads with a
 prefix, P, matching a suffix, S, can be retrieved in O(S) time, and allows us
 to avoid the N^2 complexity of the naive approach.
@@ -67,14 +228,277 @@ is O(N + M), where N is the number of reads and M is the number of edges
 between them.
 
 When we combine the index computation and overlap detection, we get a total
-runtime of O(N + M + C + C * log C). When read length is assumed to be constant
-this reduces to: O(N + M + N * log N).
+runtime of O(N + M + C). When read length is assumed to be constant
+this reduces to: O(N + M).
 
 The space complexity involves the total of the index and the string graph,
 which comes out to O(C + M), or O(R + M) when the reads are constant length.
+
+For DNA reads, pass dna=True to pack the reads and the BWT into 3 bits per
+base (see driver.util.dna), which cuts the memory used by the text of the
+index by more than half.
+
+Overlap detection only reads from the index, so it can be spread across
+several processes with workers=N. The assembly is identical to a serial run.
+
+Building the index dominates the runtime when the same reads are assembled
+repeatedly, for example with different values of tau. The index can instead
+be built once, saved with FMIndex.save, and passed to solve as index=path,
+in which case reads may be omitted.
+
+reads may also be the path of a FASTA or FASTQ file, optionally gzipped,
+which is streamed into the library one record at a time.
+
+At high coverage, most overlaps are transitive: if X overlaps Y and Y
+overlaps Z, X usually overlaps Z as well, so the number of edges grows with
+the square of the coverage. With irreducible=True, an index of the reversed
+text is also built, and only the irreducible overlaps are emitted, following
+the string graph construction of Simpson & Durbin (2010). The number of
+edges then grows linearly with the number of reads. The reduction is only
+sound when no read is contained in another, so irreducible=True implies
+remove_contained=True.
+
+Reads that are duplicates of, or contained in, other reads add nothing to the
+assembly. With remove_contained=True they are found with a backward search
+of each read and dropped before overlaps are computed, and the number of
+reads removed is logged.
+
+solve returns a single contig, grown from one read, and reads off its path
+are dropped. solve_contigs instead yields a contig for every path in a greedy
+layout of the whole graph, longest first, so every read is assembled.
+
+With compact=True, every chain of reads in which each read has exactly one
+successor, and its successor exactly one predecessor, is merged into a single
+node (a unitig) before layout. On irreducible graphs most reads lie on such
+chains, so layout runs on a far smaller graph.
+
+To see where the time goes, pass a driver.util.stats.Stats as stats. The
+index is then built up front, rather than on the first search, and each
+phase is timed separately, from building the index to the consensus. Hot
+path counters, such as backward extensions and edges emitted, are recorded
+too.
+
+Overlaps are found with iter_overlaps, longest first, so with max_overlaps=K
+only the K longest overlaps of each read are kept. The greedy layout follows
+the longest edges, so at high coverage the rest only cost time and memory.
+
+DNA reads are sequenced from either strand. With both_strands=True, each
+read is indexed along with its reverse complement in an FMDIndex (see
+driver.util.fmd_index), and node 2i of the graph is read i, while node
+2i + 1 is its reverse complement. Searching each node finds its overlaps
+with every read in both orientations in a single sweep, so no second index
+is built, and irreducible overlaps need no index of the reversed text. Reads
+that are the reverse complement of another read are dropped as duplicates.
+solve_contigs yields each contig once, rather than once per strand, unless
+compact is also set, as unitigs are not paired by strand.
+
+When reads arrive in batches, IncrementalOverlapGraph avoids rebuilding the
+index for every batch. Each batch is indexed on its own, and consecutive
+indexes of similar size are merged, so there are O(log N) indexes to search
+and each read is reindexed O(log N) times. The edges are those of a batch
+build over every read added so far.
 """
 
 
-def solve(reads, tau=3):
-    overlaps = build_overlap_graph(reads, tau=tau)
-    return assemble(overlaps.values())
+def solve(reads=None, tau=3, dna=False, workers=1, index=None,
+          irreducible=False, remove_contained=False, compact=False, out=None,
+          stats=None, max_overlaps=None, both_strands=False):
+    overlaps = build_overlap_graph(
+        reads, tau=tau, dna=dna, workers=workers, index=index,
+        irreducible=irreducible, remove_contained=remove_contained,
+        stats=stats, max_overlaps=max_overlaps, both_strands=both_strands)
+    if compact:
+        with phase(stats, 'compact'):
+            overlaps = overlaps.compact()
+    # Unitigs are not paired by strand
+    both_strands = both_strands or isinstance(index, FMDIndex)
+    return assemble(
+        overlaps, out=out, stats=stats,
+        both_strands=both_strands and not compact)
+
+
+def solve_contigs(reads=None, tau=3, dna=False, workers=1, index=None,
+                  irreducible=False, remove_contained=False, compact=False,
+                  stats=None, max_overlaps=None, both_strands=False):
+    overlaps = build_overlap_graph(
+        reads, tau=tau, dna=dna, workers=workers, index=index,
+        irreducible=irreducible, remove_contained=remove_contained,
+        stats=stats, max_overlaps=max_overlaps, both_strands=both_strands)
+    if compact:
+        with phase(stats, 'compact'):
+            overlaps = overlaps.compact()
+    # Unitigs are not paired by strand, so their contigs may appear twice
+    both_strands = both_strands or isinstance(index, FMDIndex)
+    return assemble_contigs(
+        overlaps, both_strands=both_strands and not compact)
+
+
+class _Layer(object):
+    """
+    A batch of reads with its own FM-index, within an IncrementalOverlapGraph.
+
+    start is the id of the first read of the layer in the whole graph.
+    """
+
+    def __init__(self, start, reads, dna):
+        self.start = start
+        self.lib = ReadLibrary.from_stream(reads, dna=dna)
+        self.index = FMIndex(self.lib.concat_reads)
+        self._reverse_index = None
+
+    def __len__(self):
+        return len(self.lib.reads)
+
+    def contains(self, read):
+        l, u = self.index.backward_search('$' + read + '$')
+        return u >= l
+
+    def prefix_matches(self, read, tau):
+        """
+        Find the reads of the layer whose prefix matches a suffix of read.
+
+        Returns (read id, overlap length) pairs, with ids local to the layer.
+        """
+        index = self.index
+        matches = []
+        for l, u, overlap in iter_overlaps(index, read, tau=tau):
+            if _self_overlap(read, overlap):
+                continue
+            for i in xrange(l, u + 1):
+                matches.append(
+                    (self.lib.read_at(index.suffix_array[i] + 1), overlap))
+        return matches
+
+    def suffix_matches(self, read, tau):
+        """
+        Find the reads of the layer whose suffix matches a prefix of read.
+
+        A read ending with a prefix of read is a read starting with a suffix
+        of the reverse of read in the reversed text, so these are found by
+        searching for the reverse of read in an index of the reversed text.
+        The search is led by a '$', so that the whole of read, which may be
+        a suffix of a longer read, is tried as well.
+        """
+        if self._reverse_index is None:
+            self._reverse_index = self.index.reverse()
+        index = self._reverse_index
+        end = len(self.lib.concat_reads) - 2
+        matches = []
+        for l, u, overlap in iter_overlaps(index, '$' + read[::-1], tau=tau):
+            for i in xrange(l, u + 1):
+                matches.append(
+                    (self.lib.read_at(end - index.suffix_array[i]), overlap))
+        return matches
+
+
+class IncrementalOverlapGraph(object):
+    """
+    An overlap graph that grows as batches of reads arrive.
+
+    Rather than rebuilding one index over every read, each batch is indexed
+    on its own, as a layer. When a batch is added, only the overlaps from
+    its reads to every read, and from earlier reads to its reads, are found,
+    so the edges found before are kept as they are. The edges are the same
+    as those found by build_overlap_graph over all the reads at once.
+
+    To keep the number of layers small, a new layer is merged with the one
+    before it whenever it has grown at least as large, so there are at most
+    O(log N) layers, and each read is re-indexed at most O(log N) times.
+
+    For example:
+
+    graph = IncrementalOverlapGraph(tau=10)
+    for batch in batches:
+        graph.add(batch)
+    contig = assemble(graph.graph)
+
+    The edges are kept in flat arrays as they are found, and the StringGraph
+    is only built from them when graph is read, in O(N + M) time. It is then
+    cached until the next batch adds reads, so reading graph between batches
+    costs one build per batch, not one per access.
+    """
+
+    def __init__(self, tau=3, dna=False):
+        self.tau = tau
+        self.dna = dna
+        self.layers = []
+        self.reads = []
+        self.sources = array('l')
+        self.targets = array('l')
+        self.overlaps = array('i')
+        self._graph = None
+
+    def __len__(self):
+        return len(self.reads)
+
+    def __contains__(self, read):
+        return any([layer.contains(read) for layer in self.layers])
+
+    def add(self, reads):
+        """
+        Add a batch of reads, and the overlaps that involve them.
+
+        Reads that are already in the graph are skipped. Returns the number
+        of reads added.
+        """
+        batch = [
+            read for read in ReadLibrary.from_stream(reads).reads
+            if read not in self]
+        if not batch:
+            return 0
+        layer = _Layer(len(self.reads), batch, self.dna)
+        if self._graph is not None:
+            # The cached graph holds the reads list, so leave it unchanged
+            self.reads = self.reads + batch
+            self._graph = None
+        else:
+            self.reads.extend(batch)
+
+        tau, start = self.tau, layer.start
+        for x, read in enumerate(batch):
+            for other in self.layers + [layer]:
+                for y, overlap in other.prefix_matches(read, tau):
+                    if other is layer and y == x:
+                        continue
+                    self._add_edge(start + x, other.start + y, overlap)
+        for y, read in enumerate(batch):
+            for other in self.layers:
+                for x, overlap in other.suffix_matches(read, tau):
+                    # The old read ends with read[:overlap]
+                    if _self_overlap(self.reads[other.start + x], overlap):
+                        continue
+                    self._add_edge(other.start + x, start + y, overlap)
+
+        self.layers.append(layer)
+        self._merge_layers()
+        return len(batch)
+
+    def _add_edge(self, source, target, overlap):
+        self.sources.append(source)
+        self.targets.append(target)
+        self.overlaps.append(overlap)
+
+    def _merge_layers(self):
+        layers = self.layers
+        while len(layers) > 1 and len(layers[-1]) >= len(layers[-2]):
+            last, previous = layers.pop(), layers.pop()
+            log.info(
+                'Merging layers of %i and %i reads',
+                len(previous), len(last))
+            layers.append(_Layer(
+                previous.start,
+                self.reads[previous.start:last.start + len(last)],
+                self.dna))
+
+    @property
+    def graph(self):
+        """
+        Return a StringGraph of every read and overlap added so far.
+
+        The graph is built on the first access after reads were added, and
+        the same graph is returned until more are.
+        """
+        if self._graph is None:
+            self._graph = StringGraph(
+                self.reads, self.sources, self.targets, self.overlaps)
+        return self._graph
@@ -1,49 +1,116 @@
+import logging
+
 from driver.solvers.base import assemble
 
-from driver.util.graph import Edge, Node
+from driver.util.fm_index import find_contained
+from driver.util.fm_index import FMIndex
+from driver.util.fm_index import ReadLibrary
+
+from driver.util.graph import Edge, Node, StringGraph
+
+from driver.util.stats import phase
+
+
+log = logging.getLogger(__name__)
+
+
+def _informative_reads(reads):
+    """Remove duplicate reads, and reads contained in other reads."""
+    lib = ReadLibrary(reads)
+    contained = find_contained(lib, FMIndex(lib.concat_reads))
+    log.info(
+        'Removed %i duplicate and %i contained reads',
+        lib.duplicates, len(contained))
+    return lib.without(contained).reads
 
 
-def build_overlap_graph(reads):
-    reads = [Node(r) for r in reads]
-    for x in reads:
-        for y in reads:
-            if x == y:
-                continue
-            # Check all suffixes from x[1:] through x[|x|/2:]
-            for i in xrange(1, len(x.value) / 2 + 1):
-                suffix = x.value[i:]
-                if y.value.startswith(suffix):
-                    x.add_out_edge(Edge(y, suffix))
-                    y.add_in_edge(Edge(x, suffix))
-    return reads
+def _hashed_overlaps(reads):
+    """
+    Find every (x, y, i) where read y starts with read x[i:], and i is at
+    most half the length of x, ordered by x, then y, then i.
+
+    Every suffix tested is at least k long, where k is the shortest such
+    suffix of any read. The reads are indexed by their first k characters,
+    so each suffix is only compared to the reads whose prefix matches its
+    own first k characters.
+    """
+    lengths = [len(read) - len(read) / 2 for read in reads if len(read) > 1]
+    if not lengths:
+        return
+    k = min(lengths)
+    prefixes = {}
+    for y, read in enumerate(reads):
+        if len(read) >= k:
+            prefixes.setdefault(read[:k], []).append(y)
+
+    for x, read in enumerate(reads):
+        matches = []
+        for i in xrange(1, len(read) / 2 + 1):
+            suffix = read[i:]
+            for y in prefixes.get(suffix[:k], ()):
+                if y != x and reads[y].startswith(suffix):
+                    matches.append((y, i))
+        matches.sort()
+        for y, i in matches:
+            yield x, y, i
+
+
+def build_overlap_graph(reads, remove_contained=False, stats=None):
+    if remove_contained:
+        with phase(stats, 'remove_contained'):
+            reads = _informative_reads(reads)
+    reads = list(reads)
+    nodes = [Node(r) for r in reads]
+    edges = 0
+    with phase(stats, 'overlap'):
+        for x, y, i in _hashed_overlaps(reads):
+            suffix = reads[x][i:]
+            nodes[x].add_out_edge(Edge(nodes[y], suffix))
+            nodes[y].add_in_edge(Edge(nodes[x], suffix))
+            edges += 1
+    if stats is not None:
+        stats.count('edges', edges)
+    return nodes
 
 
 """
 The Rosalind solver handles the special case where reads
-are reasonably small (<= 1kbp) and few in number (<= 50).
+are reasonably small (<= 1kbp).
 It also relies on the condition that the superset of reads
 can be reduced in a unique way to reconstruct the entire
 superstring by combining reads that overlap by more than
 half their length.
 
-The algorithm traverses each of the N reads up to N - 1 times
-in order to iteratively determine the overlaps between each pair
-of reads.
+Only suffixes longer than half a read are candidate overlaps, so
+every suffix is at least k long, where k is half the length of the
+shortest read. Rather than testing each suffix against all N reads,
+reads are indexed by their first k characters, and each suffix is
+only tested against the reads that share its first k characters.
 
-Calculating the overlap takes O(|Xi|) time, where |Xi| is the
-length of read i.
-
-If we assume that reads are mostly identical in length, the time
-complexity simplifies to O(N^2).
+Each of the O(L) suffixes of a read takes O(k) time to hash, plus
+O(L) time for each candidate read. In random sequence, candidates
+other than true overlaps are rare, so the time complexity is
+O(N * L^2), linear in the number of reads.
 
 For space, the overlap graph requires O(N) storage for nodes
 and O(M) storage for the overlaps. Since we are guaranteed a
 unique traverasll through the graph, we know that each node
 is connected by exactly one or fewer outbound edges, so the space
 complexity simplifies to O(N).
+
+With remove_contained=True, duplicate reads and reads contained in other
+reads are dropped before overlaps are computed. With compact=True,
+non-branching chains of reads are merged into unitigs before layout.
+
+Pass a driver.util.stats.Stats as stats to time each phase.
 """
 
 
-def solve(reads):
-    overlaps = build_overlap_graph(reads)
-    return assemble(overlaps)
+def solve(reads, remove_contained=False, compact=False, out=None,
+          stats=None):
+    overlaps = build_overlap_graph(
+        reads, remove_contained=remove_contained, stats=stats)
+    if compact:
+        with phase(stats, 'compact'):
+            overlaps = StringGraph.from_nodes(overlaps).compact()
+    return assemble(overlaps, out=out, stats=stats)
@@ -0,0 +1,335 @@
+import string
+from itertools import product
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+'''
+Compact storage for DNA sequences.
+
+Bases are packed four to a byte, using two bits each, and the '$' separators
+between reads are recorded in a separate bitmap. A '$' occupies the slot of
+an 'A' in the packed bases, so it must always be checked against the bitmap.
+
+Where symbols are handled as integers, each is coded by its position in
+DNA_ALPHABET, so codes sort in the same order as the symbols.
+'''
+
+
+BASES = 'ACGT'
+SENTINEL = '$'
+DNA_ALPHABET = SENTINEL + BASES
+SYMBOL_CODES = dict([(c, x) for x, c in enumerate(DNA_ALPHABET)])
+
+# Sequences are converted to and from NumPy codes this many symbols at a
+# time, a multiple of 8 so that every chunk fills whole bytes
+CHUNK_SIZE = 1 << 16
+
+_CODES = dict([(c, i) for i, c in enumerate(BASES)])
+_CODES[SENTINEL] = 0
+
+# Packed byte and sentinel nibble for every run of four symbols
+_PACK = {}
+_SENTINEL_NIBBLES = {}
+for _quad in product(DNA_ALPHABET, repeat=4):
+    _key = ''.join(_quad)
+    _PACK[_key] = sum([_CODES[c] << (2 * j) for j, c in enumerate(_quad)])
+    _SENTINEL_NIBBLES[_key] = sum(
+        [1 << j for j, c in enumerate(_quad) if c == SENTINEL])
+
+# The four bases (ignoring sentinels) stored in every possible byte
+_UNPACK = [
+    ''.join([BASES[(b >> (2 * j)) & 3] for j in xrange(4)])
+    for b in xrange(256)]
+
+_POPCOUNT = [bin(x).count('1') for x in xrange(256)]
+
+
+def _slot_tables(codes):
+    """
+    Tables for counting the slots of a packed byte that hold any of codes.
+
+    Returns the count for every byte, and the count within the first j slots
+    of every byte b, at 4 * b + j.
+    """
+    slots = [
+        [(b >> (2 * j)) & 3 in codes for j in xrange(4)] for b in xrange(256)]
+    counts = [sum(matches) for matches in slots]
+    prefixes = [sum(matches[:j]) for matches in slots for j in xrange(4)]
+    return counts, prefixes
+
+
+# Tables for the slots equal to each base code, and less than each base code
+_EQUAL_SLOTS = [_slot_tables([code]) for code in xrange(4)]
+_LESS_SLOTS = [_slot_tables(range(code)) for code in xrange(4)]
+
+# The set bits within the first j bits of every byte b, at 8 * b + j
+_BIT_PREFIXES = [
+    _POPCOUNT[b & ((1 << j) - 1)] for b in xrange(256) for j in xrange(8)]
+
+# Sentinels are their own complement
+_COMPLEMENT = string.maketrans(BASES, BASES[::-1])
+
+
+class PackedDNA(object):
+    """
+    A string over the alphabet '$ACGT', stored in 3 bits per symbol.
+
+    Supports the parts of the str interface used by the FM-index: len(),
+    indexing and slicing (which return str), iteration and count().
+    """
+
+    def __init__(self, seq=''):
+        self.length = 0
+        self.bases = bytearray()
+        self.sentinels = bytearray()
+        self.totals = dict([(c, 0) for c in DNA_ALPHABET])
+        self.extend(seq)
+
+    @classmethod
+    def from_buffers(cls, bases, sentinels, length, totals):
+        """
+        Wrap previously packed data, such as a memory-mapped file.
+
+        bases and sentinels may be any buffers that support indexing and
+        slicing by byte.
+        """
+        packed = cls()
+        packed.bases, packed.sentinels = bases, sentinels
+        packed.length, packed.totals = length, dict(totals)
+        return packed
+
+    def __len__(self):
+        return self.length
+
+    def __repr__(self):
+        """Return repr."""
+        return 'PackedDNA<%s>' % self
+
+    def __str__(self):
+        return self._decode(0, self.length)
+
+    def __iter__(self):
+        for start in xrange(0, self.length, 4096):
+            for c in self._decode(start, min(start + 4096, self.length)):
+                yield c
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(self.length)
+            if step != 1:
+                return str(self)[i]
+            return self._decode(start, max(start, stop))
+        if i < 0:
+            i += self.length
+        if not 0 <= i < self.length:
+            raise IndexError('PackedDNA index out of range')
+        if self.sentinels[i >> 3] & (1 << (i & 7)):
+            return SENTINEL
+        return BASES[(self.bases[i >> 2] >> ((i & 3) * 2)) & 3]
+
+    def _append(self, c):
+        i = self.length
+        if i & 3 == 0:
+            self.bases.append(0)
+        if i & 7 == 0:
+            self.sentinels.append(0)
+        self.bases[-1] |= _CODES[c] << ((i & 3) * 2)
+        if c == SENTINEL:
+            self.sentinels[-1] |= 1 << (i & 7)
+        self.length += 1
+
+    def extend(self, seq):
+        """Append a string of DNA symbols."""
+        if seq.translate(None, DNA_ALPHABET):
+            raise ValueError(
+                'Invalid DNA symbols: %s' % ''.join(
+                    sorted(set(seq.translate(None, DNA_ALPHABET)))))
+        for c in DNA_ALPHABET:
+            self.totals[c] += seq.count(c)
+
+        # Fill the partially used byte, then pack four symbols at a time
+        head = min((-self.length) & 3, len(seq))
+        for c in seq[:head]:
+            self._append(c)
+        body = head + ((len(seq) - head) & ~3)
+        for j in xrange(head, body, 4):
+            quad = seq[j:j + 4]
+            if self.length & 7 == 0:
+                self.sentinels.append(_SENTINEL_NIBBLES[quad])
+            else:
+                self.sentinels[-1] |= _SENTINEL_NIBBLES[quad] << 4
+            self.bases.append(_PACK[quad])
+            self.length += 4
+        for c in seq[body:]:
+            self._append(c)
+
+    def _decode(self, start, stop):
+        if start >= stop:
+            return ''
+        first = start >> 2
+        chunk = ''.join([
+            _UNPACK[b] for b in self.bases[first:((stop - 1) >> 2) + 1]])
+        chunk = chunk[start - 4 * first:stop - 4 * first]
+
+        # Restore any sentinels, which were stored as 'A'
+        lo = start >> 3
+        flags = self.sentinels[lo:((stop - 1) >> 3) + 1]
+        if not any(flags):
+            return chunk
+        chars = list(chunk)
+        for b, byte in enumerate(flags):
+            if not byte:
+                continue
+            for j in xrange(8):
+                i = 8 * (lo + b) + j
+                if byte & (1 << j) and start <= i < stop:
+                    chars[i - start] = SENTINEL
+        return ''.join(chars)
+
+    def count(self, symbol, start=0, end=None):
+        """
+        Return the number of occurrences of symbol in self[start:end].
+
+        Counts are computed from the packed bytes with table lookups, so no
+        part of the sequence is decoded.
+        """
+        n = self.length
+        end = n if end is None else min(end, n)
+        start = max(start, 0)
+        if start == 0 and end == n:
+            return self.totals.get(symbol, 0)
+        x = SYMBOL_CODES.get(symbol)
+        if x is None or start >= end:
+            return 0
+        return self.count_code(x, start, end)
+
+    def count_code(self, x, start, end):
+        """
+        Return the number of occurrences of DNA_ALPHABET[x] in self[start:end].
+
+        start and end must lie within the sequence, with start <= end. This
+        is the inner loop of rank queries over a packed BWT, so the counts of
+        the bases and of the sentinels are written out in full.
+        """
+        total = 0
+        if x:
+            counts, prefixes = _EQUAL_SLOTS[x - 1]
+            data, first, last = self.bases, start >> 2, end >> 2
+            if start & 3:
+                total -= prefixes[(data[first] << 2) | (start & 3)]
+            for byte in data[first:last]:
+                total += counts[byte]
+            if end & 3:
+                total += prefixes[(data[last] << 2) | (end & 3)]
+            if x > 1:
+                return total
+        data, first, last = self.sentinels, start >> 3, end >> 3
+        sentinels = 0
+        if start & 7:
+            sentinels -= _BIT_PREFIXES[(data[first] << 3) | (start & 7)]
+        for byte in data[first:last]:
+            sentinels += _POPCOUNT[byte]
+        if end & 7:
+            sentinels += _BIT_PREFIXES[(data[last] << 3) | (end & 7)]
+        return total - sentinels if x else sentinels
+
+    def count_less(self, x, start, end):
+        """
+        Return the number of symbols smaller than DNA_ALPHABET[x] in
+        self[start:end].
+
+        start and end must lie within the sequence, with start <= end. As
+        '$' is stored as an 'A', it is counted along with the smaller bases.
+        """
+        if x < 2:
+            return self.count_code(0, start, end) if x else 0
+        counts, prefixes = _LESS_SLOTS[x - 1]
+        data, first, last = self.bases, start >> 2, end >> 2
+        total = 0
+        if start & 3:
+            total -= prefixes[(data[first] << 2) | (start & 3)]
+        for byte in data[first:last]:
+            total += counts[byte]
+        if end & 3:
+            total += prefixes[(data[last] << 2) | (end & 3)]
+        return total
+
+
+def pack(chars, chunk_size=4096):
+    """Pack an iterable of DNA symbols into a PackedDNA."""
+    packed = PackedDNA()
+    chunk = []
+    for c in chars:
+        chunk.append(c)
+        if len(chunk) == chunk_size:
+            packed.extend(''.join(chunk))
+            chunk = []
+    packed.extend(''.join(chunk))
+    return packed
+
+
+def codes_at(packed, positions):
+    """
+    Return the symbol code of each position in a PackedDNA, with NumPy.
+
+    positions may be an array of any shape. Only the bytes holding the
+    positions are read, so nothing else is decoded.
+    """
+    bases = np.frombuffer(packed.bases, dtype=np.uint8)
+    sentinels = np.frombuffer(packed.sentinels, dtype=np.uint8)
+    codes = ((bases[positions >> 2] >> ((positions & 3) << 1)) & 3) + 1
+    codes[((sentinels[positions >> 3] >> (positions & 7)) & 1) == 1] = 0
+    return codes.astype(np.uint8)
+
+
+def unpack_codes(packed):
+    """Return the symbol codes of a PackedDNA, decoded a chunk at a time."""
+    codes = np.empty(len(packed), dtype=np.uint8)
+    for start in xrange(0, len(packed), CHUNK_SIZE):
+        stop = min(start + CHUNK_SIZE, len(packed))
+        codes[start:stop] = codes_at(packed, np.arange(start, stop))
+    return codes
+
+
+def pack_codes(chunks):
+    """
+    Return a PackedDNA of an iterable of NumPy arrays of symbol codes.
+
+    Every chunk but the last must hold a multiple of 8 codes, so that each
+    is packed into whole bytes on its own.
+    """
+    bases, sentinels, length = bytearray(), bytearray(), 0
+    totals = np.zeros(len(DNA_ALPHABET), dtype=np.int64)
+    for codes in chunks:
+        n = len(codes)
+        totals += np.bincount(codes, minlength=len(DNA_ALPHABET))
+        slots = np.zeros(-(-n // 8) * 8, dtype=np.uint8)
+        slots[:n] = np.maximum(codes, 1) - 1
+        flags = np.zeros(len(slots), dtype=np.uint8)
+        flags[:n] = codes == 0
+        packed = (slots.reshape(-1, 4) << _SLOT_SHIFTS).sum(axis=1)
+        bases.extend(packed[:-(-n // 4)].astype(np.uint8).tostring())
+        packed = (flags.reshape(-1, 8) << _BIT_SHIFTS).sum(axis=1)
+        sentinels.extend(packed.astype(np.uint8).tostring())
+        length += n
+    return PackedDNA.from_buffers(
+        bases, sentinels, length,
+        [(c, int(totals[x])) for x, c in enumerate(DNA_ALPHABET)])
+
+
+if np is not None:
+    _SLOT_SHIFTS = np.arange(0, 8, 2, dtype=np.uint8)
+    _BIT_SHIFTS = np.arange(8, dtype=np.uint8)
+
+
+def reverse_complement(seq):
+    """Return the reverse complement of a string of DNA symbols."""
+    if seq.translate(None, DNA_ALPHABET):
+        raise ValueError(
+            'Invalid DNA symbols: %s' % ''.join(
+                sorted(set(seq.translate(None, DNA_ALPHABET)))))
+    return seq.translate(_COMPLEMENT)[::-1]
@@ -0,0 +1,106 @@
+import gzip
+from itertools import chain
+
+
+'''
+Streaming readers for FASTA and FASTQ files.
+
+Records are parsed line by line, so only the record being read is held in
+memory. Sequences are returned in upper case, and qualities and headers are
+discarded, as are records with an empty sequence. Files compressed with
+gzip are detected by their magic number and decompressed on the fly.
+'''
+
+
+GZIP_MAGIC = '\x1f\x8b'
+
+
+def open_reads(path):
+    """Open a FASTA or FASTQ file for reading, decompressing it if needed."""
+    with open(path, 'rb') as f:
+        magic = f.read(len(GZIP_MAGIC))
+    if magic == GZIP_MAGIC:
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def parse_fasta(lines):
+    """Yield the sequence of each non-empty record in FASTA lines."""
+    chunks = None
+    for line in lines:
+        line = line.strip()
+        if line.startswith('>'):
+            if chunks:
+                yield ''.join(chunks).upper()
+            chunks = []
+        elif line:
+            if chunks is None:
+                raise ValueError('FASTA sequence before first header')
+            chunks.append(line)
+    if chunks:
+        yield ''.join(chunks).upper()
+
+
+def parse_fastq(lines):
+    """
+    Yield the sequence of each non-empty record in FASTQ lines.
+
+    Sequences and qualities may be wrapped over several lines.
+    """
+    lines = iter(lines)
+    for header in lines:
+        header = header.strip()
+        if not header:
+            continue
+        if not header.startswith('@'):
+            raise ValueError('Invalid FASTQ header: %s' % header)
+
+        chunks = []
+        for line in lines:
+            line = line.strip()
+            if line.startswith('+'):
+                break
+            chunks.append(line)
+        else:
+            raise ValueError('Truncated FASTQ record: %s' % header)
+        sequence = ''.join(chunks)
+
+        # Skip as many quality symbols as there are bases
+        quality = 0
+        while quality < len(sequence):
+            line = next(lines, None)
+            if line is None:
+                raise ValueError('Truncated FASTQ record: %s' % header)
+            quality += len(line.strip())
+        if sequence:
+            yield sequence.upper()
+
+
+def read_sequences(source):
+    """
+    Yield the sequences in a FASTA or FASTQ source.
+
+    source may be a path, a file object or any iterable of lines. The format
+    is detected from the first line.
+    """
+    if isinstance(source, basestring):
+        with open_reads(source) as f:
+            for sequence in read_sequences(f):
+                yield sequence
+        return
+
+    lines = iter(source)
+    for first in lines:
+        if first.strip():
+            break
+    else:
+        return
+    lines = chain([first], lines)
+    if first.startswith('>'):
+        parse = parse_fasta
+    elif first.startswith('@'):
+        parse = parse_fastq
+    else:
+        raise ValueError('Unrecognized read format: %s' % first.strip())
+    for sequence in parse(lines):
+        yield sequence
@@ -1,4 +1,30 @@
-from driver.util.graph import Node
+from array import array
+from bisect import bisect_right
+
+from driver.util.dna import CHUNK_SIZE
+from driver.util.dna import codes_at
+from driver.util.dna import pack
+from driver.util.dna import pack_codes
+from driver.util.dna import PackedDNA
+from driver.util.dna import reverse_complement
+from driver.util.fastx import read_sequences
+from driver.util.locate import SampledSuffixArray
+from driver.util.rank import DEFAULT_CHECKPOINT_INTERVAL
+from driver.util.rank import OccurrenceTable
+from driver.util.rank import PackedOccurrenceTable
+from driver.util.rank import text_bytes
+from driver.util.run_length import RunLengthOccurrenceTable
+from driver.util.run_length import RunLengthText
+from driver.util.stats import phase
+from driver.util.storage import load_index
+from driver.util.storage import MappedText
+from driver.util.storage import save_index
+from driver.util.suffix_array import suffix_array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 class IntervalSet(set):
@@ -6,12 +32,97 @@ class IntervalSet(set):
 
 
 class FMIndex(object):
-    def __init__(self, input_str, alphabet=None):
+    def __init__(self, input_str, alphabet=None,
+                 checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL,
+                 sa_sample_rate=None, run_length=False):
+        """
+        Index input_str.
+
+        If sa_sample_rate, k, is given, only the suffix array entries of
+        suffixes starting at a multiple of k, or with a '$', are kept, and
+        the others are recovered by LF-mapping (see driver.util.locate).
+
+        If run_length is set, the BWT and the occurrence counts are stored
+        per run of equal symbols, in space proportional to the number of
+        runs rather than to the length of input_str, and checkpoints are
+        taken every checkpoint_interval runs (see driver.util.run_length).
+        """
         self.input_str = input_str
         self.alphabet = alphabet or sorted(set(input_str))
+        self.checkpoint_interval = checkpoint_interval
+        self.sa_sample_rate = sa_sample_rate
+        self.run_length = run_length
+
+    def build(self, stats=None):
+        """
+        Compute every index structure up front, rather than on first use.
+
+        Useful before sharing the index with other processes, or to separate
+        the cost of building the index from the cost of querying it. If
+        stats, a driver.util.stats.Stats, is given, each structure is timed
+        as a phase of its own.
+        """
+        with phase(stats, 'suffix_array'):
+            self.suffix_array
+        with phase(stats, 'bwt'):
+            self.bwt
+        with phase(stats, 'lex_rank'):
+            self.lex_rank
+        with phase(stats, 'occurrences'):
+            self.occurrences
+        return self
+
+    def reverse(self):
+        """
+        Return an index of the reversed input string.
+
+        Together, an index and its reverse support extending a match in both
+        directions, as used by extract_irreducible. With NumPy, a PackedDNA
+        text is reversed a chunk at a time, without decoding it.
+        """
+        text, n = self.input_str, len(self.input_str)
+        if not isinstance(text, PackedDNA):
+            return self.like(text[::-1])
+        if np is None:
+            return self.like(PackedDNA(text[::-1]))
+        return self.like(pack_codes(
+            codes_at(text, n - 1 - np.arange(
+                start, min(start + CHUNK_SIZE, n)))
+            for start in xrange(0, n, CHUNK_SIZE)))
+
+    def like(self, text):
+        """Return an index of text, with the same settings as this one."""
+        return type(self)(
+            text, alphabet=self.alphabet,
+            checkpoint_interval=self.checkpoint_interval,
+            sa_sample_rate=self.sa_sample_rate, run_length=self.run_length)
+
+    def save(self, path):
+        """
+        Write the index to a file, so that it can be reloaded with load.
+
+        Any structures that have not been computed yet are built first.
+        """
+        save_index(self, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load an index from a file written by save.
+
+        The file is memory-mapped rather than read, so loading takes constant
+        time, and processes that load the same file share its memory.
+        """
+        return load_index(path, cls)
 
     @property
     def suffixes(self):
+        """
+        Return every suffix of the input string.
+
+        This is only provided for inspection. It takes O(C^2) space, so none
+        of the index structures are derived from it.
+        """
         if hasattr(self, '_suffixes'):
             return self._suffixes
         self._suffixes = [
@@ -34,11 +145,23 @@ class FMIndex(object):
 
         Sorted suffixes: '$', 'ACG$', 'CG$', 'G$'
         Suffix array: [3, 0, 1, 2]
+
+        The suffixes are never materialized. Instead the array is built in
+        O(C) time and space with SA-IS (see driver.util.suffix_array).
+
+        With sa_sample_rate, a SampledSuffixArray is returned instead. The
+        BWT is built from the full array first, which is then discarded.
         """
         if hasattr(self, '_suffix_array'):
             return self._suffix_array
-        self._suffix_array = [x[0] for x in sorted(
-            enumerate(self.suffixes), key=lambda x: x[1])]
+        positions = suffix_array(self.input_str)
+        if self.sa_sample_rate is None:
+            self._suffix_array = positions
+            return self._suffix_array
+        if not hasattr(self, '_bwt'):
+            self._bwt = self._build_bwt(positions)
+        self._suffix_array = SampledSuffixArray.from_suffix_array(
+            self, positions, self.sa_sample_rate)
         return self._suffix_array
 
     @property
@@ -52,14 +175,55 @@ class FMIndex(object):
 
         i = 0 => '$'
         i > 0 => S[SA[i] - 1]
+
+        When the input string is a PackedDNA, the BWT is packed as well, and
+        with run_length it is a RunLengthText. With NumPy, the BWT is
+        gathered from the text in a single step, by indexing it with SA - 1.
         """
         if hasattr(self, '_bwt'):
             return self._bwt
-        self._bwt = ''.join([
-            '$' if x == 0 else self.input_str[x - 1]
-            for i, x in enumerate(self.suffix_array)])
+        if self.sa_sample_rate is not None:
+            # Sampling the suffix array builds the BWT from the full array
+            self.suffix_array
+            return self._bwt
+        self._bwt = self._build_bwt(self.suffix_array)
         return self._bwt
 
+    def _build_bwt(self, positions):
+        """Return the BWT of the input string, given its suffix array."""
+        bwt = self._gather_bwt(positions)
+        if self.run_length:
+            return RunLengthText(bwt)
+        return bwt
+
+    def _gather_bwt(self, positions):
+        """
+        Return the BWT uncompressed, as a str or PackedDNA.
+
+        With NumPy, a PackedDNA BWT is gathered and packed a chunk at a time,
+        so neither the text nor the BWT is ever decoded in full.
+        """
+        if np is not None:
+            positions = np.array(positions, dtype=np.int64)
+            if isinstance(self.input_str, PackedDNA):
+                return pack_codes(
+                    self._gather_codes(positions[start:start + CHUNK_SIZE])
+                    for start in xrange(0, len(positions), CHUNK_SIZE))
+            bwt = text_bytes(self.input_str)[positions - 1]
+            bwt[positions == 0] = ord('$')
+            return bwt.tostring()
+        if isinstance(self.input_str, PackedDNA):
+            return pack(
+                '$' if x == 0 else self.input_str[x - 1] for x in positions)
+        return ''.join([
+            '$' if x == 0 else self.input_str[x - 1] for x in positions])
+
+    def _gather_codes(self, positions):
+        """Return the codes of the PackedDNA text before each position."""
+        codes = codes_at(self.input_str, positions - 1)
+        codes[positions == 0] = 0
+        return codes
+
     @property
     def lex_rank(self):
         """
@@ -76,14 +240,28 @@ class FMIndex(object):
             'C': 2,
             'G': 3
         }
+
+        This is the position of the first suffix starting with a in the
+        suffix array, which is simply the count of all smaller symbols.
+        PackedDNA and MappedText texts keep the count of each symbol, and
+        otherwise, with NumPy, the counts are taken in one pass with bincount.
         """
         if hasattr(self, '_lex_rank'):
             return self._lex_rank
+        text = self.input_str
+        totals = getattr(text, 'totals', None)
+        if totals is None and np is not None:
+            sizes = np.bincount(text_bytes(text), minlength=256)
+            totals = dict([
+                (chr(b), int(sizes[b])) for b in np.flatnonzero(sizes)])
+        elif totals is None:
+            totals = dict([(a, text.count(a)) for a in set(text)])
         counts = {}
-        for i, suffix in enumerate(sorted(self.suffixes)):
-            if suffix[0] in counts:
-                continue
-            counts[suffix[0]] = i
+        total = 0
+        for a in sorted(totals):
+            if totals[a]:
+                counts[a] = total
+                total += totals[a]
         self._lex_rank = counts
         return self._lex_rank
 
@@ -106,18 +284,26 @@ class FMIndex(object):
             'A': [1, 1, 1, 2, 3, 3],
             'G': [0, 0, 0, 0, 0, 1]
         }
+
+        The counts are not stored in full. Instead they are sampled every
+        checkpoint_interval positions in an OccurrenceTable, which answers
+        occurrences[a][i] by scanning the BWT from the nearest checkpoint.
+        With run_length, they are counted by whole runs of the BWT instead,
+        in a RunLengthOccurrenceTable, and a PackedDNA BWT is counted by
+        symbol codes in a PackedOccurrenceTable.
         """
         if hasattr(self, '_occurences'):
             return self._occurences
-        occurences = dict([(a, []) for a in self.alphabet])
-        for i, c in enumerate(self.bwt):
-            for a in self.alphabet:
-                occ = occurences[a][i - 1] if len(occurences[a]) else 0
-                if c == a:
-                    # incr occurrences
-                    occ += 1
-                occurences[a].append(occ)
-        self._occurences = occurences
+        if self.run_length:
+            self._occurences = RunLengthOccurrenceTable(
+                self.bwt, self.alphabet, interval=self.checkpoint_interval)
+            return self._occurences
+        if isinstance(self.bwt, PackedDNA):
+            self._occurences = PackedOccurrenceTable(
+                self.bwt, self.alphabet, interval=self.checkpoint_interval)
+            return self._occurences
+        self._occurences = OccurrenceTable(
+            self.bwt, self.alphabet, interval=self.checkpoint_interval)
         return self._occurences
 
     def get_occurrences_lt(self, a, i):
@@ -128,9 +314,9 @@ class FMIndex(object):
         of symbols in bwt greater than symbol, a, at position, i, this tallies
         the count of symbols less than symbol, a, at position, i.
 
-        We do not store this as a property since it can be calculated in
-        O(|ALPHABET|) time, which is essentially constant, by summing the
-        values of @property occurrences for all symbols less than a.
+        The counts are answered by the cumulative less-than checkpoints of
+        @property occurrences, so this runs in O(1) time regardless of the
+        size of the alphabet.
 
         For example, for the input string 'AAGTA$':
 
@@ -143,7 +329,7 @@ class FMIndex(object):
             'G': [1, 1, 2, 3, 4, 5]
         }
         """
-        return sum([self.occurrences[c][i] for c in self.alphabet if c < a])
+        return self.occurrences.rank_lt(a, i)
 
     def _update_backward(self, l, u, a):
         """
@@ -161,18 +347,26 @@ class FMIndex(object):
         using SA, such that S[SA[x]:] should contain the query string
         for each x in [l', u'].
         """
-        rank = self.lex_rank[a]
-        occ = self.occurrences[a]
-        return (rank + occ[l - 1], rank + occ[u] - 1)
+        rank = self.lex_rank.get(a)
+        if rank is None:
+            # a does not occur, so a + s cannot either
+            rank = self.occurrences.rank_lt(a, len(self.bwt) - 1)
+            return (rank, rank - 1)
+        occ = self.occurrences.rank
+        return (rank + occ(a, l - 1), rank + occ(a, u) - 1)
 
     def _update_forward_backward(self, l, u, ll, uu, a):
         """ll, uu = l', u'."""
-        ll += self.get_occurrences_lt(a, u) - self.get_occurrences_lt(a, l - 1)
-        uu = ll + self.occurrences[a][u] - self.occurrences[a][l - 1] - 1
+        occ_lt = self.occurrences.rank_lt
+        ll += occ_lt(a, u) - occ_lt(a, l - 1)
+        occ = self.occurrences.rank
+        uu = ll + occ(a, u) - occ(a, l - 1) - 1
         l, u = self._update_backward(l, u, a)
         return (l, u, ll, uu)
 
     def _init_search_interval(self, a):
+        if a not in self.lex_rank:
+            return self._update_backward(0, len(self.bwt) - 1, a)
         l = self.lex_rank[a]
         try:
             u = self.lex_rank[self.alphabet[self.alphabet.index(a) + 1]] - 1
@@ -180,6 +374,15 @@ class FMIndex(object):
             u = len(self.suffix_array) - 1
         return (l, u)
 
+    def _init_bi_interval(self, a):
+        """
+        Return the intervals of a in the index and in its reverse.
+
+        A single symbol reads the same reversed, so both are the same.
+        """
+        l, u = self._init_search_interval(a)
+        return (l, u, l, u)
+
     def backward_search(self, query):
         """
         Find the position of a substring within the input string.
@@ -195,8 +398,13 @@ class FMIndex(object):
         This function will return [4, 5], which corresponds to matches at
         positions S[6] and SA[1] in S, or S[6:9] and S[1:4].
 
+        A query containing symbols that are not in S gives an empty range,
+        where u < l, and an empty query matches every suffix.
+
         Runs in O(|query|) time
         """
+        if not query:
+            return 0, len(self.bwt) - 1
         l, u = self._init_search_interval(query[-1])
 
         i = len(query) - 2
@@ -206,53 +414,460 @@ class FMIndex(object):
 
         return l, u
 
+    def backward_search_many(self, patterns):
+        """
+        Run backward_search for every pattern in a batch.
+
+        Rather than searching for each pattern in turn, the intervals of all
+        patterns are advanced together, one symbol at a time from the end,
+        with NumPy (see OccurrenceTable.rank_many). This removes most of the
+        per-symbol interpreter overhead when searching for many patterns.
+
+        Returns an array with an (l, u) row for each pattern, equal to the
+        result of backward_search. Symbols missing from the index give an
+        empty interval, and an empty pattern matches every suffix. Without
+        NumPy, this falls back to calling backward_search for each pattern.
+        """
+        patterns = list(patterns)
+        if np is None:
+            return [self.backward_search(p) for p in patterns]
+
+        occurrences = self.occurrences
+        n = len(self.bwt)
+        if not hasattr(self, '_lt_table'):
+            self._lt_table = np.array(
+                [occurrences.rank_lt(chr(b), n - 1) for b in xrange(256)],
+                dtype=np.int64)
+
+        lengths = np.array([len(p) for p in patterns], dtype=np.int64)
+        ends = np.cumsum(lengths)
+        text = np.frombuffer(''.join(patterns), dtype=np.uint8)
+        l = np.zeros(len(patterns), dtype=np.int64)
+        u = np.empty(len(patterns), dtype=np.int64)
+        u.fill(n - 1)
+
+        # The ids of the patterns that still have symbols to search
+        active = np.flatnonzero(lengths)
+        t = 0
+        while active.size:
+            codes = text[ends[active] - 1 - t]
+            lt = self._lt_table[codes]
+            l[active] = lt + occurrences.rank_many(codes, l[active] - 1)
+            u[active] = lt + occurrences.rank_many(codes, u[active]) - 1
+            t += 1
+            active = active[(u[active] >= l[active]) & (lengths[active] > t)]
+
+        return np.column_stack((l, u))
+
+
+class _ReadTable(object):
+    """
+    An open addressing hash table of read ids, used to drop duplicates.
+
+    The hash of every read and the slots of the table are kept in typed
+    arrays, so the table costs 24 to 40 bytes per read, where a dict of
+    hashes to ids would cost around 100. The reads themselves are not
+    stored, and are compared by the caller.
+    """
+
+    def __init__(self):
+        self.hashes = array('l')
+        self.slots = array('l', [-1]) * 8
+
+    def add(self, read, same):
+        """
+        Add a read, unless it is a duplicate.
+
+        same(read_id, read) tests whether the read is the same as an earlier
+        read with the same hash. Returns whether the read was added, in which
+        case its id is the number of reads added before it.
+        """
+        h = hash(read)
+        slots, mask = self.slots, len(self.slots) - 1
+        i = h & mask
+        while slots[i] >= 0:
+            if self.hashes[slots[i]] == h and same(slots[i], read):
+                return False
+            i = (i + 1) & mask
+        slots[i] = len(self.hashes)
+        self.hashes.append(h)
+        if 2 * len(self.hashes) > len(slots):
+            self._grow()
+        return True
+
+    def _grow(self):
+        slots = array('l', [-1]) * (2 * len(self.slots))
+        mask = len(slots) - 1
+        for read_id, h in enumerate(self.hashes):
+            i = h & mask
+            while slots[i] >= 0:
+                i = (i + 1) & mask
+            slots[i] = read_id
+        self.slots = slots
+
+
+class TextReads(object):
+    """
+    A read-only sequence of the reads in a library, sliced from its text.
+
+    Used in place of a list of reads for libraries streamed from files, so
+    the reads are never stored apart from the text.
+    """
+
+    def __init__(self, lib):
+        self.lib = lib
+
+    def __len__(self):
+        return len(self.lib.offsets)
+
+    def __getitem__(self, read_id):
+        offsets = self.lib.offsets
+        if read_id < 0:
+            read_id += len(offsets)
+        if not 0 <= read_id < len(offsets):
+            raise IndexError('read id out of range')
+        start = offsets[read_id]
+        if read_id + 1 < len(offsets):
+            end = offsets[read_id + 1] - 1
+        else:
+            end = len(self.lib.concat_reads) - 1
+        return self.lib.concat_reads[start:end]
+
+    def __iter__(self):
+        for read_id in xrange(len(self)):
+            yield self[read_id]
+
 
 class ReadLibrary(object):
-    def __init__(self, reads):
-        self.reads = dict([(r, Node(r)) for r in reads])
-        self.concat_reads = '$' + '$'.join(self.reads) + '$'
+    """
+    A set of unique reads, concatenated into a single text for indexing.
+
+    Each read is identified by its position in reads, and offsets records
+    where each read starts in concat_reads, so that any position in the text
+    can be mapped back to its read without inspecting the text.
+
+    For example, for the reads 'ACG' and 'TA':
+
+    concat_reads: '$ACG$TA$'
+    offsets: [1, 5]
+
+    If dna is True, the reads must only contain the bases ACGT, and
+    concat_reads is stored as a PackedDNA, using 3 bits per base.
+    """
+
+    def __init__(self, reads, dna=False):
+        unique, total = {}, 0
+        for read in reads:
+            unique[read] = None
+            total += 1
+        self.duplicates = total - len(unique)
+        self._concatenate(unique.keys(), dna)
+
+    def _concatenate(self, reads, dna):
+        self.reads = reads
+        self.offsets = array('l')
+        offset = 1
+        for read in self.reads:
+            self.offsets.append(offset)
+            offset += len(read) + 1
+        if dna:
+            self.concat_reads = PackedDNA('$')
+            for read in self.reads:
+                self.concat_reads.extend(read + '$')
+        else:
+            self.concat_reads = '$' + '$'.join(self.reads) + '$'
+
+    @classmethod
+    def from_text(cls, concat_reads):
+        """
+        Recover the library that concat_reads was built from.
+
+        Reads keep the order they have in the text, so that read ids agree
+        with any index built over it.
+        """
+        lib = cls([])
+        lib.concat_reads = concat_reads
+        text = str(concat_reads)
+        lib.reads = text[1:-1].split('$') if len(text) > 2 else []
+        offset = 1
+        for read in lib.reads:
+            lib.offsets.append(offset)
+            offset += len(read) + 1
+        return lib
+
+    @classmethod
+    def from_stream(cls, reads, dna=False):
+        """
+        Build a library from an iterable of reads, such as a file parser.
+
+        Each read is appended to the text as it arrives, and reads is left
+        as a view of the text, so the library holds a single copy of the
+        bases. Without dna, the text grows in a bytearray, which is then
+        wrapped in a MappedText rather than copied into a str. Duplicates are
+        found by hash (see _ReadTable), and only the first copy of each read
+        is kept, in the order the reads arrive.
+        """
+        lib = cls([])
+        lib.reads = TextReads(lib)
+        if dna:
+            text = PackedDNA('$')
+        else:
+            text, totals = bytearray('$'), {'$': 1}
+
+        def same(read_id, read):
+            start = lib.offsets[read_id]
+            return text[start:start + len(read) + 1] == read + '$'
+
+        table, offset, total = _ReadTable(), 1, 0
+        for read in reads:
+            total += 1
+            if not table.add(read, same):
+                continue
+            lib.offsets.append(offset)
+            offset += len(read) + 1
+            text.extend(read + '$')
+            if not dna:
+                totals['$'] += 1
+                for c in set(read):
+                    totals[c] = totals.get(c, 0) + read.count(c)
+
+        if dna:
+            lib.concat_reads = text
+        else:
+            lib.concat_reads = MappedText(buffer(text), 0, len(text), totals)
+        lib.duplicates = total - len(lib.offsets)
+        return lib
+
+    @classmethod
+    def from_fastx(cls, source, dna=False):
+        """
+        Build a library from a FASTA or FASTQ file, which may be gzipped.
+
+        source may also be a file object, or any iterable of lines.
+        """
+        return cls.from_stream(read_sequences(source), dna=dna)
+
+    def read_at(self, position):
+        """
+        Return the id of the read at a position in concat_reads.
+
+        The '$' that follows a read is considered part of that read. Runs in
+        O(log N) time, where N is the number of reads.
+        """
+        return bisect_right(self.offsets, position) - 1
 
+    def with_reverse_complements(self):
+        """
+        Return a new library with each read followed by its reverse complement.
 
-def find_intervals(index, target, tau=3):
+        Read i becomes reads 2 * i and 2 * i + 1 of the new library, whose
+        text is indexed by an FMDIndex. A read that is the reverse complement
+        of an earlier read is a duplicate of it on the other strand, so it is
+        dropped. The reads must only contain the bases ACGT.
+        """
+        reads, seen, duplicates = [], set(), 0
+        for read in self.reads:
+            if read in seen:
+                duplicates += 1
+                continue
+            complement = reverse_complement(read)
+            seen.add(complement)
+            reads.extend([read, complement])
+        lib = type(self)([])
+        lib.duplicates = self.duplicates + duplicates
+        lib._concatenate(reads, isinstance(self.concat_reads, PackedDNA))
+        return lib
+
+    def without(self, read_ids):
+        """Return a new library of all but the given reads, in order."""
+        skip = set(read_ids)
+        lib = type(self)([])
+        lib.duplicates = self.duplicates
+        lib._concatenate(
+            [read for i, read in enumerate(self.reads) if i not in skip],
+            isinstance(self.concat_reads, PackedDNA))
+        return lib
+
+
+def find_contained(lib, index, batch_size=1024, both_strands=False):
+    """
+    Find the reads that are contained in other reads.
+
+    Each read occurs once in the text of the library as itself, so a read
+    whose backward search finds more than one match also occurs inside some
+    other read. Reads are searched batch_size at a time with
+    backward_search_many. Runs in O(C) time.
+
+    If both_strands is True, lib is a library of reads and their reverse
+    complements, as indexed by an FMDIndex. A read that is its own reverse
+    complement then occurs twice as itself, once as each strand, so it is
+    only contained if it has a third match.
+
+    Returns the ids of the contained reads, in order.
+    """
+    reads = lib.reads
+    contained = []
+    for start in xrange(0, len(reads), batch_size):
+        batch = [reads[i] for i in xrange(
+            start, min(start + batch_size, len(reads)))]
+        intervals = index.backward_search_many(batch)
+        for x, (l, u) in enumerate(intervals):
+            read_id = start + x
+            matches = 1
+            if both_strands and reads[read_id ^ 1] == batch[x]:
+                matches = 2
+            if batch[x] and u - l + 1 > matches:
+                contained.append(read_id)
+    return contained
+
+
+def find_intervals(index, target, tau=3, bidirectional=False, stats=None):
+    """
+    Find the reads with a prefix matching a suffix of target.
+
+    Returns (l, u, label) for each suffix, label, of target at least tau
+    symbols long that is also the prefix of some read, where (l, u) is the
+    interval of '$' + label in the suffix array.
+
+    If bidirectional is True, intervals are instead (l, u, l_, u_, label),
+    where (l_, u_) is the interval of the reverse of '$' + label in the index
+    of the reversed text, as needed by extract_irreducible. For an FMDIndex,
+    it is the interval of the reverse complement of '$' + label instead.
+
+    If stats is given, the extensions made and intervals found are counted.
+    """
     intervals = IntervalSet()
 
     i = len(target) - 2
-    l, u = index._init_search_interval(target[-1])
-    l_, u_ = l, u
+    l, u, l_, u_ = index._init_bi_interval(target[-1])
 
     while l <= u and i >= 0:
         if len(target) - i > tau:
             ll, uu, ll_, uu_ = index._update_forward_backward(
                 l, u, l_, u_, '$')
             if ll <= uu:
-                intervals.add((ll, uu, target[i + 1:]))
-                # intervals.add((ll, uu, ll_, uu_, target[i + 1:]))
+                if bidirectional:
+                    intervals.add((ll, uu, ll_, uu_, target[i + 1:]))
+                else:
+                    intervals.add((ll, uu, target[i + 1:]))
         l, u, l_, u_ = index._update_forward_backward(l, u, l_, u_, target[i])
         i -= 1
+
+    if stats is not None:
+        _count_extensions(stats, len(target), i, tau)
+        stats.count('intervals_found', len(intervals))
     return intervals
 
 
-def extract_irreducible(index, index_, intervals):
+def iter_overlaps(index, target, tau=3, max_overlaps=None, stats=None):
+    """
+    Yield the reads with a prefix matching a suffix of target, longest first.
+
+    Like find_intervals, but yields (l, u, overlap length) for each suffix
+    of target at least tau symbols long, in order of decreasing overlap
+    length, and no label strings are built. Only the interval in the index
+    itself is tracked, so each extension makes two rank queries rather
+    than six.
+
+    The search has to reach the longest overlap before anything can be
+    yielded, but the intervals found on the way are kept as small tuples,
+    so a caller can take the best overlaps and stop without paying for the
+    rest. If max_overlaps is given, at most that many matches are yielded in
+    total, and the last interval is cut short to fit.
+    """
+    n = len(target)
+    found = []
+
+    i = n - 2
+    l, u = index._init_search_interval(target[-1])
+
+    while l <= u and i >= 0:
+        if n - i > tau:
+            ll, uu = index._update_backward(l, u, '$')
+            if ll <= uu:
+                found.append((ll, uu, n - i - 1))
+        l, u = index._update_backward(l, u, target[i])
+        i -= 1
+
+    if stats is not None:
+        _count_extensions(stats, n, i, tau)
+        stats.count('intervals_found', len(found))
+
+    remaining = max_overlaps
+    for l, u, overlap in reversed(found):
+        if remaining is not None:
+            if remaining <= 0:
+                return
+            u = min(u, l + remaining - 1)
+            remaining -= u - l + 1
+        yield l, u, overlap
+
+
+def _count_extensions(stats, n, i, tau):
+    # A search of a target of length n that stopped before target[i] has
+    # extended by every symbol after it, and by '$' once the suffix was at
+    # least tau symbols long, so nothing needs counting in the loop
+    sentinels = max(0, min(n - 2, n - tau - 1) - i)
+    stats.count('backward_extensions', n - 2 - i + sentinels)
+
+
+def extract_irreducible(index, index_, intervals, contained=True,
+                        stats=None):
+    """
+    Reduce bidirectional overlap intervals to the irreducible ones.
+
+    index_ is the index of the reversed text of index, or index itself if
+    it is an FMDIndex, whose intervals of reverse complements stand in for
+    those of the reversed text. Every interval is extended to the right, one
+    symbol at a time, until some of the matched reads end. Those reads have
+    the shortest extension past the target, so their overlaps are
+    irreducible, and the overlaps of all the reads that extend further are
+    transitive. Each distinct right extension is followed separately, as in
+    Simpson & Durbin (2010).
+
+    Returns (l, u, label) for each irreducible overlap, where (l, u) is the
+    interval of the matched reads, including their terminating '$'.
+
+    Reads that end without being extended at all are contained in the
+    target. If contained is False they are skipped, rather than being
+    reported as the only irreducible overlaps.
+
+    If stats is given, the extensions made are counted.
+    """
     if len(intervals) == 0:
         return intervals
 
     irreducible = IntervalSet()
 
-    for l, u, l_, u_, overlap in intervals:
-        ll_, uu_, ll, uu = index_._update_forward_backward(l_, u_, l, u, '$')
-        if ll <= uu:
-            irreducible.add((ll, uu, overlap))
+    if contained:
+        if stats is not None:
+            stats.count('backward_extensions', len(intervals))
+        for l, u, l_, u_, overlap in intervals:
+            ll_, uu_, ll, uu = index_._update_forward_backward(
+                l_, u_, l, u, '$')
+            if ll <= uu:
+                irreducible.add((ll, uu, overlap))
 
-    if len(irreducible) != 0:
-        return irreducible
+        if len(irreducible) != 0:
+            return irreducible
+
+    # The symbols that extend a match to the right are those preceding it in
+    # the reversed text, so only they need to be followed
+    symbols = set()
+    for l, u, l_, u_, overlap in intervals:
+        symbols.update(index_.bwt[l_:u_ + 1])
+    symbols.discard('$')
 
-    for a in index.alphabet:
+    for a in sorted(symbols):
+        if stats is not None:
+            stats.count('backward_extensions', len(intervals))
         intervals_a = IntervalSet()
         for l, u, l_, u_, overlap in intervals:
             la_, ua_, la, ua = index_._update_forward_backward(l_, u_, l, u, a)
             if la <= ua:
                 intervals_a.add((la, ua, la_, ua_, overlap))
-        for interval in extract_irreducible(index, index_, intervals_a):
+        for interval in extract_irreducible(
+                index, index_, intervals_a, stats=stats):
             irreducible.add(interval)
 
     return irreducible
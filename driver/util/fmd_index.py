@@ -0,0 +1,95 @@
+from driver.util.dna import BASES
+from driver.util.dna import DNA_ALPHABET
+from driver.util.dna import SENTINEL
+from driver.util.fm_index import FMIndex
+
+
+'''
+A bidirectional FM-index of DNA reads and their reverse complements.
+
+The FMD-index of Li (2012) indexes a text that holds the reverse complement
+of every read alongside the read, such as the text of
+ReadLibrary.with_reverse_complements. A pattern P then occurs exactly as
+often as its reverse complement, so the interval of the reverse complement
+of P in the same index stands in for the interval of P in an index of the
+reversed text. Extending P to the right by a is extending its reverse
+complement to the left by the complement of a, so matches can be extended
+in both directions with a single index, and every overlap between reads on
+either strand is found by searching it.
+'''
+
+
+COMPLEMENT = dict(zip(DNA_ALPHABET, SENTINEL + BASES[::-1]))
+
+
+class FMDIndex(FMIndex):
+    """
+    An FMIndex over both strands of a set of DNA reads.
+
+    Bidirectional intervals are pairs of the interval of a pattern and of its
+    reverse complement, so an FMDIndex is its own reverse, and may be passed
+    as both indexes to extract_irreducible.
+
+    The text must only contain '$' and the bases ACGT, and hold the reverse
+    complement of every read as well as the read.
+    """
+
+    def __init__(self, input_str, *args, **kwargs):
+        super(FMDIndex, self).__init__(input_str, *args, **kwargs)
+        if set(self.alphabet) - set(DNA_ALPHABET):
+            raise ValueError(
+                'Invalid DNA symbols: %s' % ''.join(
+                    sorted(set(self.alphabet) - set(DNA_ALPHABET))))
+        if (input_str.count('A') != input_str.count('T') or
+                input_str.count('C') != input_str.count('G')):
+            raise ValueError(
+                'An FMDIndex needs the reverse complement of every read')
+
+    def reverse(self):
+        raise TypeError(
+            'An FMDIndex is its own reverse, with complemented symbols')
+
+    def _init_bi_interval(self, a):
+        """Return the intervals of a and of its complement."""
+        l, u = self._init_search_interval(a)
+        ll, uu = self._init_search_interval(COMPLEMENT.get(a, a))
+        return (l, u, ll, uu)
+
+    def _update_forward_backward(self, l, u, ll, uu, a):
+        """
+        Extend a pattern, P, to the left by a.
+
+        (l, u) is the interval of P, and (ll, uu) that of its reverse
+        complement, Q. The interval of aP is found by backward search, and
+        that of Q extended by the complement of a lies within (ll, uu). The
+        suffixes in (ll, uu) are sorted by the symbol after Q, which is the
+        complement of the symbol before P, so the interval of Q + '$' comes
+        first, followed by those of the extensions by the complements of T,
+        G, C and A in turn. The occurrences of '$' and of the bases greater
+        than a before P give the offset of the complement of a, in six rank
+        queries.
+        """
+        rank = self.lex_rank.get(a)
+        if rank is None:
+            # a does not occur, so neither do aP or its reverse complement
+            l, u = self._update_backward(l, u, a)
+            return (l, u, ll, ll - 1)
+        occ = self.occurrences.rank
+        lo, hi = occ(a, l - 1), occ(a, u)
+        if a != SENTINEL:
+            occ_lt = self.occurrences.rank_lt
+            sentinels = occ(SENTINEL, u) - occ(SENTINEL, l - 1)
+            smaller = occ_lt(a, u) - occ_lt(a, l - 1)
+            ll += sentinels + (u - l + 1) - smaller - (hi - lo)
+        return (rank + lo, rank + hi - 1, ll, ll + hi - lo - 1)
+
+    def _update_backward_forward(self, l, u, ll, uu, a):
+        """
+        Extend a pattern, P, to the right by a.
+
+        (l, u) is the interval of P, and (ll, uu) that of its reverse
+        complement, Q. This extends Q to the left by the complement of a.
+        """
+        ll, uu, l, u = self._update_forward_backward(
+            ll, uu, l, u, COMPLEMENT.get(a, a))
+        return (l, u, ll, uu)
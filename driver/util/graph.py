@@ -1,3 +1,6 @@
+from array import array
+
+
 class Edge(object):
     def __init__(self, node, label):
         self.node = node
@@ -45,7 +48,241 @@ class Node(object):
         edges = self.in_edges if reverse is True else self.out_edges
         if len(edges) == 0:
             return None
+        return edges
 
     def sorted_edges(self, reverse=False):
         edges = self.edges(reverse=reverse)
         return sorted(edges, key=lambda x: -len(x.label))
+
+
+class NodeView(Node):
+    """
+    A read-only Node backed by a StringGraph.
+
+    Edges are materialized from the graph's arrays on access, with labels
+    sliced from the value of the target node, so nothing is stored per node.
+    """
+
+    visited = False
+
+    def __init__(self, graph, node_id):
+        self.graph = graph
+        self.id = node_id
+
+    @property
+    def value(self):
+        return self.graph.values[self.id]
+
+    @property
+    def out_edges(self):
+        graph = self.graph
+        return [
+            Edge(graph[target], graph.values[target][:overlap])
+            for target, overlap in graph.out_edges(self.id)]
+
+    @property
+    def in_edges(self):
+        graph = self.graph
+        value = self.value
+        return [
+            Edge(graph[source], value[:overlap])
+            for source, overlap in graph.in_edges(self.id)]
+
+    @property
+    def longest_out_edge(self):
+        return _longest(self.out_edges)
+
+    @property
+    def longest_in_edge(self):
+        return _longest(self.in_edges)
+
+    def add_in_edge(self, edge):
+        raise TypeError('NodeView is read-only')
+
+    def add_out_edge(self, edge):
+        raise TypeError('NodeView is read-only')
+
+
+def _longest(edges):
+    """Return the first of the edges with the longest label."""
+    longest = None
+    for edge in edges:
+        if longest is None or len(edge.label) > len(longest.label):
+            longest = edge
+    return longest
+
+
+class StringGraph(object):
+    """
+    An overlap graph stored in compressed sparse row (CSR) form.
+
+    Nodes are identified by integers, 0 to N - 1, and values[i] is the
+    sequence of node i. The out edges of node i are stored as the target ids
+    and overlap lengths in out_targets[out_offsets[i]:out_offsets[i + 1]] and
+    out_overlaps at the same positions. In edges are stored the same way, by
+    source id. Edges of each node keep the order in which they were given.
+
+    Indexing the graph, graph[i], returns a NodeView, so the graph can be
+    used anywhere a list of Nodes is expected, such as base.assemble.
+    """
+
+    def __init__(self, values, sources, targets, overlaps):
+        self.values = values
+        n, m = len(values), len(sources)
+        self._views = {}
+
+        # Count the degree of each node, then accumulate into offsets
+        self.out_offsets = array('l', [0] * (n + 1))
+        self.in_offsets = array('l', [0] * (n + 1))
+        for source in sources:
+            self.out_offsets[source + 1] += 1
+        for target in targets:
+            self.in_offsets[target + 1] += 1
+        for i in xrange(n):
+            self.out_offsets[i + 1] += self.out_offsets[i]
+            self.in_offsets[i + 1] += self.in_offsets[i]
+
+        # Place the out and in adjacency of every edge in a single pass
+        self.out_targets = array('l', [0] * m)
+        self.out_overlaps = array('i', [0] * m)
+        self.in_sources = array('l', [0] * m)
+        self.in_overlaps = array('i', [0] * m)
+        out_next = self.out_offsets[:n]
+        in_next = self.in_offsets[:n]
+        for e in xrange(m):
+            source, target, overlap = sources[e], targets[e], overlaps[e]
+            p = out_next[source]
+            self.out_targets[p], self.out_overlaps[p] = target, overlap
+            out_next[source] = p + 1
+            q = in_next[target]
+            self.in_sources[q], self.in_overlaps[q] = source, overlap
+            in_next[target] = q + 1
+
+    @classmethod
+    def from_edges(cls, values, edges):
+        """Build a graph from (source id, target id, overlap length) tuples."""
+        sources, targets, overlaps = array('l'), array('l'), array('i')
+        for source, target, overlap in edges:
+            sources.append(source)
+            targets.append(target)
+            overlaps.append(overlap)
+        return cls(values, sources, targets, overlaps)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, node_id):
+        if node_id < 0:
+            node_id += len(self)
+        if not 0 <= node_id < len(self):
+            raise IndexError('StringGraph node id out of range')
+        view = self._views.get(node_id)
+        if view is None:
+            view = self._views[node_id] = NodeView(self, node_id)
+        return view
+
+    def __iter__(self):
+        for node_id in xrange(len(self)):
+            yield self[node_id]
+
+    @property
+    def edge_count(self):
+        return len(self.out_targets)
+
+    def out_degree(self, node_id):
+        return self.out_offsets[node_id + 1] - self.out_offsets[node_id]
+
+    def in_degree(self, node_id):
+        return self.in_offsets[node_id + 1] - self.in_offsets[node_id]
+
+    def out_edges(self, node_id):
+        """Return the (target id, overlap length) pairs of a node."""
+        start, end = self.out_offsets[node_id], self.out_offsets[node_id + 1]
+        return zip(self.out_targets[start:end], self.out_overlaps[start:end])
+
+    def in_edges(self, node_id):
+        """Return the (source id, overlap length) pairs of a node."""
+        start, end = self.in_offsets[node_id], self.in_offsets[node_id + 1]
+        return zip(self.in_sources[start:end], self.in_overlaps[start:end])
+
+    @classmethod
+    def from_nodes(cls, nodes):
+        """Build a graph from a list of Nodes, keeping their order."""
+        ids = dict([(node, i) for i, node in enumerate(nodes)])
+        return cls.from_edges(
+            [node.value for node in nodes],
+            [(ids[node], ids[edge.node], len(edge.label))
+             for node in nodes for edge in node.out_edges])
+
+    def _chained(self, node_id):
+        """Return the successor of a node if the two form a chain, else -1."""
+        if self.out_degree(node_id) != 1:
+            return -1
+        target = self.out_targets[self.out_offsets[node_id]]
+        if self.in_degree(target) != 1:
+            return -1
+        return target
+
+    def compact(self):
+        """
+        Merge every maximal non-branching chain of nodes into a unitig.
+
+        A node and its successor are chained when the node has exactly one
+        out edge, and the successor exactly one in edge. Each unitig's value
+        is the sequence spelled by its chain, and the edges between unitigs
+        are the edges of the original graph that do not join a chain.
+
+        Returns a new StringGraph, whose members[i] is an array of the ids
+        of the nodes merged into unitig i, in order.
+        """
+        n = len(self)
+        unitig_of = array('l', [-1] * n)
+        members = []
+
+        def walk(start):
+            chain = array('l', [start])
+            unitig_of[start] = len(members)
+            node_id = self._chained(start)
+            while node_id >= 0 and unitig_of[node_id] < 0:
+                chain.append(node_id)
+                unitig_of[node_id] = len(members)
+                node_id = self._chained(node_id)
+            members.append(chain)
+
+        # Walk from each node that does not continue a chain, then from any
+        # nodes left over, which lie on cycles of chained nodes
+        for node_id in xrange(n):
+            source = -1
+            if self.in_degree(node_id) == 1:
+                source = self.in_sources[self.in_offsets[node_id]]
+            if source < 0 or self._chained(source) != node_id:
+                walk(node_id)
+        for node_id in xrange(n):
+            if unitig_of[node_id] < 0:
+                walk(node_id)
+
+        values = []
+        for chain in members:
+            pieces = [self.values[chain[0]]]
+            for previous, node_id in zip(chain, chain[1:]):
+                overlap = self.out_overlaps[self.out_offsets[previous]]
+                pieces.append(self.values[node_id][overlap:])
+            values.append(''.join(pieces))
+
+        # Keep every edge except those inside a unitig
+        sources, targets, overlaps = array('l'), array('l'), array('i')
+        for node_id in xrange(n):
+            unitig = unitig_of[node_id]
+            internal = members[unitig][-1] != node_id
+            for p in xrange(
+                    self.out_offsets[node_id], self.out_offsets[node_id + 1]):
+                target = self.out_targets[p]
+                if internal and unitig_of[target] == unitig:
+                    continue
+                sources.append(unitig)
+                targets.append(unitig_of[target])
+                overlaps.append(self.out_overlaps[p])
+
+        graph = type(self)(values, sources, targets, overlaps)
+        graph.members = members
+        return graph
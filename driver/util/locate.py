@@ -0,0 +1,143 @@
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+'''
+Sampled suffix arrays, which trade locate time for memory.
+
+A full suffix array stores the position of every suffix, which for a list
+of ints costs over 30 bytes per symbol of text. A sampled suffix array only
+stores some of the positions, and recovers the rest from the BWT by
+LF-mapping, one symbol at a time.
+'''
+
+
+DEFAULT_SAMPLE_RATE = 32
+
+_POPCOUNT = [bin(x).count('1') for x in xrange(256)]
+
+# Rows per block of the mark counts, which must be a multiple of 8
+_BLOCK = 64
+
+
+class SampledSuffixArray(object):
+    """
+    A suffix array that only stores some of its entries.
+
+    Two sets of rows are stored: the rows of suffixes starting with '$',
+    which form a single block of the array, and the rows of suffixes
+    starting at a multiple of rate. Marked rows are recorded in a bitmap,
+    with counts of the marked rows before every block of 64 rows, so the
+    entry of a marked row is found in O(1) time.
+
+    The entry of any other row, i, is found by LF-mapping. The suffix one
+    symbol to its left, a = bwt[i], is at row lex_rank[a] + rank(a, i) - 1,
+    so walking left until a stored row is reached, and adding the number of
+    steps taken, gives its position. Walks take at most rate - 1 steps. In
+    a library of reads, they also stop at the '$' before each read, and
+    rows found by searching for '$' + P are stored outright, so looking up
+    the read an overlap matches costs O(1) time.
+
+    Indexing and len() behave as for the full suffix array.
+    """
+
+    def __init__(self, index, rate, length, sentinel_start, sentinels,
+                 samples, marks, blocks):
+        """
+        Wrap the stored entries of the suffix array of an FMIndex.
+
+        Use from_suffix_array to sample a full suffix array. The structures
+        may also be passed in directly, such as ones loaded from disk.
+        """
+        self.index = index
+        self.rate = rate
+        self.length = length
+        self.sentinel_start = sentinel_start
+        self.sentinels = sentinels
+        self.samples = samples
+        self.marks = marks
+        self.blocks = blocks
+
+    @classmethod
+    def from_suffix_array(cls, index, positions, rate=DEFAULT_SAMPLE_RATE):
+        """Sample the full suffix array, positions, of index."""
+        if rate < 1:
+            raise ValueError('Sample rate must be positive')
+        n = len(positions)
+        if n and index.input_str[n - 1] != '$':
+            # LF-mapping skips the last suffix of a text without one
+            raise ValueError('Sampled suffix arrays need a text ending in $')
+        start = index.lex_rank.get('$', 0)
+        end = start + index.input_str.count('$')
+        sentinels = array('l', positions[start:end])
+
+        if np is not None:
+            positions = np.asarray(positions, dtype=np.int64)
+            marked = positions % rate == 0
+            marked[start:end] = False
+            samples = array('l', positions[marked].tolist())
+            bits = np.zeros(-(-n // 8) * 8, dtype=np.uint8)
+            bits[:n] = marked
+            marks = bytearray(np.packbits(bits.reshape(-1, 8)[:, ::-1]))
+            counts = np.zeros(n + 1, dtype=np.int64)
+            np.cumsum(marked, out=counts[1:])
+            blocks = array('l', counts[::_BLOCK].tolist())
+        else:
+            samples = array('l')
+            marks = bytearray(-(-n // 8))
+            for i, position in enumerate(positions):
+                if position % rate == 0 and not start <= i < end:
+                    marks[i >> 3] |= 1 << (i & 7)
+                    samples.append(position)
+            blocks = array('l')
+            total = 0
+            for b in xrange(0, len(marks), _BLOCK // 8):
+                blocks.append(total)
+                total += sum([_POPCOUNT[x] for x in marks[b:b + _BLOCK // 8]])
+            if n % _BLOCK == 0:
+                blocks.append(total)
+
+        return cls(index, rate, n, start, sentinels, samples, marks, blocks)
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        for i in xrange(self.length):
+            yield self[i]
+
+    def _rank(self, i):
+        """Return the number of marked rows before row i."""
+        marks = self.marks
+        total = self.blocks[i // _BLOCK]
+        for b in xrange((i // _BLOCK) * (_BLOCK // 8), i >> 3):
+            total += _POPCOUNT[marks[b]]
+        return total + _POPCOUNT[marks[i >> 3] & ((1 << (i & 7)) - 1)]
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.length
+        if not 0 <= i < self.length:
+            raise IndexError('suffix array index out of range')
+        start = self.sentinel_start
+        end = start + len(self.sentinels)
+        if start <= i < end:
+            return self.sentinels[i - start]
+
+        index = self.index
+        bwt, lex_rank = index.bwt, index.lex_rank
+        rank = index.occurrences.rank
+        marks = self.marks
+        steps = 0
+        while True:
+            if marks[i >> 3] & (1 << (i & 7)):
+                return self.samples[self._rank(i)] + steps
+            a = bwt[i]
+            i = lex_rank[a] + rank(a, i) - 1
+            steps += 1
+            if start <= i < end:
+                return self.sentinels[i - start] + steps
@@ -0,0 +1,331 @@
+from array import array
+from bisect import bisect_left
+
+from driver.util.dna import CHUNK_SIZE
+from driver.util.dna import codes_at
+from driver.util.dna import DNA_ALPHABET
+from driver.util.dna import PackedDNA
+from driver.util.dna import SYMBOL_CODES
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+DEFAULT_CHECKPOINT_INTERVAL = 32
+
+
+def text_bytes(text):
+    """
+    Return a NumPy view of the bytes of a str or MappedText, without a copy.
+
+    A MappedText is viewed in place in its memory map, so its pages stay
+    shared with other processes that map the same file.
+    """
+    if hasattr(text, 'buf'):
+        return np.frombuffer(
+            text.buf, dtype=np.uint8, count=len(text), offset=text.offset)
+    return np.frombuffer(text, dtype=np.uint8)
+
+
+def symbols_at(text, positions):
+    """
+    Return the byte of each position in text, with NumPy.
+
+    positions may be an array of any shape. A PackedDNA is read from its
+    packed bases and sentinel bitmap, so no part of it is decoded beyond the
+    positions asked for.
+    """
+    if not isinstance(text, PackedDNA):
+        return text_bytes(text)[positions]
+    return _DNA_BYTES[codes_at(text, positions)]
+
+
+if np is not None:
+    _DNA_BYTES = np.frombuffer(DNA_ALPHABET, dtype=np.uint8)
+
+
+class SymbolOccurrences(object):
+    """
+    A read-only view of the occurrence counts of a single symbol.
+
+    Behaves like the list of counts for the symbol, so occurrences[a][i]
+    is the number of times a appears in bwt[0..i]. As a special case,
+    occurrences[a][-1] is 0, which is the count before the first position.
+    """
+
+    def __init__(self, table, symbol):
+        self.table = table
+        self.symbol = symbol
+
+    def __len__(self):
+        return len(self.table.bwt)
+
+    def __getitem__(self, i):
+        return self.table.rank(self.symbol, i)
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self.table.rank(self.symbol, i)
+
+
+class OccurrenceTable(object):
+    """
+    A sampled rank structure over the Burrows-Wheeler Transform.
+
+    Rather than storing the count of every symbol at every position, the
+    counts are stored every k positions (checkpoints) in a typed array.
+    The count at any other position is recovered by counting the symbol
+    in the BWT between the position and its nearest checkpoint, which
+    scans at most k / 2 symbols.
+
+    The table also keeps cumulative checkpoints of the count of all symbols
+    less than each symbol, so that the occurrences of smaller symbols can be
+    found with a single lookup rather than a sum over the alphabet.
+
+    Smaller intervals use more memory but answer queries faster. The table
+    costs roughly 16 * |alphabet| * C / k bytes, where C is the length of
+    the BWT.
+    """
+
+    def __init__(self, bwt, alphabet, interval=DEFAULT_CHECKPOINT_INTERVAL,
+                 checkpoints=None, lt_checkpoints=None):
+        """
+        Build the table for a BWT.
+
+        checkpoints and lt_checkpoints may be passed in to restore a table
+        that was computed previously, such as one loaded from disk.
+        """
+        if interval < 1:
+            raise ValueError('Checkpoint interval must be positive')
+        self.bwt = bwt
+        self.alphabet = alphabet
+        self.interval = interval
+        self.symbols = sorted(alphabet)
+        self.positions = dict([(a, x) for x, a in enumerate(self.symbols)])
+        self.views = dict([(a, SymbolOccurrences(self, a)) for a in alphabet])
+        self.checkpoints = checkpoints or self._build_checkpoints()
+        self.lt_checkpoints = lt_checkpoints or self._build_lt_checkpoints()
+        self._vectors = None
+
+        # Symbols to delete from a slice of the BWT to leave only those
+        # smaller than the x-th smallest symbol
+        self.deletions = [
+            ''.join([chr(c) for c in xrange(256) if chr(c) not in smaller])
+            for smaller in [
+                frozenset(self.symbols[:x])
+                for x in xrange(len(self.symbols) + 1)]]
+
+    def _build_checkpoints(self):
+        """
+        Count each symbol up to every checkpoint.
+
+        checkpoints[a][j] is the count of a in bwt[0:j * interval]. With
+        NumPy, the counts between checkpoints are taken with bincount, over
+        a chunk of the BWT at a time (see symbols_at).
+        """
+        bwt, interval = self.bwt, self.interval
+        checkpoints = dict([(a, array('l', [0])) for a in self.alphabet])
+        if np is not None:
+            rows = np.empty(256, dtype=np.intp)
+            rows.fill(len(self.symbols))
+            for x, a in enumerate(self.symbols):
+                rows[ord(a)] = x
+            width = len(self.symbols) + 1
+            totals = np.zeros(width, dtype=np.int64)
+            step = interval * max(1, CHUNK_SIZE // interval)
+            for start in xrange(0, len(bwt), step):
+                stop = min(start + step, len(bwt))
+                x = rows[symbols_at(bwt, np.arange(start, stop))]
+                blocks = -(-(stop - start) // interval)
+                counts = np.bincount(
+                    np.arange(stop - start) // interval * width + x,
+                    minlength=blocks * width).reshape(blocks, width)
+                counts = totals + np.cumsum(counts, axis=0)
+                totals = counts[-1]
+                for x, a in enumerate(self.symbols):
+                    checkpoints[a].extend(counts[:, x].tolist())
+            return checkpoints
+        for start in xrange(0, len(bwt), interval):
+            end = start + interval
+            for a, counts in checkpoints.iteritems():
+                counts.append(counts[-1] + bwt.count(a, start, end))
+        return checkpoints
+
+    def _build_lt_checkpoints(self):
+        """
+        Accumulate the checkpoints of every smaller symbol.
+
+        lt_checkpoints[x][j] is the count of symbols smaller than the x-th
+        smallest symbol in bwt[0:j * interval]. The final entry counts every
+        symbol in the alphabet.
+        """
+        lt_checkpoints = []
+        totals = array('l', [0] * len(self.checkpoints[self.symbols[0]]))
+        for a in self.symbols + [None]:
+            lt_checkpoints.append(array('l', totals))
+            if a is not None:
+                for j, count in enumerate(self.checkpoints[a]):
+                    totals[j] += count
+        return lt_checkpoints
+
+    def __getitem__(self, a):
+        return self.views[a]
+
+    def __iter__(self):
+        return iter(self.alphabet)
+
+    def __len__(self):
+        return len(self.alphabet)
+
+    def items(self):
+        return [(a, self.views[a]) for a in self.alphabet]
+
+    def rank(self, a, i):
+        """
+        Return the number of occurrences of a in bwt[0..i].
+
+        Symbols that are not in the alphabet never occur.
+        """
+        checkpoints = self.checkpoints.get(a)
+        if checkpoints is None:
+            return 0
+        k = self.interval
+        i += 1
+        j = (i + k // 2) // k
+        if j >= len(checkpoints):
+            j = len(checkpoints) - 1
+        offset = j * k
+        if offset <= i:
+            return checkpoints[j] + self.bwt.count(a, offset, i)
+        return checkpoints[j] - self.bwt.count(a, i, offset)
+
+    def rank_lt(self, a, i):
+        """
+        Return the number of symbols smaller than a in bwt[0..i].
+
+        Only symbols in the alphabet are counted. a itself does not need to
+        be in the alphabet.
+        """
+        x = self.positions.get(a)
+        if x is None:
+            x = bisect_left(self.symbols, a)
+        checkpoints = self.lt_checkpoints[x]
+        deletions = self.deletions[x]
+        k = self.interval
+        i += 1
+        j = (i + k // 2) // k
+        if j >= len(checkpoints):
+            j = len(checkpoints) - 1
+        offset = j * k
+        if offset <= i:
+            window = self.bwt[offset:i]
+            return checkpoints[j] + len(window.translate(None, deletions))
+        window = self.bwt[i:offset]
+        return checkpoints[j] - len(window.translate(None, deletions))
+
+    def vectors(self):
+        """
+        Return NumPy copies of the checkpoints, used by rank_many.
+
+        The checkpoints are stored as a matrix with a row per symbol, plus a
+        final row of zeros for bytes that are not in the alphabet, and rows
+        maps each byte to its row. The copies are made on first use and
+        cached. The BWT itself is not copied.
+        """
+        if self._vectors is None:
+            rows = np.empty(256, dtype=np.intp)
+            rows.fill(len(self.symbols))
+            counts = np.zeros(
+                (len(self.symbols) + 1, len(self.lt_checkpoints[0])),
+                dtype=np.int64)
+            for x, a in enumerate(self.symbols):
+                rows[ord(a)] = x
+                counts[x] = np.fromiter(
+                    self.checkpoints[a], dtype=np.int64,
+                    count=len(self.checkpoints[a]))
+            self._vectors = (rows, counts)
+        return self._vectors
+
+    def rank_many(self, codes, positions):
+        """
+        Return rank(chr(codes[x]), positions[x]) for every x, with NumPy.
+
+        codes is an array of symbol byte values, and positions an array of
+        positions of the same length. Each count is taken from the checkpoint
+        at or before its position, and the remaining window of at most k
+        symbols is compared against the symbol in a single vectorized step.
+        The windows are read from the BWT as it is stored (see symbols_at).
+        """
+        rows, counts = self.vectors()
+        k = self.interval
+        ends = positions + 1
+        j = ends // k
+        window = (j * k)[:, None] + np.arange(k)
+        valid = window < ends[:, None]
+        np.minimum(window, max(len(self.bwt) - 1, 0), out=window)
+        hits = (symbols_at(self.bwt, window) == codes[:, None]) & valid
+        return counts[rows[codes], j] + hits.sum(axis=1)
+
+
+class PackedOccurrenceTable(OccurrenceTable):
+    """
+    An OccurrenceTable over a PackedDNA BWT.
+
+    Symbols are replaced by their codes in DNA_ALPHABET, and the checkpoints
+    are kept in lists indexed by code. The count from the nearest checkpoint
+    is taken from the packed bytes (see PackedDNA.count_code), so answering
+    a query never decodes the BWT.
+    """
+
+    def __init__(self, bwt, alphabet, interval=DEFAULT_CHECKPOINT_INTERVAL,
+                 checkpoints=None, lt_checkpoints=None):
+        OccurrenceTable.__init__(
+            self, bwt, alphabet, interval=interval, checkpoints=checkpoints,
+            lt_checkpoints=lt_checkpoints)
+        self.code_checkpoints = [
+            self.checkpoints.get(a) for a in DNA_ALPHABET]
+        self.code_lt_checkpoints = [
+            self.lt_checkpoints[bisect_left(self.symbols, a)]
+            for a in DNA_ALPHABET]
+
+        # Every query counts from the nearest checkpoint, j, at j * interval,
+        # except that the last one is at the end of the BWT
+        self.half = interval // 2
+        self.last = len(self.lt_checkpoints[0]) - 1
+        self.length = len(bwt)
+
+    def rank(self, a, i):
+        x = SYMBOL_CODES.get(a)
+        if x is None or self.code_checkpoints[x] is None:
+            return 0
+        k = self.interval
+        i += 1
+        j = (i + self.half) // k
+        if j < self.last:
+            offset = j * k
+        else:
+            j, offset = self.last, self.length
+        if offset <= i:
+            return (self.code_checkpoints[x][j] +
+                    self.bwt.count_code(x, offset, i))
+        return (self.code_checkpoints[x][j] -
+                self.bwt.count_code(x, i, offset))
+
+    def rank_lt(self, a, i):
+        x = SYMBOL_CODES.get(a)
+        if x is None:
+            return OccurrenceTable.rank_lt(self, a, i)
+        k = self.interval
+        i += 1
+        j = (i + self.half) // k
+        if j < self.last:
+            offset = j * k
+        else:
+            j, offset = self.last, self.length
+        if offset <= i:
+            return (self.code_lt_checkpoints[x][j] +
+                    self.bwt.count_less(x, offset, i))
+        return (self.code_lt_checkpoints[x][j] -
+                self.bwt.count_less(x, i, offset))
@@ -0,0 +1,322 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import groupby
+
+from driver.util.rank import DEFAULT_CHECKPOINT_INTERVAL
+from driver.util.rank import OccurrenceTable
+from driver.util.rank import SymbolOccurrences
+from driver.util.rank import text_bytes
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+'''
+Run-length compression of the Burrows-Wheeler Transform.
+
+The BWT of a repetitive text, such as reads sampled at high coverage, is
+made of long runs of the same symbol. A run-length BWT stores the start and
+symbol of each run, and a run-length occurrence table counts symbols by
+whole runs, so both take space proportional to the number of runs, r,
+rather than the length of the text, C. Each rank query finds the run
+holding its position with a binary search, in O(log r) time.
+'''
+
+
+class RunLengthText(object):
+    """
+    A read-only string stored as runs of repeated symbols.
+
+    starts holds the position of the first symbol of every run, and heads
+    the symbol of every run. Supports the parts of the str interface used
+    by the FM-index: len(), indexing and slicing (which return str),
+    iteration, count() and comparison with str.
+    """
+
+    def __init__(self, text=''):
+        text = str(text)
+        self.length = len(text)
+        if np is not None and text:
+            codes = np.frombuffer(text, dtype=np.uint8)
+            starts = np.flatnonzero(codes[1:] != codes[:-1]) + 1
+            starts = np.concatenate(([0], starts))
+            self.starts = array('l', starts.tolist())
+            self.heads = codes[starts].tostring()
+            return
+        self.starts = array('l')
+        heads = []
+        position = 0
+        for head, run in groupby(text):
+            self.starts.append(position)
+            heads.append(head)
+            position += len(list(run))
+        self.heads = ''.join(heads)
+
+    @classmethod
+    def from_runs(cls, starts, heads, length):
+        """Wrap previously computed runs, such as a memory-mapped file."""
+        text = cls()
+        text.starts, text.heads, text.length = starts, heads, length
+        return text
+
+    @property
+    def runs(self):
+        return len(self.heads)
+
+    def __len__(self):
+        return self.length
+
+    def __repr__(self):
+        return 'RunLengthText<%s>' % self
+
+    def __str__(self):
+        return self._decode(0, self.length)
+
+    def __eq__(self, other):
+        return str(self) == str(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __iter__(self):
+        for start in xrange(0, self.length, 4096):
+            for c in self._decode(start, min(start + 4096, self.length)):
+                yield c
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(self.length)
+            if step != 1:
+                return str(self)[i]
+            return self._decode(start, max(start, stop))
+        if i < 0:
+            i += self.length
+        if not 0 <= i < self.length:
+            raise IndexError('RunLengthText index out of range')
+        return self.heads[bisect_right(self.starts, i) - 1]
+
+    def _decode(self, start, stop):
+        if start >= stop:
+            return ''
+        starts, heads = self.starts, self.heads
+        chunks = []
+        k = bisect_right(starts, start) - 1
+        while k < len(heads) and starts[k] < stop:
+            end = starts[k + 1] if k + 1 < len(heads) else self.length
+            chunks.append(heads[k] * (min(end, stop) - max(starts[k], start)))
+            k += 1
+        return ''.join(chunks)
+
+    def count(self, symbol, start=0, end=None):
+        end = self.length if end is None else min(end, self.length)
+        return self._decode(max(start, 0), end).count(symbol)
+
+
+class RunLengthOccurrenceTable(OccurrenceTable):
+    """
+    A rank structure over a RunLengthText, in the style of the r-index.
+
+    The BWT is never scanned. Instead, three structures are kept:
+
+    runs, an OccurrenceTable over the heads of the runs, which counts the
+    runs of each symbol before any run.
+
+    lengths[a][j], the total length of the first j runs of a.
+
+    lt_lengths[x][j], the count of symbols smaller than the x-th smallest
+    symbol before run j * k, where k is the checkpoint interval.
+
+    A run holds a single symbol, so the count of a in bwt[0..i] is the total
+    length of the runs of a before the run holding i, plus the distance into
+    that run if it is a run of a. That costs a binary search over the run
+    starts, plus a rank over the heads. Counting smaller symbols scans the
+    lengths of at most k runs from a checkpoint instead.
+
+    Every structure is sized by the number of runs, r, so the table costs
+    roughly 8 * r + 24 * |alphabet| * r / k bytes, alongside the 9 * r
+    bytes of the RunLengthText.
+    """
+
+    def __init__(self, bwt, alphabet, interval=DEFAULT_CHECKPOINT_INTERVAL,
+                 checkpoints=None, lt_checkpoints=None, lengths=None,
+                 lt_lengths=None):
+        """
+        Build the table for a run-length BWT.
+
+        checkpoints and lt_checkpoints are those of the table over the run
+        heads. They may be passed in, along with lengths and lt_lengths, to
+        restore a table that was computed previously, such as one loaded
+        from disk.
+        """
+        self.bwt = bwt
+        self.alphabet = alphabet
+        self.interval = interval
+        self.symbols = sorted(alphabet)
+        self.positions = dict([(a, x) for x, a in enumerate(self.symbols)])
+        self.views = dict([(a, SymbolOccurrences(self, a)) for a in alphabet])
+        self.runs = OccurrenceTable(
+            bwt.heads, alphabet, interval=interval, checkpoints=checkpoints,
+            lt_checkpoints=lt_checkpoints)
+        self.lengths = lengths or self._build_lengths()
+        self.lt_lengths = lt_lengths or self._build_lt_lengths()
+        self.smaller = [
+            frozenset(self.symbols[:x])
+            for x in xrange(len(self.symbols) + 1)]
+        self._vectors = None
+
+    @property
+    def checkpoints(self):
+        return self.runs.checkpoints
+
+    @property
+    def lt_checkpoints(self):
+        return self.runs.lt_checkpoints
+
+    def _run_lengths(self):
+        """Return the length of every run."""
+        starts = self.bwt.starts
+        if np is not None:
+            return np.diff(np.append(
+                np.array(starts, dtype=np.int64), len(self.bwt)))
+        ends = list(starts[1:]) + [len(self.bwt)]
+        return [end - start for start, end in zip(starts, ends)]
+
+    def _build_lengths(self):
+        """Accumulate the lengths of the runs of each symbol."""
+        heads, run_lengths = self.bwt.heads, self._run_lengths()
+        if np is not None:
+            codes = np.frombuffer(str(heads), dtype=np.uint8)
+            lengths = {}
+            for a in self.alphabet:
+                counts = np.zeros(
+                    self.runs.checkpoints[a][-1] + 1, dtype=np.int64)
+                np.cumsum(run_lengths[codes == ord(a)], out=counts[1:])
+                lengths[a] = array('l', counts.tolist())
+            return lengths
+        lengths = dict([(a, array('l', [0])) for a in self.alphabet])
+        for head, length in zip(heads, run_lengths):
+            counts = lengths.get(head)
+            if counts is not None:
+                counts.append(counts[-1] + length)
+        return lengths
+
+    def _build_lt_lengths(self):
+        """
+        Count the symbols smaller than each symbol before every k-th run.
+
+        With NumPy, these are sampled from a cumulative sum over the runs.
+        """
+        heads, run_lengths = self.bwt.heads, self._run_lengths()
+        samples = range(0, len(heads), self.interval) + [len(heads)]
+        if np is not None:
+            codes = np.frombuffer(str(heads), dtype=np.uint8)
+            totals = np.zeros(len(heads) + 1, dtype=np.int64)
+            lt_lengths = []
+            for a in self.symbols + [None]:
+                lt_lengths.append(array('l', totals[samples].tolist()))
+                if a is not None:
+                    totals[1:] += np.cumsum(
+                        np.where(codes == ord(a), run_lengths, 0))
+            return lt_lengths
+        lt_lengths = []
+        for x in xrange(len(self.symbols) + 1):
+            smaller = frozenset(self.symbols[:x])
+            counts, total = array('l'), 0
+            for k, (head, length) in enumerate(zip(heads, run_lengths)):
+                if k % self.interval == 0:
+                    counts.append(total)
+                if head in smaller:
+                    total += length
+            if len(counts) < len(samples):
+                counts.append(total)
+            lt_lengths.append(counts)
+        return lt_lengths
+
+    def _run(self, i):
+        """Return the run holding position i, and the offset into it."""
+        k = bisect_right(self.bwt.starts, i) - 1
+        return k, i - self.bwt.starts[k] + 1
+
+    def rank(self, a, i):
+        """
+        Return the number of occurrences of a in bwt[0..i].
+
+        Symbols that are not in the alphabet never occur.
+        """
+        lengths = self.lengths.get(a)
+        if lengths is None or i < 0:
+            return 0
+        k, offset = self._run(i)
+        count = lengths[self.runs.rank(a, k - 1)]
+        if self.bwt.heads[k] == a:
+            return count + offset
+        return count
+
+    def rank_lt(self, a, i):
+        """
+        Return the number of symbols smaller than a in bwt[0..i].
+
+        Only symbols in the alphabet are counted. a itself does not need to
+        be in the alphabet.
+        """
+        x = self.positions.get(a)
+        if x is None:
+            x = bisect_left(self.symbols, a)
+        if i < 0:
+            return 0
+        k, offset = self._run(i)
+        j = k // self.interval
+        count = self.lt_lengths[x][j]
+        starts, heads = self.bwt.starts, self.bwt.heads
+        smaller = self.smaller[x]
+        for run in xrange(j * self.interval, k):
+            if heads[run] in smaller:
+                count += starts[run + 1] - starts[run]
+        if heads[k] in smaller:
+            count += offset
+        return count
+
+    def vectors(self):
+        """
+        Return NumPy copies of the runs and lengths, used by rank_many.
+
+        The lengths of every symbol are concatenated, followed by a single 0
+        for bytes that are not in the alphabet, and bases maps each byte to
+        where its lengths begin. The copies are made on first use and cached.
+        """
+        if self._vectors is None:
+            starts = np.array(self.bwt.starts, dtype=np.int64)
+            heads = text_bytes(self.bwt.heads)
+            bases = np.empty(256, dtype=np.int64)
+            lengths, total = [], 0
+            for a in self.symbols:
+                bases[ord(a)] = total
+                lengths.append(np.array(self.lengths[a], dtype=np.int64))
+                total += len(self.lengths[a])
+            bases[[b for b in xrange(256) if chr(b) not in self.positions]] = (
+                total)
+            lengths.append(np.zeros(1, dtype=np.int64))
+            self._vectors = (starts, heads, bases, np.concatenate(lengths))
+        return self._vectors
+
+    def rank_many(self, codes, positions):
+        """
+        Return rank(chr(codes[x]), positions[x]) for every x, with NumPy.
+
+        The run holding each position is found with a single searchsorted,
+        and the runs of each symbol before it with a rank_many over the run
+        heads.
+        """
+        starts, heads, bases, lengths = self.vectors()
+        k = np.searchsorted(starts, positions, side='right') - 1
+        inside = k >= 0
+        k[~inside] = 0
+        known = bases[codes] < len(lengths) - 1
+        j = np.where(known, self.runs.rank_many(codes, k - 1), 0)
+        ranks = lengths[bases[codes] + j]
+        ranks += np.where(heads[k] == codes, positions - starts[k] + 1, 0)
+        ranks[~inside] = 0
+        ranks[~known] = 0
+        return ranks
@@ -0,0 +1,141 @@
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from timeit import default_timer as timer
+
+
+'''
+Opt-in instrumentation for the solvers and the FM-index.
+
+Pass a Stats object as the stats argument of a solver, build_overlap_graph,
+FMIndex.build or assemble, and it records the wall time and peak memory of
+each phase, and counters of the work done on the hot paths. Without one,
+the instrumented functions skip the bookkeeping altogether.
+
+The peak memory of a phase is the high-water mark of the resident set size,
+VmHWM in /proc/self/status, which is reset when the phase starts by writing
+to /proc/self/clear_refs. Resetting it resets the ru_maxrss of getrusage
+too. Where neither file is available, as outside Linux, no peak is recorded.
+
+Counters are updated once per call, from values each function already
+tracks, rather than on every step, so leaving them on costs little.
+'''
+
+
+class Stats(object):
+    """
+    The phases and counters recorded over a run.
+
+    phases maps each phase name, in the order first entered, to its total
+    wall time in seconds and the peak resident memory of the process while
+    it ran, in kilobytes, or None if that cannot be measured. A phase that
+    is entered again keeps the highest peak. counters maps each counter
+    name to its total.
+    """
+
+    def __init__(self):
+        self.phases = OrderedDict()
+        self.counters = Counter()
+        # The peaks so far of the phases that are running, outermost first
+        self._open = []
+
+    @property
+    def peak_rss_kb(self):
+        """Return the highest peak of any phase, or None."""
+        peaks = [
+            phase['peak_rss_kb'] for phase in self.phases.itervalues()
+            if phase['peak_rss_kb'] is not None]
+        return max(peaks) if peaks else None
+
+    @contextmanager
+    def phase(self, name):
+        """Time the body of a with statement as the phase name."""
+        # Resetting the high-water mark loses the peak of the enclosing
+        # phases so far, so fold it into theirs first
+        self._fold_peak()
+        self._open.append(0 if _reset_high_water_mark() else None)
+        start = timer()
+        try:
+            yield
+        finally:
+            seconds = timer() - start
+            self._fold_peak()
+            peak = self._open.pop()
+            previous = self.phases.get(name)
+            if previous is not None:
+                seconds += previous['seconds']
+                peak = _max(peak, previous['peak_rss_kb'])
+            self.phases[name] = {'seconds': seconds, 'peak_rss_kb': peak}
+
+    def _fold_peak(self):
+        """Raise the peaks of the running phases to the high-water mark."""
+        hwm = _high_water_mark()
+        if hwm is not None:
+            self._open = [
+                None if peak is None else max(peak, hwm)
+                for peak in self._open]
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def update(self, counters):
+        """Add counters recorded elsewhere, such as in a worker process."""
+        self.counters.update(counters)
+
+    def as_dict(self):
+        return {
+            'phases': dict(self.phases),
+            'counters': dict(self.counters),
+        }
+
+    def report(self):
+        """Return a table of the phases and counters."""
+        lines = ['%-20s %10s %10s' % ('phase', 'seconds', 'peak MB')]
+        for name, phase in self.phases.iteritems():
+            peak = phase['peak_rss_kb']
+            lines.append('%-20s %10.3f %10s' % (
+                name, phase['seconds'],
+                '-' if peak is None else '%.1f' % (peak / 1024.0)))
+        lines.append('')
+        lines.append('%-20s %10s' % ('counter', 'total'))
+        for name in sorted(self.counters):
+            lines.append('%-20s %10i' % (name, self.counters[name]))
+        return '\n'.join(lines)
+
+
+def _max(a, b):
+    """Return the larger of two peaks, either of which may be None."""
+    if a is None or b is None:
+        return a if b is None else b
+    return max(a, b)
+
+
+def _high_water_mark():
+    """Return the peak resident memory in kilobytes, or None."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except IOError:
+        pass
+    return None
+
+
+def _reset_high_water_mark():
+    """Reset the peak resident memory to the current one, if possible."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except IOError:
+        return False
+    return True
+
+
+@contextmanager
+def phase(stats, name):
+    """Time a phase in stats, or do nothing if stats is None."""
+    if stats is None:
+        yield
+    else:
+        with stats.phase(name):
+            yield
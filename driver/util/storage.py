@@ -0,0 +1,285 @@
+import ctypes
+import json
+import mmap
+import struct
+from array import array
+
+from driver.util.dna import PackedDNA
+from driver.util.locate import SampledSuffixArray
+from driver.util.rank import OccurrenceTable
+from driver.util.rank import PackedOccurrenceTable
+from driver.util.run_length import RunLengthOccurrenceTable
+from driver.util.run_length import RunLengthText
+
+
+'''
+On-disk storage for FM-indexes.
+
+An index file starts with an 8 byte magic string and the length of a JSON
+header, followed by the header and a series of raw sections, each aligned to
+8 bytes. The header records the offset and length of every section, along
+with the class of the index and the options it was built with, which are
+checked when it is loaded.
+
+Loading an index maps the file into memory, and the suffix array (or its
+samples), BWT (or its runs) and rank checkpoints are read directly from the
+mapped pages. Nothing is copied, so loading is near-instant, and processes
+that load the same file share its pages through the operating system's page
+cache.
+
+Integers are stored in native byte order, so index files are not portable
+between platforms with different endianness.
+'''
+
+
+MAGIC = 'DRIVERFM'
+VERSION = 2
+ALIGNMENT = 8
+
+_INT_TYPES = {4: ctypes.c_int32, 8: ctypes.c_int64}
+
+
+class MappedText(object):
+    """
+    A read-only string backed by a region of a memory-mapped file.
+
+    buf may also be any buffer whose slices are str, such as a buffer() over
+    a bytearray.
+
+    Supports the parts of the str interface used by the FM-index: len(),
+    indexing and slicing (which return str), iteration and count().
+    """
+
+    def __init__(self, buf, offset, length, totals):
+        self.buf = buf
+        self.offset = offset
+        self.length = length
+        self.totals = dict(totals)
+
+    def __len__(self):
+        return self.length
+
+    def __str__(self):
+        return self.buf[self.offset:self.offset + self.length]
+
+    def __iter__(self):
+        for start in xrange(0, self.length, 4096):
+            for c in self[start:start + 4096]:
+                yield c
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(self.length)
+            if step != 1:
+                return str(self)[i]
+            return self.buf[self.offset + start:self.offset + max(start, stop)]
+        if i < 0:
+            i += self.length
+        if not 0 <= i < self.length:
+            raise IndexError('MappedText index out of range')
+        return self.buf[self.offset + i]
+
+    def count(self, symbol, start=0, end=None):
+        end = self.length if end is None else min(end, self.length)
+        start = max(start, 0)
+        if start == 0 and end == self.length:
+            return self.totals.get(symbol, 0)
+        return self[start:end].count(symbol)
+
+
+def _text_sections(name, text):
+    """Return the sections and header fields needed to store a text."""
+    if isinstance(text, RunLengthText):
+        sections = [
+            (name + '.starts', text.starts),
+            (name + '.heads', str(text.heads))]
+        totals = {}
+        for k, a in enumerate(text.heads):
+            end = text.starts[k + 1] if k + 1 < text.runs else len(text)
+            totals[a] = totals.get(a, 0) + end - text.starts[k]
+    elif isinstance(text, PackedDNA):
+        sections = [
+            (name + '.bases', text.bases),
+            (name + '.sentinels', text.sentinels)]
+        totals = text.totals
+    else:
+        text = str(text)
+        sections = [(name, text)]
+        totals = dict([(a, text.count(a)) for a in set(text)])
+    return sections, [[ord(a), n] for a, n in totals.iteritems()]
+
+
+def save_index(index, path):
+    """Write an FMIndex, and every structure it derives, to path."""
+    index.build()
+    occurrences = index.occurrences
+    itemsize = array('l').itemsize
+
+    text_sections, text_totals = _text_sections('text', index.input_str)
+    bwt_sections, bwt_totals = _text_sections('bwt', index.bwt)
+    sections = text_sections + bwt_sections
+    sampled = index.suffix_array
+    if isinstance(sampled, SampledSuffixArray):
+        sections.extend([
+            ('sa.sentinels', sampled.sentinels),
+            ('sa.samples', sampled.samples),
+            ('sa.marks', sampled.marks),
+            ('sa.blocks', sampled.blocks)])
+    else:
+        sections.append(('suffix_array', array('l', index.suffix_array)))
+    for x, a in enumerate(occurrences.symbols):
+        sections.append(('checkpoints.%i' % x, occurrences.checkpoints[a]))
+    for x, counts in enumerate(occurrences.lt_checkpoints):
+        sections.append(('lt_checkpoints.%i' % x, counts))
+    if isinstance(occurrences, RunLengthOccurrenceTable):
+        for x, a in enumerate(occurrences.symbols):
+            sections.append(('lengths.%i' % x, occurrences.lengths[a]))
+        for x, counts in enumerate(occurrences.lt_lengths):
+            sections.append(('lt_lengths.%i' % x, counts))
+
+    header = {
+        'version': VERSION,
+        'kind': type(index).__name__,
+        'itemsize': itemsize,
+        'length': len(index.input_str),
+        'dna': isinstance(index.input_str, PackedDNA),
+        'alphabet': [ord(a) for a in index.alphabet],
+        'symbols': [ord(a) for a in occurrences.symbols],
+        'checkpoint_interval': index.checkpoint_interval,
+        'sa_sample_rate': index.sa_sample_rate,
+        'run_length': isinstance(index.bwt, RunLengthText),
+        'sa_sentinel_start': getattr(sampled, 'sentinel_start', None),
+        'lex_rank': [[ord(a), n] for a, n in index.lex_rank.iteritems()],
+        'text_totals': text_totals,
+        'bwt_totals': bwt_totals,
+    }
+
+    # Lay the sections out after the header. Moving the sections changes
+    # the length of the header, so repeat until the layout is stable.
+    layout, offset = [], 0
+    for name, data in sections:
+        size = len(data) * getattr(data, 'itemsize', 1)
+        layout.append((name, offset, len(data)))
+        offset += size + (-size % ALIGNMENT)
+    start = 0
+    while True:
+        header['sections'] = dict([
+            (name, [start + offset, length])
+            for name, offset, length in layout])
+        encoded = json.dumps(header, sort_keys=True)
+        end = 16 + len(encoded)
+        if end <= start:
+            break
+        start = end + (-end % ALIGNMENT)
+    encoded += ' ' * (start - end)
+
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(encoded)))
+        f.write(encoded)
+        for name, data in sections:
+            f.seek(header['sections'][name][0])
+            if isinstance(data, array):
+                data.tofile(f)
+            else:
+                f.write(data)
+        f.write('\0' * (-f.tell() % ALIGNMENT))
+
+
+def _mapped_ints(buf, section, itemsize):
+    offset, length = section
+    return (_INT_TYPES[itemsize] * length).from_buffer(buf, offset)
+
+
+def _mapped_bytes(buf, section):
+    offset, length = section
+    return (ctypes.c_ubyte * length).from_buffer(buf, offset)
+
+
+def _mapped_text(buf, header, name):
+    totals = dict([(chr(a), n) for a, n in header[name + '_totals']])
+    sections = header['sections']
+    if header['dna']:
+        return PackedDNA.from_buffers(
+            _mapped_bytes(buf, sections[name + '.bases']),
+            _mapped_bytes(buf, sections[name + '.sentinels']),
+            header['length'], totals)
+    offset, length = sections[name]
+    return MappedText(buf, offset, length, totals)
+
+
+def load_index(path, cls):
+    """
+    Map an index written by save_index into memory.
+
+    Returns an instance of cls, an FMIndex class, whose structures are all
+    backed by the mapped file. Raises ValueError if the file holds another
+    kind of index, such as an FMIndex loaded as an FMDIndex.
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError('%s is not an FM-index file' % path)
+        size, = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(size))
+        if header['version'] != VERSION:
+            raise ValueError(
+                'Unsupported FM-index file version: %s' % header['version'])
+        if header['kind'] != cls.__name__:
+            raise ValueError('%s holds an %s, not an %s' % (
+                path, header['kind'], cls.__name__))
+        # Private mappings can back ctypes arrays, and their pages are still
+        # shared between processes until written to, which never happens
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    sections, itemsize = header['sections'], header['itemsize']
+    rate = header['sa_sample_rate']
+    index = cls(
+        _mapped_text(buf, header, 'text'),
+        alphabet=[chr(a) for a in header['alphabet']],
+        checkpoint_interval=header['checkpoint_interval'],
+        sa_sample_rate=rate, run_length=header['run_length'])
+    if rate is None:
+        index._suffix_array = _mapped_ints(
+            buf, sections['suffix_array'], itemsize)
+    else:
+        index._suffix_array = SampledSuffixArray(
+            index, rate, header['length'], header['sa_sentinel_start'],
+            _mapped_ints(buf, sections['sa.sentinels'], itemsize),
+            _mapped_ints(buf, sections['sa.samples'], itemsize),
+            _mapped_bytes(buf, sections['sa.marks']),
+            _mapped_ints(buf, sections['sa.blocks'], itemsize))
+    if header['run_length']:
+        starts = _mapped_ints(buf, sections['bwt.starts'], itemsize)
+        offset, runs = sections['bwt.heads']
+        index._bwt = RunLengthText.from_runs(
+            starts, MappedText(buf, offset, runs, {}), header['length'])
+    else:
+        index._bwt = _mapped_text(buf, header, 'bwt')
+    index._lex_rank = dict([(chr(a), n) for a, n in header['lex_rank']])
+
+    symbols = [chr(a) for a in header['symbols']]
+    checkpoints = dict([
+        (a, _mapped_ints(buf, sections['checkpoints.%i' % x], itemsize))
+        for x, a in enumerate(symbols)])
+    lt_checkpoints = [
+        _mapped_ints(buf, sections['lt_checkpoints.%i' % x], itemsize)
+        for x in xrange(len(symbols) + 1)]
+    if not index.run_length:
+        table = OccurrenceTable
+        if isinstance(index._bwt, PackedDNA):
+            table = PackedOccurrenceTable
+        index._occurences = table(
+            index._bwt, index.alphabet, interval=index.checkpoint_interval,
+            checkpoints=checkpoints, lt_checkpoints=lt_checkpoints)
+        return index
+    lengths = dict([
+        (a, _mapped_ints(buf, sections['lengths.%i' % x], itemsize))
+        for x, a in enumerate(symbols)])
+    lt_lengths = [
+        _mapped_ints(buf, sections['lt_lengths.%i' % x], itemsize)
+        for x in xrange(len(symbols) + 1)]
+    index._occurences = RunLengthOccurrenceTable(
+        index._bwt, index.alphabet, interval=index.checkpoint_interval,
+        checkpoints=checkpoints, lt_checkpoints=lt_checkpoints,
+        lengths=lengths, lt_lengths=lt_lengths)
+    return index
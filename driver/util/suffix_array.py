@@ -0,0 +1,209 @@
+"""
+Linear time suffix array construction.
+
+This module implements SA-IS (Nong, Zhang & Chan, 2009), which sorts the
+suffixes of a string by inducing the order of all suffixes from a sorted
+sample of "leftmost S-type" (LMS) suffixes. The text is handled as a list of
+integer symbol codes, so no suffix is ever materialized as a string, and both
+time and space are O(C), where C is the length of the text.
+
+If NumPy is installed, suffix arrays of strings are instead built by prefix
+doubling, which sorts the suffixes by their first 2^h symbols in round h
+with array operations. This takes O(C log C) time per round, and one round
+per doubling of the longest repeat, but runs faster than SA-IS in Python.
+A PackedDNA is decoded to symbol codes a chunk at a time for this, rather
+than to a str.
+"""
+
+from driver.util.dna import PackedDNA
+from driver.util.dna import unpack_codes
+from driver.util.rank import text_bytes
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def _classify(s):
+    """
+    Compute the suffix types of s.
+
+    A suffix is S-type (1) if it is lexographically smaller than the suffix
+    that follows it, and L-type (0) otherwise. The final sentinel is S-type.
+    """
+    n = len(s)
+    t = bytearray(n)
+    t[n - 1] = 1
+    for i in xrange(n - 2, -1, -1):
+        if s[i] < s[i + 1] or (s[i] == s[i + 1] and t[i + 1]):
+            t[i] = 1
+    return t
+
+
+def _buckets(s, k):
+    """Return the size of the bucket for each of the k symbols in s."""
+    sizes = [0] * k
+    for c in s:
+        sizes[c] += 1
+    return sizes
+
+
+def _heads(sizes):
+    heads, total = [], 0
+    for size in sizes:
+        heads.append(total)
+        total += size
+    return heads
+
+
+def _tails(sizes):
+    tails, total = [], 0
+    for size in sizes:
+        total += size
+        tails.append(total)
+    return tails
+
+
+def _induce(s, t, sizes, lms):
+    """
+    Induce the order of every suffix from the sorted LMS suffixes.
+
+    The LMS suffixes are placed at the ends of their buckets, L-type suffixes
+    are then induced by a left to right scan, and S-type suffixes by a right
+    to left scan.
+    """
+    n = len(s)
+    sa = [-1] * n
+
+    tails = _tails(sizes)
+    for i in reversed(lms):
+        c = s[i]
+        tails[c] -= 1
+        sa[tails[c]] = i
+
+    heads = _heads(sizes)
+    for j in xrange(n):
+        i = sa[j] - 1
+        if i >= 0 and not t[i]:
+            c = s[i]
+            sa[heads[c]] = i
+            heads[c] += 1
+
+    tails = _tails(sizes)
+    for j in xrange(n - 1, -1, -1):
+        i = sa[j] - 1
+        if i >= 0 and t[i]:
+            c = s[i]
+            tails[c] -= 1
+            sa[tails[c]] = i
+
+    return sa
+
+
+def _lms_equal(s, t, a, b, is_lms):
+    """Test whether the LMS substrings starting at a and b are identical."""
+    d = 0
+    while True:
+        if s[a + d] != s[b + d] or t[a + d] != t[b + d]:
+            return False
+        if d > 0 and (is_lms(a + d) or is_lms(b + d)):
+            return is_lms(a + d) and is_lms(b + d)
+        d += 1
+
+
+def _sais(s, k):
+    """
+    Return the suffix array of s.
+
+    s is a list of integer codes in the range [0, k), terminated by a unique
+    sentinel code, 0, which is smaller than every other code.
+    """
+    n = len(s)
+    if n == 1:
+        return [0]
+
+    t = _classify(s)
+    sizes = _buckets(s, k)
+
+    def is_lms(i):
+        return i > 0 and t[i] and not t[i - 1]
+
+    lms = [i for i in xrange(1, n) if t[i] and not t[i - 1]]
+
+    # Sort the LMS substrings with a first round of induced sorting
+    sa = _induce(s, t, sizes, lms)
+
+    # Name the LMS substrings by their rank, sharing names between equal ones
+    names = [-1] * n
+    name, prev = -1, -1
+    for p in sa:
+        if not is_lms(p):
+            continue
+        if prev < 0 or not _lms_equal(s, t, prev, p, is_lms):
+            name += 1
+        names[p] = name
+        prev = p
+
+    # Sort the LMS suffixes, recursing if some LMS substrings share a name
+    reduced = [names[i] for i in lms]
+    if name + 1 == len(reduced):
+        reduced_sa = [0] * len(reduced)
+        for i, x in enumerate(reduced):
+            reduced_sa[x] = i
+    else:
+        reduced_sa = _sais(reduced, name + 1)
+
+    return _induce(s, t, sizes, [lms[i] for i in reduced_sa])
+
+
+def _prefix_doubling(codes):
+    """
+    Return the suffix array of a NumPy array of symbol codes.
+
+    Each suffix is ranked by its first k symbols, then re-ranked by the pair
+    of ranks of its first k and next k symbols, doubling k until every rank
+    is distinct. A suffix that runs out of symbols ranks first.
+    """
+    n = len(codes)
+    rank = np.unique(codes, return_inverse=True)[1].astype(np.int64)
+    k = 1
+    while True:
+        second = np.empty(n, dtype=np.int64)
+        second[max(n - k, 0):] = -1
+        second[:max(n - k, 0)] = rank[k:]
+        key = rank * (n + 1) + (second + 1)
+        sa = np.argsort(key, kind='quicksort')
+        key = key[sa]
+        rank = np.empty(n, dtype=np.int64)
+        rank[sa[0]] = 0
+        rank[sa[1:]] = np.cumsum(key[1:] != key[:-1])
+        if rank[sa[-1]] == n - 1:
+            return sa
+        k *= 2
+
+
+def suffix_array(text):
+    """
+    Return the suffix array of text, as a list of starting positions.
+
+    Suffixes are ordered exactly as Python orders strings, so a suffix that
+    is a prefix of another suffix sorts first. Internally, each symbol is
+    replaced with its rank in the alphabet, and a virtual sentinel smaller
+    than every symbol is appended, so text does not need to end with a
+    unique terminator.
+
+    For example, for the string 'ADAM$':
+
+    suffix_array('ADAM$') => [4, 0, 2, 1, 3]
+    """
+    if not len(text):
+        return []
+    if np is not None and isinstance(text, PackedDNA):
+        return _prefix_doubling(unpack_codes(text)).tolist()
+    if np is not None and not isinstance(text, (list, tuple)):
+        return _prefix_doubling(text_bytes(text)).tolist()
+    codes = dict((c, i + 1) for i, c in enumerate(sorted(set(text))))
+    s = [codes[c] for c in text]
+    s.append(0)
+    return _sais(s, len(codes) + 1)[1:]
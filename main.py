@@ -1,5 +1,5 @@
 import logging
-import time
+from timeit import default_timer as timer
 
 from driver.examples import gettysburg, rosalind, tubthumping
 from driver.solvers import bwt_solver, rosalind_solver
@@ -18,19 +18,19 @@ def linebreak(n=1):
 def main():
     print'Reconstructing the Rosalind sequence using our naive solver'
     reads = rosalind.get_reads()
-    start = time.clock()
+    start = timer()
     result = rosalind_solver.solve(reads)
     print 'Found assembly: %s' % result
-    print 'Computed in %fs' % (time.clock() - start)
+    print 'Computed in %fs' % (timer() - start)
 
     linebreak(n=5)
 
     print'Reconstructing the Rosalind sequence using our BWT solver'
     reads = rosalind.get_reads()
-    start = time.clock()
+    start = timer()
     result = bwt_solver.solve(reads, tau=100)
     print 'Found assembly: %s' % result
-    print 'Computed in %fs' % (time.clock() - start)
+    print 'Computed in %fs' % (timer() - start)
 
     linebreak(n=5)
 
@@ -38,11 +38,11 @@ def main():
     print(
         'Reconstructing the Gettysburg Address '
         'from %i reads of %i to %i symbols long' % (N, min_len, max_len))
-    reads = gettysburg.get_reads(N, min_len, max_len)
-    start = time.clock()
+    reads = gettysburg.get_reads(N, min_len, max_len, seed=0)
+    start = timer()
     result = bwt_solver.solve(reads, tau=10)
     print 'Found assembly: %s' % result
-    print 'Computed in %fs' % (time.clock() - start)
+    print 'Computed in %fs' % (timer() - start)
 
     linebreak(n=5)
 
@@ -50,11 +50,11 @@ def main():
     print(
         'Reconstructing Tubthumping '
         'from %i reads of %i to %i symbols long' % (N, min_len, max_len))
-    reads = tubthumping.get_reads(N, min_len, max_len)
-    start = time.clock()
+    reads = tubthumping.get_reads(N, min_len, max_len, seed=0)
+    start = timer()
     result = bwt_solver.solve(reads, tau=25)
     print 'Found assembly: %s' % result
-    print 'Computed in %fs' % (time.clock() - start)
+    print 'Computed in %fs' % (timer() - start)
 
 if __name__ == '__main__':
     main()
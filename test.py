@@ -1,35 +1,68 @@
+import gzip
+import os
+import shutil
+import tempfile
 import unittest
+from StringIO import StringIO
 
+import benchmark
+from driver.examples import genome, gettysburg, rosalind, tubthumping
+from driver.solvers import bwt_solver
+from driver.solvers import rosalind_solver
+from driver.solvers.base import assemble, assemble_contigs, bfs, layout
+from driver.util.dna import DNA_ALPHABET
+from driver.util.dna import PackedDNA
+from driver.util.dna import reverse_complement
+from driver.util.fastx import read_sequences
+from driver.util.fm_index import extract_irreducible
+from driver.util.fm_index import find_contained
 from driver.util.fm_index import find_intervals
 from driver.util.fm_index import FMIndex
+from driver.util.fm_index import iter_overlaps
+from driver.util.fm_index import ReadLibrary
+from driver.util.fmd_index import FMDIndex
+from driver.util.graph import Edge, Node, StringGraph
+from driver.util.run_length import RunLengthText
+from driver.util.stats import Stats
+from driver.util import fm_index, locate, rank, run_length
+from driver.util import suffix_array as suffix_array_module
+from driver.util.suffix_array import suffix_array
 
 
 class TestFMIndex(unittest.TestCase):
 
+    # Extra FMIndex arguments, set by subclasses that run these tests
+    # against other index representations
+    options = {}
+
+    def index(self, text, **options):
+        options.update(self.options)
+        return FMIndex(text, **options)
+
     def test_init(self):
         input_str = '$AGAG$GACA$'
-        fm = FMIndex(input_str)
+        fm = self.index(input_str)
         self.assertEqual(fm.input_str, input_str)
         self.assertEqual(fm.alphabet, sorted(set(input_str)))
         alphabet = 'ADM'
-        fm = FMIndex(input_str, alphabet=alphabet)
+        fm = self.index(input_str, alphabet=alphabet)
         self.assertEqual(fm.alphabet, alphabet)
 
     def test_suffixes(self):
-        fm = FMIndex('ADAM$')
+        fm = self.index('ADAM$')
         for sfx in ['$', 'M$', 'AM$', 'DAM$', 'ADAM$']:
             self.assertTrue(sfx in fm.suffixes)
 
     def test_suffix_array(self):
-        fm = FMIndex('ADAM$')
+        fm = self.index('ADAM$')
         self.assertEqual([4, 0, 2, 1, 3], fm.suffix_array)
 
     def test_bwt(self):
-        fm = FMIndex('AAGTA$')
+        fm = self.index('AAGTA$')
         self.assertEqual('AT$AAG', fm.bwt)
 
     def test_lex_rank(self):
-        fm = FMIndex('ATTAGACCTGCCGGAA$')
+        fm = self.index('ATTAGACCTGCCGGAA$')
         self.assertEqual(fm.lex_rank['$'], 0)
         self.assertEqual(fm.lex_rank['A'], 1)
         self.assertEqual(fm.lex_rank['C'], 6)
@@ -37,16 +70,28 @@ class TestFMIndex(unittest.TestCase):
         self.assertEqual(fm.lex_rank['T'], 14)
 
     def test_occurrences(self):
-        fm = FMIndex('AAGTA$')
+        fm = self.index('AAGTA$')
         # bwt = 'AT$AAG'
-        self.assertEqual(fm.occurrences, {
+        occurrences = dict((a, list(occ)) for a, occ in fm.occurrences.items())
+        self.assertEqual(occurrences, {
             '$': [0, 0, 1, 1, 1, 1],
             'A': [1, 1, 1, 2, 3, 3],
             'G': [0, 0, 0, 0, 0, 1],
             'T': [0, 1, 1, 1, 1, 1], })
 
+    def test_occurrences_checkpoints(self):
+        input_str = '$ATTAGACCTG$CCTGCCGGAA$AGACCTGCCG$GCCGGAATAC$'
+        bwt = self.index(input_str).bwt
+        for interval in [1, 2, 3, 7, 64]:
+            fm = self.index(input_str, checkpoint_interval=interval)
+            for a in fm.alphabet:
+                self.assertEqual(fm.occurrences[a][-1], 0)
+                for i in range(len(bwt)):
+                    self.assertEqual(
+                        fm.occurrences[a][i], bwt[:i + 1].count(a))
+
     def test_get_occurrences_lt(self):
-        fm = FMIndex('AAGTA$')
+        fm = self.index('AAGTA$')
         ran = range(len(fm.bwt))
         # bwt = 'AT$AAG'
         occ_lt_a = [fm.get_occurrences_lt('A', i) for i in ran]
@@ -59,8 +104,21 @@ class TestFMIndex(unittest.TestCase):
         self.assertEqual(occ_lt_g, [1, 1, 2, 3, 4, 4])
         self.assertEqual(occ_lt_d, [0, 0, 0, 0, 0, 0])
 
+    def test_get_occurrences_lt_checkpoints(self):
+        input_str = '$ATTAGACCTG$CCTGCCGGAA$AGACCTGCCG$GCCGGAATAC$'
+        bwt = self.index(input_str).bwt
+        for interval in [1, 2, 3, 7, 64]:
+            fm = self.index(input_str, checkpoint_interval=interval)
+            # Include symbols outside of the alphabet
+            for a in fm.alphabet + ['#', 'B', 'Z']:
+                self.assertEqual(fm.get_occurrences_lt(a, -1), 0)
+                for i in range(len(bwt)):
+                    self.assertEqual(
+                        fm.get_occurrences_lt(a, i),
+                        len([c for c in bwt[:i + 1] if c < a]))
+
     def test__update_backward(self):
-        fm = FMIndex('AAGTA$')
+        fm = self.index('AAGTA$')
         # Look for pattern 'GT'
         # Start with last symbol in query, T
         # Interval for single character, a is just:
@@ -75,7 +133,7 @@ class TestFMIndex(unittest.TestCase):
         self.assertEqual(u_, 4)
 
     def test__update_forward_backward(self):
-        fm = FMIndex('AAGTA$')
+        fm = self.index('AAGTA$')
         # Look for pattern 'GT'
         # And determine if it is a right extension
         l, u = fm.lex_rank['T'], len(fm.suffix_array) - 1
@@ -85,7 +143,7 @@ class TestFMIndex(unittest.TestCase):
         self.assertEqual((l_, u_, ll_, uu_), (4, 4, 5, 5))
 
     def test__init_search_interval(self):
-        fm = FMIndex('AB')
+        fm = self.index('AB')
         l, u = fm._init_search_interval('A')
         self.assertEqual(l, fm.lex_rank['A'])
         self.assertEqual(u, fm.lex_rank['B'] - 1)
@@ -96,7 +154,7 @@ class TestFMIndex(unittest.TestCase):
         self.assertEqual(u, len(fm.suffix_array) - 1)
 
     def test_backward_search(self):
-        fm = FMIndex('AAGTA$')
+        fm = self.index('AAGTA$')
         query = 'AGT'
         l, u = fm.backward_search(query)
         self.assertEqual(
@@ -104,7 +162,7 @@ class TestFMIndex(unittest.TestCase):
             fm.input_str[fm.suffix_array[l]:fm.suffix_array[l] + len(query)])
 
         # Multiple matches
-        fm = FMIndex('AAGAGTAGAA$')
+        fm = self.index('AAGAGTAGAA$')
         query = 'AGA'
         l, u = fm.backward_search(query)
         for i in xrange(l, u + 1):
@@ -114,8 +172,34 @@ class TestFMIndex(unittest.TestCase):
                     fm.suffix_array[i]:fm.suffix_array[i] + len(query)]
             )
 
+    def test_backward_search_many(self):
+        fm = self.index('AAGAGTAGAA$')
+        patterns = ['AGA', 'A', 'GAA', 'AAGAGTAGAA$', 'TT', 'CA', 'AGAX', '']
+        intervals = fm.backward_search_many(patterns)
+        for pattern, (l, u) in zip(patterns[:5], intervals):
+            self.assertEqual((l, u), fm.backward_search(pattern))
+        self.assertTrue(all([u < l for l, u in intervals[5:7]]))
+        self.assertTrue(all([
+            fm.backward_search(p)[1] < fm.backward_search(p)[0]
+            for p in patterns[5:7]]))
+        self.assertEqual(tuple(intervals[7]), (0, 10))
+        self.assertEqual(fm.backward_search(''), (0, 10))
+
+    def test_backward_search_many_checkpoints(self):
+        reads = gettysburg.get_reads(50, 30, 40, seed=0)
+        patterns = [
+            read[i:i + 12] for read in reads for i in (0, 5, 18)
+            if read[i:i + 12]]
+        for k in [1, 3, 32]:
+            fm = self.index(
+                ReadLibrary(reads).concat_reads, checkpoint_interval=k)
+            self.assertEqual(
+                [tuple(interval)
+                 for interval in fm.backward_search_many(patterns)],
+                [fm.backward_search(pattern) for pattern in patterns])
+
     def test_find_intervals(self):
-        fm = FMIndex('$ATTAGACCTG$CCTGCCGGAA$')
+        fm = self.index('$ATTAGACCTG$CCTGCCGGAA$')
         prefix = '$CCTG'
 
         # Target: ATTAGACCTG
@@ -129,6 +213,1002 @@ class TestFMIndex(unittest.TestCase):
         self.assertEqual(label, 'CCTG')
         self.assertEqual(r[sa[l]:sa[l] + len(prefix)], prefix)
 
+    def test_iter_overlaps(self):
+        lib = ReadLibrary(gettysburg.get_reads(100, 30, 40, seed=0))
+        fm = self.index(lib.concat_reads)
+        for read in lib.reads:
+            overlaps = list(iter_overlaps(fm, read, tau=5))
+            self.assertEqual(
+                sorted(overlaps),
+                sorted([(l, u, len(label)) for l, u, label in
+                        find_intervals(fm, read, tau=5)]))
+            lengths = [overlap for _, _, overlap in overlaps]
+            self.assertEqual(lengths, sorted(lengths, reverse=True))
+
+        fm = self.index('$ATTAGACCTG$CCTGCCGGAA$CTGAAA$CTGTTT$')
+        overlaps = list(iter_overlaps(fm, 'ATTAGACCTG'))
+        self.assertEqual(
+            [(u - l + 1, overlap) for l, u, overlap in overlaps],
+            [(1, 4), (2, 3)])
+        capped = list(iter_overlaps(fm, 'ATTAGACCTG', max_overlaps=2))
+        self.assertEqual(capped, [overlaps[0], overlaps[1][:1] * 2 + (3,)])
+        self.assertEqual(
+            list(iter_overlaps(fm, 'ATTAGACCTG', max_overlaps=0)), [])
+
+
+class TestRunLengthFMIndex(TestFMIndex):
+    """Run the FMIndex tests against a run-length BWT."""
+
+    options = {'run_length': True}
+
+    def test_runs(self):
+        lib = ReadLibrary(tubthumping.get_reads(500, 25, 50, seed=0))
+        bwt = FMIndex(lib.concat_reads).bwt
+        fm = self.index(lib.concat_reads)
+        self.assertTrue(isinstance(fm.bwt, RunLengthText))
+        self.assertEqual(str(fm.bwt), bwt)
+        self.assertEqual(fm.bwt[100:200], bwt[100:200])
+        self.assertEqual(fm.bwt[-1], bwt[-1])
+        self.assertTrue(fm.bwt.runs * 4 < len(bwt))
+        self.assertEqual(
+            sum([len(lengths) - 1 for lengths in
+                 fm.occurrences.lengths.itervalues()]), fm.bwt.runs)
+
+
+class TestReadLibrary(unittest.TestCase):
+
+    def test_init(self):
+        lib = ReadLibrary(['ACG', 'TA', 'ACG'])
+        self.assertEqual(sorted(lib.reads), ['ACG', 'TA'])
+        for read, offset in zip(lib.reads, lib.offsets):
+            self.assertEqual(lib.concat_reads[offset - 1], '$')
+            self.assertEqual(
+                lib.concat_reads[offset:offset + len(read) + 1], read + '$')
+
+    def test_read_at(self):
+        lib = ReadLibrary(['ATTAGACCTG', 'CCTGCCGGAA', 'AGACCTGCCG'])
+        for read_id, read in enumerate(lib.reads):
+            start = lib.offsets[read_id]
+            for position in range(start, start + len(read) + 1):
+                self.assertEqual(lib.read_at(position), read_id)
+
+    def test_without(self):
+        lib = ReadLibrary(['ACG', 'TA', 'ACG', 'CGT'], dna=True)
+        self.assertEqual(lib.duplicates, 1)
+        kept = lib.without([1])
+        self.assertEqual(kept.reads, lib.reads[:1] + lib.reads[2:])
+        self.assertEqual(kept.duplicates, 1)
+        self.assertTrue(isinstance(kept.concat_reads, PackedDNA))
+        self.assertEqual(
+            str(kept.concat_reads), '$' + '$'.join(kept.reads) + '$')
+
+    def test_from_stream_collisions(self):
+        class Colliding(str):
+            def __hash__(self):
+                return 7
+
+        reads = ['ACG', 'TA', 'CGTT', 'A', 'GAT', 'TTAC', 'CA', 'GGA', 'T']
+        for dna in [False, True]:
+            lib = ReadLibrary.from_stream(
+                [Colliding(read) for read in reads * 3], dna=dna)
+            self.assertEqual(list(lib.reads), reads)
+            self.assertEqual(lib.duplicates, 2 * len(reads))
+
+    def test_with_reverse_complements(self):
+        lib = ReadLibrary(['ACG', 'TTA', 'CGT', 'ACG'], dna=True)
+        stranded = lib.with_reverse_complements()
+        self.assertEqual(stranded.duplicates, 2)
+        reads = [read for read in lib.reads if read != 'CGT'][:2]
+        self.assertEqual(
+            stranded.reads, [
+                reads[0], reverse_complement(reads[0]),
+                reads[1], reverse_complement(reads[1])])
+        self.assertTrue(isinstance(stranded.concat_reads, PackedDNA))
+        self.assertRaises(
+            ValueError, ReadLibrary(['ACGN']).with_reverse_complements)
+
+    def test_find_contained(self):
+        reads = ['ATTAGACCTG', 'TAGAC', 'CCTGCCGGAA', 'CCGG', 'GACCTGCC']
+        lib = ReadLibrary(reads)
+        contained = find_contained(lib, FMIndex(lib.concat_reads))
+        self.assertEqual(
+            sorted([lib.reads[i] for i in contained]), ['CCGG', 'TAGAC'])
+
+
+class TestFastx(unittest.TestCase):
+
+    reads = ['ATTAGACCTG', 'CCTGCCGGAA', 'AGACCTGCCG', 'GCCGGAATAC']
+
+    fasta = (
+        '>read1\nATTAG\nACCTG\n'
+        '>read2\nCCTGCCGGAA\n\n'
+        '>read3\nagacctgccg\n'
+        '>read2-again\nCCTGCCGGAA\n'
+        '>read4\nGCCGGAATAC\n')
+
+    fastq = (
+        '@read1\nATTAGACCTG\n+\nIIIIIIIIII\n'
+        '@read2\nCCTGC\nCGGAA\n+read2\n@@@@@\nIIIII\n'
+        '@read3\nAGACCTGCCG\n+\n@IIIIIIIII\n'
+        '@read4\nGCCGGAATAC\n+\nIIIIIIIIII\n')
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_read_sequences(self):
+        self.assertEqual(
+            list(read_sequences(self.fasta.splitlines(True))),
+            self.reads[:3] + self.reads[1:2] + self.reads[3:])
+        self.assertEqual(
+            list(read_sequences(self.fastq.splitlines(True))), self.reads)
+        self.assertEqual(list(read_sequences([])), [])
+        self.assertRaises(
+            ValueError, list, read_sequences(['ACGT\n']))
+        self.assertRaises(
+            ValueError, list, read_sequences(self.fastq.splitlines()[:6]))
+
+    def test_empty_records(self):
+        fasta = '>empty\n' + self.fasta + '>empty\n\n'
+        lines = fasta.replace('>read3', '>empty\n>read3').splitlines(True)
+        self.assertEqual(
+            list(read_sequences(lines)),
+            self.reads[:3] + self.reads[1:2] + self.reads[3:])
+        fastq = self.fastq.replace(
+            '@read3', '@empty\n+\n@read3') + '@empty\n\n+\n\n'
+        self.assertEqual(
+            list(read_sequences(fastq.splitlines(True))), self.reads)
+
+    def test_gzip(self):
+        path = os.path.join(self.dir, 'reads.fq.gz')
+        f = gzip.open(path, 'wb')
+        f.write(self.fastq)
+        f.close()
+        self.assertEqual(list(read_sequences(path)), self.reads)
+
+    def test_from_fastx(self):
+        for dna in [False, True]:
+            lib = ReadLibrary.from_fastx(self.fasta.splitlines(), dna=dna)
+            self.assertEqual(list(lib.reads), self.reads)
+            self.assertEqual(lib.reads[-1], self.reads[-1])
+            self.assertEqual(lib.duplicates, 1)
+            text = '$' + '$'.join(self.reads) + '$'
+            self.assertEqual(str(lib.concat_reads), text)
+            for a in set(text):
+                self.assertEqual(lib.concat_reads.count(a), text.count(a))
+            self.assertEqual(list(lib.offsets), [1, 12, 23, 34])
+
+    def test_solve(self):
+        path = os.path.join(self.dir, 'reads.fa')
+        with open(path, 'w') as f:
+            f.write(self.fasta)
+        self.assertEqual(bwt_solver.solve(path), 'ATTAGACCTGCCGGAATAC')
+        self.assertEqual(
+            bwt_solver.solve(path, dna=True), 'ATTAGACCTGCCGGAATAC')
+
+
+class TestPackedDNA(unittest.TestCase):
+
+    def test_str(self):
+        seq = '$ATTAGACCTG$CCTGCCGGAA$AGACCTGCCG$GCCGGAATAC$'
+        packed = PackedDNA(seq[:7])
+        packed.extend(seq[7:])
+        self.assertEqual(len(packed), len(seq))
+        self.assertEqual(str(packed), seq)
+        self.assertEqual(''.join(packed), seq)
+        for i in range(len(seq)):
+            self.assertEqual(packed[i], seq[i])
+            self.assertEqual(packed[i:i + 9], seq[i:i + 9])
+
+    def test_count(self):
+        seq = '$ATTAGACCTG$CCTGCCGGAA$AGACCTGCCG$GCCGGAATAC$'
+        packed = PackedDNA(seq)
+        for a in '$ACGTN':
+            self.assertEqual(packed.count(a), seq.count(a))
+            for start in range(len(seq)):
+                for end in range(start, len(seq) + 1):
+                    self.assertEqual(
+                        packed.count(a, start, end), seq.count(a, start, end))
+        for x, a in enumerate(DNA_ALPHABET):
+            for start in range(len(seq)):
+                for end in range(start, len(seq) + 1):
+                    self.assertEqual(
+                        packed.count_less(x, start, end),
+                        len([b for b in seq[start:end] if b < a]))
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, PackedDNA, 'ACGN')
+
+    def test_reverse_complement(self):
+        self.assertEqual(reverse_complement('AACGT$'), '$ACGTT')
+        self.assertEqual(reverse_complement(''), '')
+        self.assertRaises(ValueError, reverse_complement, 'ACGN')
+
+    def test_fm_index(self):
+        seq = '$ATTAGACCTG$CCTGCCGGAA$AGACCTGCCG$GCCGGAATAC$'
+        for k in [1, 3, 32]:
+            fm = FMIndex(seq, checkpoint_interval=k)
+            packed = FMIndex(PackedDNA(seq), checkpoint_interval=k)
+            self.assertEqual(packed.suffix_array, fm.suffix_array)
+            self.assertEqual(str(packed.bwt), fm.bwt)
+            self.assertEqual(packed.lex_rank, fm.lex_rank)
+            self.assertTrue(
+                isinstance(packed.occurrences, rank.PackedOccurrenceTable))
+            for a in fm.alphabet + ['N']:
+                for i in range(-1, len(seq)):
+                    self.assertEqual(
+                        packed.occurrences.rank(a, i),
+                        fm.occurrences.rank(a, i))
+                    self.assertEqual(
+                        packed.get_occurrences_lt(a, i),
+                        fm.get_occurrences_lt(a, i))
+            self.assertEqual(
+                packed.backward_search('CCTG'), fm.backward_search('CCTG'))
+            reverse = packed.reverse().input_str
+            self.assertTrue(isinstance(reverse, PackedDNA))
+            self.assertEqual(str(reverse), seq[::-1])
+
+    def test_solve(self):
+        reads = rosalind.get_reads()
+        self.assertEqual(
+            bwt_solver.solve(reads, tau=100, dna=True),
+            bwt_solver.solve(reads, tau=100))
+
+
+class TestFMDIndex(unittest.TestCase):
+
+    def setUp(self):
+        reads = genome.get_reads(60, 20, 30, genome_length=300, seed=3)
+        self.lib = ReadLibrary(reads).with_reverse_complements()
+
+    def test_bi_interval(self):
+        for text in [self.lib.concat_reads, PackedDNA(self.lib.concat_reads)]:
+            fm = FMDIndex(text)
+            for read in self.lib.reads[:20]:
+                for pattern in [read[5:15], '$' + read[:8], read[-8:] + '$']:
+                    expected = (
+                        fm.backward_search(pattern) +
+                        fm.backward_search(reverse_complement(pattern)))
+                    # Grow the pattern from its middle, in both directions
+                    m = len(pattern) // 2
+                    interval = fm._init_bi_interval(pattern[m])
+                    for a in reversed(pattern[:m]):
+                        interval = fm._update_forward_backward(
+                            *(interval + (a,)))
+                    for a in pattern[m + 1:]:
+                        interval = fm._update_backward_forward(
+                            *(interval + (a,)))
+                    self.assertEqual(interval, expected)
+
+    def test_irreducible(self):
+        # The FMD-index is its own reverse
+        fm = FMDIndex(self.lib.concat_reads)
+        plain = FMIndex(self.lib.concat_reads)
+        reverse = plain.reverse()
+        for read in self.lib.reads:
+            self.assertEqual(
+                extract_irreducible(fm, fm, find_intervals(
+                    fm, read, tau=5, bidirectional=True), contained=False),
+                extract_irreducible(plain, reverse, find_intervals(
+                    plain, read, tau=5, bidirectional=True), contained=False))
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, FMDIndex, '$ACGT$AAC$')
+        self.assertRaises(ValueError, FMDIndex, '$ACGT$ACGN$')
+        self.assertRaises(TypeError, FMDIndex(self.lib.concat_reads).reverse)
+
+
+class TestBWTSolver(unittest.TestCase):
+
+    def test_solve(self):
+        reads = [
+            'ATTAGACCTG',
+            'CCTGCCGGAA',
+            'AGACCTGCCG',
+            'GCCGGAATAC', ]
+        self.assertEqual(bwt_solver.solve(reads), 'ATTAGACCTGCCGGAATAC')
+
+    def test_remove_contained(self):
+        reads = [
+            'ATTAGACCTG',
+            'TAGAC',
+            'CCTGCCGGAA',
+            'CCTGCCGGAA',
+            'AGACCTGCCG',
+            'CTGCC',
+            'GCCGGAATAC', ]
+        graph = bwt_solver.build_overlap_graph(reads, remove_contained=True)
+        self.assertEqual(len(graph), 4)
+        self.assertEqual(
+            bwt_solver.solve(reads, remove_contained=True),
+            'ATTAGACCTGCCGGAATAC')
+        self.assertEqual(
+            rosalind_solver.solve(reads, remove_contained=True),
+            'ATTAGACCTGCCGGAATAC')
+
+    def test_solve_contigs(self):
+        reads = gettysburg.get_reads(100, 30, 40, seed=0)
+        contigs = list(bwt_solver.solve_contigs(reads, tau=10))
+        lengths = [len(contig) for contig in contigs]
+        self.assertEqual(lengths, sorted(lengths, reverse=True))
+        for read in reads:
+            self.assertTrue(any([read in contig for contig in contigs]))
+
+    def test_irreducible(self):
+        reads = [
+            'ATTAGACCTG',
+            'CCTGCCGGAA',
+            'AGACCTGCCG',
+            'GCCGGAATAC', ]
+        graph = bwt_solver.build_overlap_graph(reads, irreducible=True)
+        edges = set(
+            (graph.values[i], graph.values[j], overlap)
+            for i in range(len(graph))
+            for j, overlap in graph.out_edges(i))
+        self.assertEqual(edges, set([
+            ('ATTAGACCTG', 'AGACCTGCCG', 7),
+            ('AGACCTGCCG', 'CCTGCCGGAA', 7),
+            ('CCTGCCGGAA', 'GCCGGAATAC', 7)]))
+        self.assertEqual(
+            bwt_solver.solve(reads, irreducible=True), 'ATTAGACCTGCCGGAATAC')
+
+    def test_irreducible_contained(self):
+        # Transitive reduction drops the edges of contained reads
+        reads = genome.get_reads(400, 40, 60, genome_length=3000, seed=1)
+        lib = ReadLibrary(reads)
+        self.assertTrue(find_contained(lib, FMIndex(lib.concat_reads)))
+        contig = bwt_solver.solve(reads, tau=15, irreducible=True)
+        self.assertEqual(contig, bwt_solver.solve(
+            reads, tau=15, irreducible=True, remove_contained=True))
+        self.assertEqual(len(contig), 2998)
+        self.assertEqual(
+            list(bwt_solver.solve_contigs(reads, tau=15, irreducible=True)),
+            [contig])
+
+    def test_compact(self):
+        reads = gettysburg.get_reads(200, 50, 60, seed=0)
+        graph = bwt_solver.build_overlap_graph(
+            reads, tau=10, irreducible=True, remove_contained=True)
+        compacted = graph.compact()
+        self.assertTrue(len(compacted) < len(graph))
+        self.assertEqual(
+            sorted(sum([list(members) for members in compacted.members], [])),
+            range(len(graph)))
+        contigs = list(bwt_solver.solve_contigs(
+            reads, tau=10, irreducible=True, compact=True))
+        for read in reads:
+            self.assertTrue(any([read in contig for contig in contigs]))
+
+    def test_irreducible_subset(self):
+        reads = gettysburg.get_reads(200, 50, 60, seed=0)
+        full = bwt_solver.build_overlap_graph(
+            reads, tau=10, remove_contained=True)
+        reduced = bwt_solver.build_overlap_graph(
+            reads, tau=10, irreducible=True)
+        self.assertTrue(reduced.edge_count < full.edge_count)
+        for i in range(len(full)):
+            self.assertTrue(
+                set(reduced.out_edges(i)) <= set(full.out_edges(i)))
+
+    def test_incremental(self):
+        reads = gettysburg.get_reads(200, 40, 60, seed=0)
+
+        def edges(graph):
+            return sorted([
+                (graph.values[i], graph.values[j], overlap)
+                for i in range(len(graph))
+                for j, overlap in graph.out_edges(i)])
+
+        full = bwt_solver.build_overlap_graph(reads, tau=10)
+        incremental = bwt_solver.IncrementalOverlapGraph(tau=10)
+        for start in range(0, len(reads), 30):
+            incremental.add(reads[start:start + 30])
+        self.assertEqual(sorted(incremental.reads), sorted(full.values))
+        self.assertEqual(edges(incremental.graph), edges(full))
+        self.assertTrue(len(incremental.layers) < 200 / 30)
+
+    def test_incremental_duplicates(self):
+        incremental = bwt_solver.IncrementalOverlapGraph(dna=True)
+        self.assertEqual(
+            incremental.add(['ATTAGACCTG', 'CCTGCCGGAA', 'ATTAGACCTG']), 2)
+        self.assertEqual(
+            incremental.add(['CCTGCCGGAA', 'AGACCTGCCG', 'GCCGGAATAC']), 2)
+        graph = incremental.graph
+        self.assertEqual(incremental.add(['AGACCTGCCG']), 0)
+        self.assertTrue(incremental.graph is graph)
+        self.assertTrue('GCCGGAATAC' in incremental)
+        self.assertEqual(
+            assemble(incremental.graph), 'ATTAGACCTGCCGGAATAC')
+
+        # Adding reads leaves a graph that was already returned unchanged
+        self.assertEqual(incremental.add(['CGGAATACGG']), 1)
+        self.assertEqual(len(graph), 4)
+        self.assertEqual(len(incremental.graph), 5)
+        self.assertEqual(
+            assemble(incremental.graph), 'ATTAGACCTGCCGGAATACGG')
+
+    def test_parallel(self):
+        reads = gettysburg.get_reads(200, 50, 60, seed=0)
+        serial = bwt_solver.build_overlap_graph(reads, tau=10)
+        parallel = bwt_solver.build_overlap_graph(reads, tau=10, workers=3)
+        self.assertEqual(
+            [serial.out_edges(i) for i in range(len(serial))],
+            [parallel.out_edges(i) for i in range(len(parallel))])
+        self.assertEqual(
+            bwt_solver.solve(reads, tau=10),
+            bwt_solver.solve(reads, tau=10, workers=3))
+
+    def test_max_overlaps(self):
+        reads = gettysburg.get_reads(200, 50, 60, seed=0)
+        graph = bwt_solver.build_overlap_graph(reads, tau=10)
+        capped = bwt_solver.build_overlap_graph(
+            reads, tau=10, max_overlaps=2)
+        for i in xrange(len(graph)):
+            edges = sorted(graph.out_edges(i), key=lambda edge: -edge[1])
+            self.assertEqual(
+                [overlap for _, overlap in capped.out_edges(i)],
+                [overlap for _, overlap in edges[:2]])
+        self.assertTrue(
+            bwt_solver.solve(reads, tau=10, max_overlaps=1)
+            in gettysburg.gettysburg)
+
+    def test_sampled_index(self):
+        lib = ReadLibrary(gettysburg.get_reads(200, 50, 60, seed=0), dna=False)
+        for irreducible in [False, True]:
+            graph = bwt_solver.build_overlap_graph(
+                index=FMIndex(lib.concat_reads), tau=10,
+                irreducible=irreducible)
+            sampled = bwt_solver.build_overlap_graph(
+                index=FMIndex(lib.concat_reads, sa_sample_rate=16), tau=10,
+                irreducible=irreducible)
+            self.assertEqual(
+                list(sampled.out_targets), list(graph.out_targets))
+
+    def test_run_length_index(self):
+        lib = ReadLibrary(gettysburg.get_reads(200, 50, 60, seed=0), dna=False)
+        for irreducible in [False, True]:
+            graph = bwt_solver.build_overlap_graph(
+                index=FMIndex(lib.concat_reads), tau=10,
+                irreducible=irreducible)
+            runs = bwt_solver.build_overlap_graph(
+                index=FMIndex(lib.concat_reads, run_length=True), tau=10,
+                irreducible=irreducible)
+            self.assertEqual(list(runs.out_targets), list(graph.out_targets))
+
+    def test_both_strands(self):
+        options = dict(genome_length=2000, seed=7)
+        sequence = bwt_solver.solve(
+            genome.get_reads(400, 85, 100, **options), tau=30,
+            irreducible=True, remove_contained=True)
+        self.assertEqual(len(sequence), 2000)
+        reads = genome.get_reads(400, 85, 100, both_strands=True, **options)
+
+        # The edges are those of a plain index over both strands
+        lib = ReadLibrary(reads).with_reverse_complements()
+        for irreducible in [False, True]:
+            graph = bwt_solver.build_overlap_graph(
+                reads, tau=30, irreducible=irreducible, both_strands=True)
+            plain = bwt_solver.build_overlap_graph(
+                index=FMIndex(lib.concat_reads), tau=30,
+                irreducible=irreducible)
+            self.assertEqual(len(graph), len(plain))
+            for i in xrange(len(graph)):
+                self.assertEqual(sorted(graph.out_edges(i)), sorted([
+                    (j, overlap) for j, overlap in plain.out_edges(i)
+                    if j != i ^ 1]))
+
+        contigs = list(bwt_solver.solve_contigs(
+            reads, tau=30, irreducible=True, remove_contained=True,
+            both_strands=True))
+        self.assertEqual(len(contigs), 1)
+        self.assertTrue(
+            contigs[0] in [sequence, reverse_complement(sequence)])
+        self.assertTrue(bwt_solver.solve(
+            reads, tau=30, irreducible=True, remove_contained=True,
+            both_strands=True) in [sequence, reverse_complement(sequence)])
+
+    def test_both_strands_palindrome(self):
+        # The fourth read is its own reverse complement, so it occurs twice
+        # in the text, but is not contained in any other read
+        reads = ['AAGCTTGCAA', 'TGCAACGGAT', 'ACGGATCCGTTT', 'GCAAGCTTGC']
+        lib = ReadLibrary(reads).with_reverse_complements()
+        self.assertEqual(
+            find_contained(
+                lib, FMDIndex(lib.concat_reads), both_strands=True), [])
+        expected = bwt_solver.solve(reads, remove_contained=True)
+        self.assertEqual(expected, 'GCAAGCTTGCAACGGATCCGTTT')
+        self.assertEqual(
+            bwt_solver.solve(
+                reads, remove_contained=True, both_strands=True), expected)
+        self.assertEqual(
+            list(bwt_solver.solve_contigs(
+                reads, remove_contained=True, both_strands=True)),
+            [reverse_complement(expected)])
+
+        lib = ReadLibrary(reads + ['CAAGCTTGCAAC']).with_reverse_complements()
+        contained = find_contained(
+            lib, FMDIndex(lib.concat_reads), both_strands=True)
+        self.assertEqual(
+            sorted([lib.reads[i] for i in contained]),
+            ['AAGCTTGCAA', reverse_complement('AAGCTTGCAA')])
+
+        # Once another read holds the palindrome, it has a third match
+        lib = ReadLibrary(reads + ['TGCAAGCTTGCA']).with_reverse_complements()
+        contained = find_contained(
+            lib, FMDIndex(lib.concat_reads), both_strands=True)
+        self.assertEqual(
+            [lib.reads[i] for i in contained], ['GCAAGCTTGC'] * 2)
+
+    def test_stats(self):
+        reads = gettysburg.get_reads(200, 50, 60, seed=0)
+        stats = Stats()
+        self.assertEqual(
+            bwt_solver.solve(reads, tau=10, irreducible=True, stats=stats),
+            bwt_solver.solve(reads, tau=10, irreducible=True))
+        self.assertEqual(list(stats.phases), [
+            'read_library', 'suffix_array', 'bwt', 'lex_rank', 'occurrences',
+            'remove_contained', 'overlap', 'graph', 'layout', 'consensus'])
+        graph = bwt_solver.build_overlap_graph(
+            reads, tau=10, irreducible=True)
+        self.assertEqual(stats.counters['edges'], len(graph.out_targets))
+        self.assertTrue(stats.counters['backward_extensions'] > 0)
+        self.assertTrue(stats.counters['nodes_walked'] > 1)
+
+        parallel = Stats()
+        bwt_solver.build_overlap_graph(
+            reads, tau=10, irreducible=True, workers=3, stats=parallel)
+        del stats.counters['nodes_walked']
+        self.assertEqual(parallel.counters, stats.counters)
+
+
+    def test_stats_peaks(self):
+        stats = Stats()
+        with stats.phase('outer'):
+            with stats.phase('large'):
+                large = 'A' * (64 << 20)
+                del large
+            with stats.phase('small'):
+                pass
+        peaks = dict([
+            (name, phase['peak_rss_kb'])
+            for name, phase in stats.phases.iteritems()])
+        if peaks['small'] is None:
+            return
+        # Each phase has its own peak, and an enclosing phase the highest
+        self.assertTrue(peaks['large'] - peaks['small'] > 32 << 10)
+        self.assertTrue(peaks['outer'] >= peaks['large'])
+        self.assertEqual(stats.peak_rss_kb, peaks['outer'])
+
+def naive_overlaps(reads):
+    """
+    Find every (x, y, i) where read y starts with read x[i:], and i is at
+    most half the length of x, by testing every suffix against every read.
+    """
+    for x, read in enumerate(reads):
+        for y, other in enumerate(reads):
+            if x == y:
+                continue
+            # Check all suffixes from x[1:] through x[|x|/2:]
+            for i in xrange(1, len(read) / 2 + 1):
+                if other.startswith(read[i:]):
+                    yield x, y, i
+
+
+class TestRosalindSolver(unittest.TestCase):
+
+    def test_hashed_overlaps(self):
+        reads = rosalind.get_reads()
+        self.assertEqual(
+            list(rosalind_solver._hashed_overlaps(reads)),
+            list(naive_overlaps(reads)))
+
+    def test_hashed_overlaps_short(self):
+        reads = ['ACGTAC', 'GTACGG', 'ACGG', 'A', '', 'TACGG', 'GTACGG', 'CG']
+        self.assertEqual(
+            list(rosalind_solver._hashed_overlaps(reads)),
+            list(naive_overlaps(reads)))
+
+    def test_solve(self):
+        reads = [
+            'ATTAGACCTG',
+            'CCTGCCGGAA',
+            'AGACCTGCCG',
+            'GCCGGAATAC', ]
+        self.assertEqual(
+            rosalind_solver.solve(reads), 'ATTAGACCTGCCGGAATAC')
+
+
+class TestLayout(unittest.TestCase):
+
+    def setUp(self):
+        # 0 -> 1 is the longest edge out of 0, but 1 leads back to 0, so the
+        # walk must fall back to its next best edge, 1 -> 2
+        self.graph = StringGraph.from_edges(
+            ['AACCG', 'CCGAA', 'GAACC'],
+            [(0, 1, 3), (1, 0, 4), (1, 2, 3), (0, 2, 1), (2, 0, 3)])
+
+    def test_layout(self):
+        self.assertEqual(layout(self.graph), [(1, 3), (2, 3)])
+        self.assertEqual(layout(self.graph, reverse=True), [(1, 4)])
+        self.assertEqual(layout(self.graph, root=2), [(0, 3), (1, 3)])
+
+    def test_bfs(self):
+        for root in range(len(self.graph)):
+            for reverse in [False, True]:
+                path = bfs(self.graph[root], reverse=reverse)
+                self.assertEqual(
+                    [(edge.node.id, len(edge.label)) for edge in path],
+                    layout(self.graph, root=root, reverse=reverse))
+
+    def test_explored(self):
+        self.assertEqual(layout(self.graph, explored=set([2])), [(1, 3)])
+        self.assertEqual(layout(self.graph, explored=set([0])), [])
+
+    def test_assemble(self):
+        # Upstream of the root, 1 -> 0, then downstream, 0 -> 1 -> 2
+        self.assertEqual(assemble(self.graph), 'CAACCGAACC')
+        nodes = [Node(value) for value in self.graph.values]
+        for i in range(len(nodes)):
+            for j, overlap in self.graph.out_edges(i):
+                label = nodes[j].value[:overlap]
+                nodes[i].add_out_edge(Edge(nodes[j], label))
+                nodes[j].add_in_edge(Edge(nodes[i], label))
+        self.assertEqual(assemble(nodes), 'CAACCGAACC')
+
+    def test_assemble_contigs(self):
+        # 1 -> 0 is the longest edge, then 0 -> 1 would close a cycle, and
+        # 1 -> 2 and 2 -> 0 would give a read two neighbours, leaving 0 -> 2
+        self.assertEqual(list(assemble_contigs(self.graph)), ['CCGAAGAACC'])
+        graph = StringGraph.from_edges(
+            ['ATTAGACCTG', 'CCTGCCGGAA', 'AGACCTGCCG', 'TTTT', 'TTTGG'],
+            [(0, 1, 4), (0, 2, 7), (2, 1, 7), (3, 4, 3)])
+        self.assertEqual(
+            list(assemble_contigs(graph)), ['ATTAGACCTGCCGGAA', 'TTTTGG'])
+
+    def test_assemble_out(self):
+        out = StringIO()
+        self.assertEqual(assemble(self.graph, out=out), None)
+        self.assertEqual(out.getvalue(), assemble(self.graph))
+
+
+class TestStorage(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'index.fm')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def assertSameIndex(self, fm, loaded):
+        self.assertEqual(str(loaded.input_str), str(fm.input_str))
+        self.assertEqual(list(loaded.suffix_array), list(fm.suffix_array))
+        self.assertEqual(str(loaded.bwt), str(fm.bwt))
+        self.assertEqual(loaded.lex_rank, fm.lex_rank)
+        for a in fm.alphabet:
+            for i in range(-1, len(fm.bwt)):
+                self.assertEqual(
+                    loaded.occurrences[a][i], fm.occurrences[a][i])
+                self.assertEqual(
+                    loaded.get_occurrences_lt(a, i),
+                    fm.get_occurrences_lt(a, i))
+
+    def test_save_load(self):
+        fm = FMIndex(
+            '$ATTAGACCTG$CCTGCCGGAA$AGACCTGCCG$GCCGGAATAC$',
+            checkpoint_interval=4)
+        fm.save(self.path)
+        self.assertSameIndex(fm, FMIndex.load(self.path))
+
+    def test_save_load_dna(self):
+        fm = FMIndex(PackedDNA('$ATTAGACCTG$CCTGCCGGAA$AGACCTGCCG$'))
+        fm.save(self.path)
+        self.assertSameIndex(fm, FMIndex.load(self.path))
+
+    def test_backward_search_many_loaded(self):
+        patterns = ['CCTG', 'GAA$', 'TT', 'AGACC', 'G']
+        for text in [
+                '$ATTAGACCTG$CCTGCCGGAA$AGACCTGCCG$GCCGGAATAC$',
+                PackedDNA('$ATTAGACCTG$CCTGCCGGAA$AGACCTGCCG$')]:
+            fm = FMIndex(text, checkpoint_interval=4)
+            fm.save(self.path)
+            for index in [fm, FMIndex.load(self.path)]:
+                self.assertEqual(
+                    [tuple(interval) for interval in
+                     index.backward_search_many(patterns)],
+                    [fm.backward_search(p) for p in patterns])
+
+                # Only the checkpoints are cached, never a copy of the BWT
+                if index.occurrences._vectors is not None:
+                    self.assertTrue(all([
+                        vector.dtype.itemsize > 1
+                        for vector in index.occurrences._vectors]))
+
+    def test_save_load_sampled(self):
+        for text in [
+                '$ATTAGACCTG$CCTGCCGGAA$AGACCTGCCG$GCCGGAATAC$',
+                PackedDNA('$ATTAGACCTG$CCTGCCGGAA$AGACCTGCCG$')]:
+            fm = FMIndex(text, sa_sample_rate=4)
+            fm.save(self.path)
+            loaded = FMIndex.load(self.path)
+            self.assertEqual(loaded.sa_sample_rate, 4)
+            self.assertSameIndex(fm, loaded)
+
+    def test_save_load_run_length(self):
+        for text in [
+                '$ATTAGACCTG$CCTGCCGGAA$AGACCTGCCG$GCCGGAATAC$',
+                PackedDNA('$ATTAGACCTG$CCTGCCGGAA$AGACCTGCCG$')]:
+            fm = FMIndex(text, sa_sample_rate=4, run_length=True)
+            fm.save(self.path)
+            loaded = FMIndex.load(self.path)
+            self.assertTrue(loaded.run_length)
+            self.assertEqual(loaded.bwt.runs, fm.bwt.runs)
+            self.assertSameIndex(fm, loaded)
+            self.assertEqual(
+                [tuple(interval) for interval in
+                 loaded.backward_search_many(['CCTG', 'GAA$', 'TT'])],
+                [fm.backward_search(p) for p in ['CCTG', 'GAA$', 'TT']])
+
+    def test_save_load_fmd(self):
+        lib = ReadLibrary(['ATTAGACCTG', 'CCTGCCGGAA'], dna=True)
+        fm = FMDIndex(lib.with_reverse_complements().concat_reads)
+        fm.save(self.path)
+        loaded = FMDIndex.load(self.path)
+        self.assertTrue(isinstance(loaded, FMDIndex))
+        self.assertSameIndex(fm, loaded)
+        self.assertRaises(ValueError, FMIndex.load, self.path)
+        self.assertRaises(
+            ValueError, bwt_solver.solve, index=self.path, tau=5)
+
+        FMIndex(fm.input_str).save(self.path)
+        self.assertRaises(ValueError, FMDIndex.load, self.path)
+        self.assertRaises(
+            ValueError, bwt_solver.solve, index=self.path, tau=5,
+            both_strands=True)
+        self.assertRaises(
+            ValueError, bwt_solver.solve, index=FMIndex(fm.input_str),
+            tau=5, both_strands=True)
+
+    def test_invalid(self):
+        with open(self.path, 'wb') as f:
+            f.write('not an index')
+        self.assertRaises(ValueError, FMIndex.load, self.path)
+
+    def test_solve(self):
+        reads = gettysburg.get_reads(200, 50, 60, seed=0)
+        FMIndex(ReadLibrary(reads).concat_reads).save(self.path)
+        self.assertEqual(
+            bwt_solver.solve(index=self.path, tau=10),
+            bwt_solver.solve(reads, tau=10))
+
+
+class TestStringGraph(unittest.TestCase):
+
+    def setUp(self):
+        self.values = ['ATTAGACCTG', 'CCTGCCGGAA', 'AGACCTGCCG', 'GCCGGAATAC']
+        self.edges = [(0, 1, 4), (0, 2, 7), (2, 1, 7), (2, 3, 4), (1, 3, 7)]
+        self.graph = StringGraph.from_edges(self.values, self.edges)
+
+    def test_adjacency(self):
+        graph = self.graph
+        self.assertEqual(len(graph), 4)
+        self.assertEqual(graph.edge_count, 5)
+        self.assertEqual(graph.out_edges(0), [(1, 4), (2, 7)])
+        self.assertEqual(graph.in_edges(1), [(0, 4), (2, 7)])
+        self.assertEqual(graph.out_edges(3), [])
+        self.assertEqual(graph.in_degree(3), 2)
+        self.assertEqual(graph.out_degree(3), 0)
+
+    def test_node_view(self):
+        nodes = [Node(v) for v in self.values]
+        for source, target, overlap in self.edges:
+            label = self.values[target][:overlap]
+            nodes[source].add_out_edge(Edge(nodes[target], label))
+            nodes[target].add_in_edge(Edge(nodes[source], label))
+
+        for node, view in zip(nodes, self.graph):
+            self.assertEqual(view.value, node.value)
+            for reverse in [False, True]:
+                edges = node.in_edges if reverse else node.out_edges
+                view_edges = view.in_edges if reverse else view.out_edges
+                self.assertEqual(
+                    [(e.node.value, e.label) for e in view_edges],
+                    [(e.node.value, e.label) for e in edges])
+                longest = node.longest_edge(reverse=reverse)
+                view_longest = view.longest_edge(reverse=reverse)
+                if longest is None:
+                    self.assertTrue(view_longest is None)
+                else:
+                    self.assertEqual(view_longest.label, longest.label)
+                    self.assertEqual(
+                        view_longest.node.value, longest.node.value)
+
+        self.assertTrue(self.graph[1] is self.graph[1])
+        self.assertRaises(TypeError, self.graph[0].add_out_edge, None)
+
+        graph = StringGraph.from_nodes(nodes)
+        self.assertEqual(graph.values, self.values)
+        for i in range(len(graph)):
+            self.assertEqual(graph.out_edges(i), self.graph.out_edges(i))
+
+    def test_compact(self):
+        # No node has a single successor with a single predecessor
+        graph = self.graph.compact()
+        self.assertEqual(graph.values, self.values)
+        self.assertEqual(graph.edge_count, 5)
+
+        graph = StringGraph.from_edges(
+            self.values + ['AATACTT', 'AATACGG'],
+            [(0, 2, 7), (2, 1, 7), (1, 3, 7), (3, 4, 5), (3, 5, 5)])
+        compacted = graph.compact()
+        self.assertEqual(
+            compacted.values, ['ATTAGACCTGCCGGAATAC', 'AATACTT', 'AATACGG'])
+        self.assertEqual(
+            [list(members) for members in compacted.members],
+            [[0, 2, 1, 3], [4], [5]])
+        self.assertEqual(compacted.out_edges(0), [(1, 5), (2, 5)])
+        self.assertEqual(compacted.in_edges(2), [(0, 5)])
+
+    def test_compact_cycle(self):
+        graph = StringGraph.from_edges(
+            ['AACCG', 'CCGAA', 'GAACC'], [(0, 1, 3), (1, 2, 3), (2, 0, 3)])
+        compacted = graph.compact()
+        self.assertEqual(compacted.values, ['AACCGAACC'])
+        self.assertEqual(compacted.out_edges(0), [(0, 3)])
+
+
+class TestSuffixArray(unittest.TestCase):
+
+    def naive(self, text):
+        return sorted(range(len(text)), key=lambda i: text[i:])
+
+    def test_suffix_array(self):
+        for text in ['ADAM$', 'AAAAA', 'ABABABA$', 'mississippi', '$A$B$A$']:
+            self.assertEqual(suffix_array(text), self.naive(text))
+
+    def test_empty(self):
+        self.assertEqual(suffix_array(''), [])
+
+    def test_read_library(self):
+        text = '$ATTAGACCTG$CCTGCCGGAA$AGACCTGCCG$GCCGGAATAC$'
+        self.assertEqual(suffix_array(text), self.naive(text))
+
+    def test_list(self):
+        text = [3, 1, 2, 1, 2, 0]
+        self.assertEqual(suffix_array(text), self.naive(text))
+
+    def test_sampled(self):
+        reads = gettysburg.get_reads(50, 20, 40, seed=0)
+        for text in [
+                '$', 'ADAM$', '$A$B$A$', 'mississippi$',
+                ReadLibrary(reads).concat_reads,
+                ReadLibrary(rosalind.get_reads()[:5], dna=True).concat_reads]:
+            for rate in [1, 3, 8, 100]:
+                sampled = FMIndex(text, sa_sample_rate=rate).suffix_array
+                self.assertEqual(list(sampled), suffix_array(text))
+        sampled = FMIndex('ADAM$', sa_sample_rate=2).suffix_array
+        self.assertEqual(sampled[-1], 3)
+        self.assertRaises(IndexError, sampled.__getitem__, 5)
+        self.assertRaises(
+            ValueError, getattr, FMIndex('ADAM', sa_sample_rate=2),
+            'suffix_array')
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_seeded_reads(self):
+        self.assertEqual(
+            gettysburg.get_reads(20, 30, 40, seed=1),
+            gettysburg.get_reads(20, 30, 40, seed=1))
+        self.assertNotEqual(
+            gettysburg.get_reads(20, 30, 40, seed=1),
+            gettysburg.get_reads(20, 30, 40, seed=2))
+        reads = genome.get_reads(20, 30, 40, alphabet='AC', seed=1)
+        self.assertEqual(reads, genome.get_reads(20, 30, 40, 'AC', seed=1))
+        self.assertEqual(set(''.join(reads)), set('AC'))
+
+    def test_run_case(self):
+        case = benchmark.make_case(
+            example='gettysburg', reads=50, min_length=30, max_length=40)
+        result = benchmark.run_case(case)
+        self.assertEqual(result['reads'], 50)
+        self.assertEqual(sorted(result['phases']), sorted(benchmark.PHASES))
+        self.assertTrue(all([t >= 0 for t in result['phases'].values()]))
+        self.assertTrue(result['peak_rss_kb'] > 0)
+        # Reading the library and building the graph count towards the total
+        self.assertTrue(result['phases']['other'] > 0)
+        self.assertTrue(
+            result['total'] >= sum(result['phases'].values()))
+
+        case = benchmark.make_case(example='rosalind', solver='rosalind')
+        result = benchmark.run_case(case)
+        self.assertEqual(result['phases']['suffix_array'], None)
+        self.assertEqual(
+            result['contig_length'],
+            len(rosalind_solver.solve(rosalind.get_reads())))
+        self.assertRaises(ValueError, benchmark.make_case, example='moby')
+        self.assertRaises(
+            ValueError, benchmark.make_case, example='gettysburg',
+            alphabet='AC')
+
+
+class TestPurePython(unittest.TestCase):
+    """Check that the index is built the same way without NumPy."""
+
+    modules = [fm_index, locate, rank, run_length, suffix_array_module]
+
+    def build(self, text, numpy, sa_sample_rate=None, run_length=False):
+        saved = [module.np for module in self.modules]
+        if not numpy:
+            for module in self.modules:
+                module.np = None
+        try:
+            fm = FMIndex(
+                text, checkpoint_interval=3, sa_sample_rate=sa_sample_rate,
+                run_length=run_length)
+            fm.build()
+            return fm
+        finally:
+            for module, np in zip(self.modules, saved):
+                module.np = np
+
+    def test_build(self):
+        reads = gettysburg.get_reads(50, 20, 40, seed=0)
+        for text in [
+                ReadLibrary(reads).concat_reads,
+                ReadLibrary(rosalind.get_reads()[:5], dna=True).concat_reads,
+                'mississippi', 'AAAAA']:
+            fast, pure = self.build(text, True), self.build(text, False)
+            self.assertEqual(fast.suffix_array, pure.suffix_array)
+            self.assertEqual(str(fast.bwt), str(pure.bwt))
+            self.assertEqual(
+                type(fast.bwt) is PackedDNA, type(pure.bwt) is PackedDNA)
+            self.assertEqual(fast.lex_rank, pure.lex_rank)
+            self.assertEqual(
+                fast.occurrences.checkpoints, pure.occurrences.checkpoints)
+            self.assertEqual(
+                fast.occurrences.lt_checkpoints,
+                pure.occurrences.lt_checkpoints)
+
+    def test_sampled(self):
+        reads = gettysburg.get_reads(100, 20, 40, seed=0)
+        for text in [
+                ReadLibrary(reads).concat_reads, 'mississippi$', '$' * 64]:
+            for rate in [1, 5, 64]:
+                fast = self.build(text, True, rate).suffix_array
+                pure = self.build(text, False, rate).suffix_array
+                self.assertEqual(fast.sentinels, pure.sentinels)
+                self.assertEqual(fast.samples, pure.samples)
+                self.assertEqual(fast.marks, pure.marks)
+                self.assertEqual(fast.blocks, pure.blocks)
+
+    def test_run_length(self):
+        reads = gettysburg.get_reads(100, 20, 40, seed=0)
+        for text in [
+                ReadLibrary(reads).concat_reads, 'mississippi', 'AAAAA']:
+            fast = self.build(text, True, run_length=True)
+            pure = self.build(text, False, run_length=True)
+            self.assertEqual(fast.bwt.starts, pure.bwt.starts)
+            self.assertEqual(fast.bwt.heads, pure.bwt.heads)
+            self.assertEqual(
+                fast.occurrences.lengths, pure.occurrences.lengths)
+            self.assertEqual(
+                fast.occurrences.lt_lengths, pure.occurrences.lt_lengths)
+
+    def test_backward_search_many(self):
+        fm = self.build('AAGAGTAGAA$', False)
+        patterns = ['AGA', 'A', 'TT', 'AGAX', '']
+        saved, fm_index.np = fm_index.np, None
+        try:
+            intervals = fm.backward_search_many(patterns)
+        finally:
+            fm_index.np = saved
+        self.assertEqual(
+            intervals, [fm.backward_search(p) for p in patterns])
+        self.assertEqual(intervals[-1], (0, 10))
+
 
 if __name__ == '__main__':
     unittest.main()